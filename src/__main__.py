@@ -14,5 +14,6 @@ if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     # WebSocket対応のため、socketio.run()を使用
+    api.start_background_workers()
     api.socketio.run(api.app, host='0.0.0.0', port=port, debug=debug, use_reloader=False)
 
@@ -11,10 +11,12 @@ from flask_socketio import SocketIO, emit, join_room, leave_room, disconnect
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from functools import wraps
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 import csv
 import io
 import json
+import math
+import hashlib
 from .security import (
     sanitize_input, sanitize_dict, validate_sql_input,
     generate_csrf_token, validate_csrf_token, csrf_protect,
@@ -30,22 +32,34 @@ from .database import (
     CalendarEvent, Report, JapaneseProficiency, SkillTraining,
     SkillTrainingRecord, JapaneseLearningRecord, PreDepartureSupport,
     TrainingMenu, TrainingMenuAssignment, TrainingSession, KPIScore,
-    OperationLog, Milestone, CareerPath, ConstructionSimulatorTraining,
+    Milestone, CareerPath, ConstructionSimulatorTraining,
     ConstructionSimulatorSession, IntegratedGrowth, SpecificSkillTransition,
-    DigitalEvidence, CareerGoal
+    DigitalEvidence, CareerGoal, Applicant, JobPosting
 )
+from .matching import MatchingService, RematchQueue, MATCHING_SCORING
+from .skill_index import SCORING_MODES
+from .ingestion import (
+    INGESTION_KIND_UNITY, INGESTION_KIND_LEGACY, INGESTION_HANDLERS,
+    validate_unity_training_session, validate_training_session,
+    persist_unity_training_session, persist_training_session,
+    validate_chunked_session_open, validate_operation_log_chunk,
+    open_chunked_session, append_operation_log_chunk, finalize_chunked_session,
+    received_chunk_sequences, append_operation_log_batches, parse_timestamp, MSGPACK_AVAILABLE, MSGPACK_MIMETYPES, decode_msgpack_body,
+)
+from .operation_log_blocks import load_operation_logs, count_operation_logs, operation_log_keyframes, to_naive_utc
+from .ingestion_queue import IngestionQueue, IngestionWorkerPool, STATUS_QUEUED
+from .telemetry_buffer import TelemetryBuffer
+from .downsampling import downsample_records, DOWNSAMPLE_ALGORITHMS, MIN_POINTS
+from .replay_cache import ReplayCache
+from .replay_formats import negotiate_replay_mimetype, encode_replay, REPLAY_MIMETYPE_JSON
 from sqlalchemy.orm import joinedload
 from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
 import os
+import threading
 import logging
 from logging.handlers import RotatingFileHandler
 import base64
-try:
-    import msgpack
-    MSGPACK_AVAILABLE = True
-except ImportError:
-    MSGPACK_AVAILABLE = False
-    app.logger.warning('msgpack not available. Using JSON compression instead.')
 
 # ============================================================================
 # Flaskアプリケーション初期化
@@ -121,6 +135,89 @@ def after_request_handler(response):
 db = Database()
 db.init_database()
 
+# マッチングサービス（スキル転置インデックスはプロセス内で共有）
+matching_service = MatchingService(db)
+
+# 差分マッチング（応募者・求人のスキル変更を数秒以内にマッチング結果へ反映）
+# スレッドは start_background_workers() で開始する（インポート時には開始しない）
+MATCHING_INCREMENTAL = os.getenv('MATCHING_INCREMENTAL', 'true').lower() == 'true'
+rematch_queue = RematchQueue(matching_service)
+
+# 上位K件取得APIの取得件数の上限
+MATCHING_TOP_K_MAX = int(os.getenv('MATCHING_TOP_K_MAX', '100'))
+
+# 訓練セッションの非同期取り込み（受信データをスプールに登録して202を返し、バックグラウンドで保存）
+# trueの場合はすべてのリクエスト、falseの場合は Prefer: respond-async ヘッダー付きのリクエストのみ非同期
+INGESTION_ASYNC = os.getenv('INGESTION_ASYNC', 'false').lower() == 'true'
+# スプールファイルとワーカーは start_background_workers() で作成する（インポート時には作成しない）
+ingestion_queue = None
+ingestion_workers = None
+
+
+def write_telemetry_batches(session_id: str, meta: dict, batches: list):
+    """
+    ライブテレメトリのバッファを1トランザクションで保存
+    訓練セッションが存在しない場合は、バッチに含まれる開始時刻などから受信中のセッションを作成する
+    """
+    session_db = db.get_session()
+    try:
+        session_obj = session_db.query(TrainingSession).filter(TrainingSession.session_id == session_id).first()
+        if session_obj is None:
+            if not meta.get('session_start_time'):
+                raise LookupError(f'Training session {session_id} not found and session_start_time was not sent')
+            open_chunked_session(session_db, dict(meta, session_id=session_id))
+            session_obj = session_db.query(TrainingSession).filter(TrainingSession.session_id == session_id).one()
+        append_operation_log_batches(session_db, session_obj.id, batches, session_obj.session_start_time)
+        session_db.commit()
+    except Exception:
+        session_db.rollback()
+        raise
+    finally:
+        session_db.close()
+
+
+# ライブテレメトリ（Socket.IOのtelemetry_batch）のバッファ
+telemetry_buffer = TelemetryBuffer(write_telemetry_batches)
+
+_background_lock = threading.Lock()
+
+
+def start_background_workers():
+    """
+    バックグラウンド処理（取り込みキューのワーカー、ライブテレメトリの書き込み、差分マッチング）を開始
+    起動時と最初のリクエストの処理前に呼び出される（2回目以降は何もしない）
+    """
+    global ingestion_queue, ingestion_workers
+    if ingestion_queue is not None:
+        return
+    with _background_lock:
+        if ingestion_queue is not None:
+            return
+        queue = IngestionQueue()
+        ingestion_workers = IngestionWorkerPool(queue, db, INGESTION_HANDLERS)
+        ingestion_workers.start()
+        telemetry_buffer.start()
+        if MATCHING_INCREMENTAL:
+            rematch_queue.start()
+        ingestion_queue = queue
+
+
+@app.before_request
+def ensure_background_workers():
+    """WSGIサーバー経由で起動した場合も最初のリクエストでバックグラウンド処理を開始"""
+    start_background_workers()
+
+
+# リプレイAPIの時間範囲指定時の1ページあたりの操作ログ件数（既定値・上限）
+REPLAY_PAGE_SIZE = int(os.getenv('REPLAY_PAGE_SIZE', '5000'))
+REPLAY_PAGE_SIZE_MAX = int(os.getenv('REPLAY_PAGE_SIZE_MAX', '20000'))
+
+# リプレイのシーク用キーフレームの間隔（秒）
+REPLAY_KEYFRAME_SECONDS = float(os.getenv('REPLAY_KEYFRAME_SECONDS', '10'))
+
+# リプレイAPIのレスポンスのキャッシュ（訓練セッションの内容のバージョンごと）
+replay_cache = ReplayCache()
+
 
 # 認証デコレータ（一時的に無効化）
 def require_auth(f):
@@ -881,11 +978,178 @@ class CalendarEventListResource(Resource):
         }
 
 
+def get_ingestion_payload():
+    """
+    取り込みAPIのリクエストボディを取得
+    Content-TypeがMessagePack（application/msgpack）の場合はバイナリのままデコードし、それ以外はJSONとして解析する
+    
+    Returns:
+        (データ, エラーレスポンス) のタプル（エラーがない場合はエラーレスポンスがNone）
+    """
+    if request.mimetype not in MSGPACK_MIMETYPES:
+        return request.get_json(silent=True), None
+    if not MSGPACK_AVAILABLE:
+        return None, ({'success': False, 'error': 'MessagePack is not supported on this server'}, 415)
+    try:
+        return decode_msgpack_body(request.get_data(cache=False)), None
+    except Exception as e:
+        return None, ({'success': False, 'error': f'Invalid MessagePack body: {e}'}, 400)
+
+
+def use_async_ingestion() -> bool:
+    """リクエストを非同期取り込みにするか判定（INGESTION_ASYNC、または Prefer: respond-async ヘッダー）"""
+    return INGESTION_ASYNC or 'respond-async' in request.headers.get('Prefer', '').lower()
+
+
+def enqueue_ingestion(kind: str, data: dict):
+    """
+    検証済みのデータを取り込みキューに登録
+    
+    Returns:
+        202レスポンス（チケットIDと状態確認用URLを含む）
+    """
+    ticket = ingestion_queue.enqueue(kind, data)
+    return {
+        'success': True,
+        'data': {
+            'ticket': ticket,
+            'status': STATUS_QUEUED,
+            'status_url': f'/api/ingestion/{ticket}',
+        }
+    }, 202
+
+
+def parse_top_k():
+    """
+    クエリパラメータkを取得（上位K件取得API用）
+    
+    Returns:
+        取得件数。不正な値の場合はNone
+    """
+    try:
+        k = int(request.args.get('k', 10))
+    except (TypeError, ValueError):
+        return None
+    if k < 1 or k > MATCHING_TOP_K_MAX:
+        return None
+    return k
+
+
+def parse_scoring():
+    """
+    クエリパラメータscoringを取得（上位K件取得API用）
+    
+    Returns:
+        スコア計算方式（overlap/idf）。不正な値の場合はNone
+    """
+    scoring = request.args.get('scoring', MATCHING_SCORING)
+    return scoring if scoring in SCORING_MODES else None
+
+
+class JobCandidateListResource(Resource):
+    """
+    求人に対する応募者候補API
+    スコア上位K件の応募者候補のみを返す
+    """
+    
+    def get(self, job_id):
+        """
+        GET /api/job-postings/<job_id>/candidates?k=10&scoring=idf
+        求人に対するスコア上位K件の応募者候補を取得
+        """
+        k = parse_top_k()
+        if k is None:
+            return {'success': False, 'error': f'k must be an integer between 1 and {MATCHING_TOP_K_MAX}'}, 400
+        scoring = parse_scoring()
+        if scoring is None:
+            return {'success': False, 'error': f"scoring must be one of: {', '.join(SCORING_MODES)}"}, 400
+        
+        session = db.get_session()
+        try:
+            job = session.query(JobPosting).filter(JobPosting.id == job_id).first()
+            if not job:
+                return {'success': False, 'error': 'Job posting not found'}, 404
+            
+            matches = matching_service.top_k(job_id, k, session=session, scoring=scoring)
+            applicants = {a.id: a for a in session.query(Applicant).filter(
+                Applicant.id.in_([m['applicant_id'] for m in matches])
+            )} if matches else {}
+            
+            data = []
+            for m in matches:
+                applicant = applicants.get(m['applicant_id'])
+                data.append({
+                    'applicant_id': m['applicant_id'],
+                    'name': applicant.name if applicant else None,
+                    'skills': applicant.skills if applicant else None,
+                    'experience_years': applicant.experience_years if applicant else None,
+                    'score': m['score'],
+                    'matched_skills': m['matched_skills'],
+                })
+            
+            return {'success': True, 'data': data}, 200
+        except Exception as e:
+            return {'success': False, 'error': str(e)}, 500
+        finally:
+            session.close()
+
+
+class ApplicantJobMatchListResource(Resource):
+    """
+    応募者に対する求人候補API
+    スコア上位K件の求人候補のみを返す
+    """
+    
+    def get(self, applicant_id):
+        """
+        GET /api/applicants/<applicant_id>/job-matches?k=10&scoring=idf
+        応募者に対するスコア上位K件の求人候補を取得
+        """
+        k = parse_top_k()
+        if k is None:
+            return {'success': False, 'error': f'k must be an integer between 1 and {MATCHING_TOP_K_MAX}'}, 400
+        scoring = parse_scoring()
+        if scoring is None:
+            return {'success': False, 'error': f"scoring must be one of: {', '.join(SCORING_MODES)}"}, 400
+        
+        session = db.get_session()
+        try:
+            applicant = session.query(Applicant).filter(Applicant.id == applicant_id).first()
+            if not applicant:
+                return {'success': False, 'error': 'Applicant not found'}, 404
+            
+            matches = matching_service.top_k_jobs(applicant_id, k, session=session, scoring=scoring)
+            jobs = {j.id: j for j in session.query(JobPosting).filter(
+                JobPosting.id.in_([m['job_posting_id'] for m in matches])
+            )} if matches else {}
+            
+            data = []
+            for m in matches:
+                job = jobs.get(m['job_posting_id'])
+                data.append({
+                    'job_posting_id': m['job_posting_id'],
+                    'title': job.title if job else None,
+                    'company_name': job.company_name if job else None,
+                    'location': job.location if job else None,
+                    'required_skills': job.required_skills if job else None,
+                    'score': m['score'],
+                    'matched_skills': m['matched_skills'],
+                })
+            
+            return {'success': True, 'data': data}, 200
+        except Exception as e:
+            return {'success': False, 'error': str(e)}, 500
+        finally:
+            session.close()
+
+
 # APIルートの登録
 api.add_resource(WorkerListResource, '/api/workers')
 api.add_resource(WorkerResource, '/api/workers/<int:worker_id>')
 api.add_resource(WorkerProgressListResource, '/api/workers/<int:worker_id>/progress')
 api.add_resource(WorkerProgressResource, '/api/workers/<int:worker_id>/progress/<int:progress_id>')
+api.add_resource(JobCandidateListResource, '/api/job-postings/<int:job_id>/candidates')
+api.add_resource(ApplicantJobMatchListResource, '/api/applicants/<int:applicant_id>/job-matches')
 
 # 日本語能力管理API
 class JapaneseProficiencyListResource(Resource):
@@ -1771,61 +2035,22 @@ class TrainingMenuAssignmentListResource(Resource):
 # Unity連携：訓練セッション受信API
 class TrainingSessionResource(Resource):
     def post(self):
-        """Unityから訓練結果を受信"""
+        """
+        Unityから訓練結果を受信
+        非同期取り込みの場合は検証後にキューへ登録し、202とチケットIDを返す
+        """
+        data = request.get_json(silent=True)
+        error = validate_training_session(data)
+        if error:
+            return {'success': False, 'error': error}, 400
+        if use_async_ingestion():
+            return enqueue_ingestion(INGESTION_KIND_LEGACY, data)
+        
         session = db.get_session()
         try:
-            data = request.get_json()
-            
-            # 訓練セッション作成
-            training_session = TrainingSession(
-                session_id=data.get('sessionId'),
-                worker_id=data.get('traineeId'),
-                training_menu_id=data.get('training_menu_id'),
-                session_start_time=datetime.fromisoformat(data['session_start_time'].replace('Z', '+00:00')) if data.get('session_start_time') else datetime.now(),
-                session_end_time=datetime.fromisoformat(data['session_end_time'].replace('Z', '+00:00')) if data.get('session_end_time') else datetime.now(),
-                duration_seconds=data.get('duration_seconds'),
-                status=data.get('status', '完了'),
-            )
-            session.add(training_session)
-            session.flush()
-            
-            # KPIスコア保存
-            kpi_data = data.get('kpi', {})
-            if kpi_data:
-                kpi_score = KPIScore(
-                    training_session_id=training_session.id,
-                    safety_score=kpi_data.get('safetyScore'),
-                    error_count=kpi_data.get('errorCount', 0),
-                    procedure_compliance_rate=kpi_data.get('procedureComplianceRate'),
-                    work_time_seconds=kpi_data.get('workTimeSeconds'),
-                    achievement_rate=kpi_data.get('achievementRate'),
-                    accuracy_score=kpi_data.get('accuracyScore'),
-                    efficiency_score=kpi_data.get('efficiencyScore'),
-                    overall_score=kpi_data.get('overallScore'),
-                    notes=kpi_data.get('notes'),
-                )
-                session.add(kpi_score)
-            
-            # 操作ログ保存
-            operation_logs = data.get('operationLogs', [])
-            for log_data in operation_logs:
-                operation_log = OperationLog(
-                    training_session_id=training_session.id,
-                    timestamp=datetime.fromisoformat(log_data['timestamp'].replace('Z', '+00:00')) if log_data.get('timestamp') else datetime.now(),
-                    operation_type=log_data.get('operationType'),
-                    operation_value=log_data.get('operationValue'),
-                    equipment_state=log_data.get('equipmentState'),
-                    position_x=log_data.get('positionX'),
-                    position_y=log_data.get('positionY'),
-                    position_z=log_data.get('positionZ'),
-                    velocity=log_data.get('velocity'),
-                    error_event=log_data.get('errorEvent', False),
-                    error_description=log_data.get('errorDescription'),
-                )
-                session.add(operation_log)
-            
+            result = persist_training_session(session, data)
             session.commit()
-            return {'success': True, 'message': 'Training session saved', 'session_id': training_session.id}, 201
+            return {'success': True, 'message': 'Training session saved', 'session_id': result['session_id']}, 201
         except Exception as e:
             session.rollback()
             return {'success': False, 'error': str(e)}, 500
@@ -1844,8 +2069,6 @@ class TrainingSessionResource(Resource):
                 return {'success': False, 'error': 'Session not found'}, 404
             
             kpi = training_session.kpi_scores[0] if training_session.kpi_scores else None
-            operation_logs = training_session.operation_logs[:100]  # 最新100件
-            
             return {
                 'success': True,
                 'data': {
@@ -1864,7 +2087,7 @@ class TrainingSessionResource(Resource):
                         'achievement_rate': kpi.achievement_rate if kpi else None,
                         'overall_score': kpi.overall_score if kpi else None,
                     } if kpi else None,
-                    'operation_logs_count': len(training_session.operation_logs),
+                    'operation_logs_count': count_operation_logs(session, training_session.id),
                     'created_at': serialize_date(training_session.created_at),
                 }
             }, 200
@@ -3598,140 +3821,218 @@ class UnityTrainingSessionResource(Resource):
         POST /api/unity/training-session
         Unityから訓練結果を受信
         操作ログ、AI評価、リプレイデータ、KPIスコアを保存
+        Content-Type: application/msgpack の場合はMessagePack形式のボディを受け付ける（重機状態はマップのまま送信可能）
+        非同期取り込みの場合は検証後にキューへ登録し、202とチケットIDを返す
         """
+        data, error_response = get_ingestion_payload()
+        if error_response:
+            return error_response
+        error = validate_unity_training_session(data)
+        if error:
+            return {'success': False, 'error': error}, 400
+        if use_async_ingestion():
+            # 非同期取り込みの場合は、ライブテレメトリで受信済みの操作ログを登録前に保存
+            error_response = flush_telemetry(data['session_id'])
+            if error_response:
+                return error_response
+            return enqueue_ingestion(INGESTION_KIND_UNITY, data)
+        
         session_db = db.get_session()
         try:
-            data = request.get_json()
-            
-            # セッションIDが存在するか確認
-            existing_session = session_db.query(TrainingSession).filter(
-                TrainingSession.session_id == data.get('session_id')
-            ).first()
-            
-            # worker_idのバリデーション（0の場合はNULLに設定）
-            worker_id = data.get('worker_id')
-            if worker_id == 0 or worker_id is None:
-                # worker_idが0またはNoneの場合は、NULLに設定（外部キー制約違反を回避）
-                worker_id = None
-                app.logger.warning(f'UnityTrainingSession: worker_id=0 or None, setting to NULL for session_id={data.get("session_id")}')
-            
-            if existing_session:
-                # 既存セッションの更新
-                session_obj = existing_session
-                # worker_idが0の場合は更新しない
-                if worker_id is not None:
-                    session_obj.worker_id = worker_id
-            else:
-                # 新規セッションの作成
-                session_obj = TrainingSession(
-                    session_id=data.get('session_id'),
-                    worker_id=worker_id,  # NULLまたは有効なworker_id
-                    training_menu_id=data.get('training_menu_id'),
-                    session_start_time=datetime.fromisoformat(data['session_start_time'].replace('Z', '+00:00')),
-                    session_end_time=datetime.fromisoformat(data['session_end_time'].replace('Z', '+00:00')),
-                    duration_seconds=data.get('duration_seconds'),
-                    status=data.get('status', '完了'),
-                )
-                session_db.add(session_obj)
-                session_db.flush()  # IDを取得するためにflush
-            
-            # 操作ログ、AI評価、リプレイデータを保存
-            if 'operation_logs' in data:
-                # session_obj.operation_logs_json = json.dumps(data['operation_logs'])  # 一時的にコメントアウト（データベースマイグレーション後に有効化）
-                pass  # 一時的に何もしない
-            
-            if 'ai_evaluation' in data:
-                session_obj.ai_evaluation_json = json.dumps(data['ai_evaluation'])
-            
-            if 'replay_data' in data:
-                session_obj.replay_data_json = json.dumps(data['replay_data'])
-            
-            # KPIスコアを保存
-            if 'kpi_scores' in data:
-                kpi_data = data['kpi_scores']
-                existing_kpi = session_db.query(KPIScore).filter(
-                    KPIScore.training_session_id == session_obj.id
-                ).first()
-                
-                if existing_kpi:
-                    # 既存KPIの更新
-                    kpi = existing_kpi
-                else:
-                    # 新規KPIの作成
-                    kpi = KPIScore(training_session_id=session_obj.id)
-                    session_db.add(kpi)
-                
-                kpi.safety_score = kpi_data.get('safety_score')
-                kpi.error_count = kpi_data.get('error_count', 0)
-                kpi.procedure_compliance_rate = kpi_data.get('procedure_compliance_rate')
-                kpi.work_time_seconds = kpi_data.get('work_time_seconds')
-                kpi.achievement_rate = kpi_data.get('achievement_rate')
-                kpi.accuracy_score = kpi_data.get('accuracy_score')
-                kpi.efficiency_score = kpi_data.get('efficiency_score')
-                kpi.overall_score = kpi_data.get('overall_score')
-                kpi.notes = kpi_data.get('notes')
-            
-            # 操作ログを個別に保存（タイムライン用）
-            if 'operation_logs' in data and isinstance(data['operation_logs'], list):
-                # 既存のログを削除
-                session_db.query(OperationLog).filter(
-                    OperationLog.training_session_id == session_obj.id
-                ).delete()
-                
-                # 新しいログを追加
-                for log_data in data['operation_logs']:
-                    # MessagePack圧縮されたデータをデコード（もしあれば）
-                    equipment_state = log_data.get('equipment_state')
-                    if isinstance(equipment_state, str) and equipment_state.startswith('msgpack:'):
-                        # MessagePack圧縮データをデコード
-                        try:
-                            compressed_data = base64.b64decode(equipment_state[8:])  # 'msgpack:'プレフィックスを除去
-                            if MSGPACK_AVAILABLE:
-                                equipment_state = msgpack.unpackb(compressed_data, raw=False)
-                            else:
-                                equipment_state = json.loads(equipment_state[8:])
-                        except Exception as e:
-                            app.logger.error(f'Failed to decode MessagePack data: {e}')
-                            equipment_state = None
-                    elif isinstance(equipment_state, dict):
-                        equipment_state = equipment_state
-                    else:
-                        equipment_state = None
-                    
-                    # イベントタイプを判定
-                    event_type = 'operation'
-                    if log_data.get('error_event', False):
-                        event_type = 'error'
-                    elif log_data.get('achievement_event', False):
-                        event_type = 'achievement'
-                    
-                    log = OperationLog(
-                        training_session_id=session_obj.id,
-                        timestamp=datetime.fromisoformat(log_data['timestamp'].replace('Z', '+00:00')),
-                        operation_type=log_data.get('operation_type'),
-                        operation_value=log_data.get('operation_value'),
-                        equipment_state=json.dumps(equipment_state) if equipment_state else None,
-                        position_x=log_data.get('position_x'),
-                        position_y=log_data.get('position_y'),
-                        position_z=log_data.get('position_z'),
-                        velocity=log_data.get('velocity'),
-                        error_event=log_data.get('error_event', False),
-                        error_description=log_data.get('error_description'),
-                        achievement_event=log_data.get('achievement_event', False),
-                        achievement_description=log_data.get('achievement_description'),
-                        event_type=event_type,
-                    )
-                    session_db.add(log)
-            
+            result = persist_unity_training_session(session_db, data)
             session_db.commit()
-            
+        except ValueError as e:
+            session_db.rollback()
+            return {'success': False, 'error': str(e)}, 400
+        except Exception as e:
+            session_db.rollback()
+            return {'success': False, 'error': str(e)}, 500
+        finally:
+            session_db.close()
+        
+        # 訓練セッションを保存した後で、ライブテレメトリで受信済みの操作ログを保存
+        error_response = flush_telemetry(data['session_id'])
+        replay_cache.invalidate(result['session_id'])
+        if error_response:
+            return error_response
+        return {
+            'success': True,
+            'data': result
+        }, 201
+
+
+def flush_telemetry(session_id: str):
+    """
+    ライブテレメトリで受信済みの操作ログを保存（バックグラウンドで書き込み中のバッチがある場合はその完了を待つ）
+
+    Returns:
+        エラーレスポンス（問題がない場合はNone）
+        書き込みに失敗した場合は500、破棄したバッチがある場合は409（dropped_sequences の連番を再送する）
+    """
+    try:
+        telemetry_buffer.flush(session_id)
+    except Exception as e:
+        return {'success': False, 'error': f'Failed to write buffered telemetry: {e}'}, 500
+    dropped = telemetry_buffer.pop_dropped(session_id)
+    if dropped:
+        return {
+            'success': False,
+            'error': 'Buffered telemetry was dropped after repeated write failures',
+            'dropped_sequences': dropped,
+        }, 409
+    return None
+
+
+def find_training_session(session_db, session_id: str):
+    """Unityから送信されるセッションIDで訓練セッションを取得（存在しない場合はNone）"""
+    return session_db.query(TrainingSession).filter(TrainingSession.session_id == session_id).first()
+
+
+class UnityChunkedSessionResource(Resource):
+    """
+    分割アップロード開始API
+    長時間の訓練セッションの操作ログをチャンクに分けて送信する場合に使用
+    開始 → チャンク送信（連番付き、再送可） → 完了 の順に呼び出す
+    """
+    
+    def post(self):
+        """
+        POST /api/unity/training-session/chunked
+        訓練セッションを受信中の状態で作成（同じsession_idの場合は再開し、受信済みの連番を返す）
+        """
+        data, error_response = get_ingestion_payload()
+        if error_response:
+            return error_response
+        error = validate_chunked_session_open(data)
+        if error:
+            return {'success': False, 'error': error}, 400
+        
+        session_db = db.get_session()
+        try:
+            result = open_chunked_session(session_db, data)
+            session_db.commit()
+            return {'success': True, 'data': result}, 201
+        except IntegrityError:
+            # 同じsession_idの開始リクエストが同時に送信された場合
+            session_db.rollback()
+            return {'success': True, 'data': open_chunked_session(session_db, data)}, 201
+        except Exception as e:
+            session_db.rollback()
+            return {'success': False, 'error': str(e)}, 500
+        finally:
+            session_db.close()
+
+
+class UnityChunkListResource(Resource):
+    """分割アップロードの受信状況API"""
+    
+    def get(self, session_id):
+        """
+        GET /api/unity/training-session/<session_id>/chunks
+        受信済みのチャンクの連番を取得（通信断からの再開時に未送信のチャンクを判定するために使用）
+        """
+        session_db = db.get_session()
+        try:
+            session_obj = find_training_session(session_db, session_id)
+            if not session_obj:
+                return {'success': False, 'error': 'Training session not found'}, 404
             return {
                 'success': True,
                 'data': {
                     'session_id': session_obj.session_id,
-                    'id': session_obj.id,
+                    'status': session_obj.status,
+                    'received_chunks': received_chunk_sequences(session_db, session_obj.id),
                 }
-            }, 201
+            }, 200
+        finally:
+            session_db.close()
+
+
+class UnityChunkResource(Resource):
+    """分割アップロードのチャンク送信API"""
+    
+    def put(self, session_id, sequence):
+        """
+        PUT /api/unity/training-session/<session_id>/chunks/<sequence>
+        操作ログのチャンクを保存
+        受信済みの連番は保存せずに200を返すため、通信断の後に同じチャンクを再送しても操作ログは重複しない
+        """
+        data, error_response = get_ingestion_payload()
+        if error_response:
+            return error_response
+        error = validate_operation_log_chunk(data)
+        if error:
+            return {'success': False, 'error': error}, 400
+        logs = data.get('operation_logs') if isinstance(data, dict) else data
+        
+        session_db = db.get_session()
+        try:
+            session_obj = find_training_session(session_db, session_id)
+            if not session_obj:
+                return {'success': False, 'error': 'Training session not found'}, 404
+            training_session_id = session_obj.id
+            session_start = session_obj.session_start_time
+            try:
+                result = append_operation_log_chunk(session_db, training_session_id, sequence, logs, session_start)
+                session_db.commit()
+            except IntegrityError:
+                # 同じ連番のチャンクが同時に送信された場合は、先に保存された方を採用
+                session_db.rollback()
+                result = append_operation_log_chunk(session_db, training_session_id, sequence, logs, session_start)
+            return {'success': True, 'data': result}, 200 if result['duplicate'] else 201
+        except ValueError as e:
+            session_db.rollback()
+            return {'success': False, 'error': str(e)}, 400
+        except Exception as e:
+            session_db.rollback()
+            return {'success': False, 'error': str(e)}, 500
+        finally:
+            session_db.close()
+
+
+class UnityChunkedSessionFinalizeResource(Resource):
+    """分割アップロード完了API"""
+    
+    def post(self, session_id):
+        """
+        POST /api/unity/training-session/<session_id>/finalize
+        終了時刻、AI評価、リプレイデータ、KPIスコアを保存して訓練セッションを完了にする
+        total_chunksを指定した場合、0〜total_chunks-1 の連番が揃っていなければ409と未受信の連番を返す
+        """
+        data, error_response = get_ingestion_payload()
+        if error_response:
+            return error_response
+        data = data or {}
+        if not isinstance(data, dict):
+            return {'success': False, 'error': 'Request body must be a JSON object'}, 400
+        total_chunks = data.get('total_chunks')
+        if total_chunks is not None and (not isinstance(total_chunks, int) or total_chunks < 0):
+            return {'success': False, 'error': 'total_chunks must be a non-negative integer'}, 400
+        
+        session_db = db.get_session()
+        try:
+            # ライブテレメトリで受信済みの操作ログを先に保存
+            error_response = flush_telemetry(session_id)
+            if error_response:
+                return error_response
+            session_obj = find_training_session(session_db, session_id)
+            if not session_obj:
+                return {'success': False, 'error': 'Training session not found'}, 404
+            if total_chunks is not None:
+                missing = sorted(set(range(total_chunks)) - set(received_chunk_sequences(session_db, session_obj.id)))
+                if missing:
+                    return {
+                        'success': False,
+                        'error': 'Missing chunks',
+                        'data': {'missing_chunks': missing}
+                    }, 409
+            result = finalize_chunked_session(session_db, session_obj, data)
+            session_db.commit()
+            replay_cache.invalidate(result['session_id'])
+            return {'success': True, 'data': result}, 200
+        except ValueError as e:
+            session_db.rollback()
+            return {'success': False, 'error': str(e)}, 400
         except Exception as e:
             session_db.rollback()
             return {'success': False, 'error': str(e)}, 500
@@ -3739,10 +4040,145 @@ class UnityTrainingSessionResource(Resource):
             session_db.close()
 
 
+class IngestionStatusResource(Resource):
+    """
+    取り込み状況API
+    非同期取り込みのチケットの処理状況を返す
+    """
+    
+    def get(self, ticket):
+        """
+        GET /api/ingestion/<ticket>
+        チケットの処理状況（queued, processing, completed, failed）を取得
+        """
+        status = ingestion_queue.status(ticket)
+        if status is None:
+            return {'success': False, 'error': 'Ticket not found'}, 404
+        return {'success': True, 'data': status}, 200
+
+
 # ============================================================================
 # リプレイ機能API
 # ============================================================================
 
+def build_replay_entries(records: list, with_timeline: bool) -> tuple:
+    """
+    操作ログのレコードからリプレイの操作ログとKPIタイムラインを1回の走査で構築
+    
+    Args:
+        records: OPERATION_LOG_RECORD_FIELDS の順の列を持つレコード（load_operation_logs() の結果）
+        with_timeline: KPIタイムラインも構築するか
+    
+    Returns:
+        (操作ログのリスト, KPIタイムラインのリスト（構築しない場合はNone）) のタプル
+    """
+    entries = []
+    timeline = [] if with_timeline else None
+    for (timestamp, operation_type, operation_value, equipment_state, position_x, position_y, position_z,
+         velocity, error_event, error_description, achievement_event, achievement_description,
+         event_type, _sequence) in records:
+        timestamp = timestamp.isoformat()
+        entry = {
+            'timestamp': timestamp,
+            'operation_type': operation_type,
+            'operation_value': operation_value,
+            'error_event': error_event,
+            'error_description': error_description,
+            'achievement_event': achievement_event,
+            'achievement_description': achievement_description,
+            'event_type': event_type,
+        }
+        
+        # 状態ログ（重機姿勢、位置、速度）
+        if position_x is not None or position_y is not None or position_z is not None or velocity is not None:
+            entry['state_log'] = {
+                'position': {'x': position_x, 'y': position_y, 'z': position_z},
+                'velocity': velocity,
+            }
+        
+        # 重機状態（equipment_state）
+        if equipment_state:
+            try:
+                entry['equipment_state'] = json.loads(equipment_state)
+            except ValueError:
+                entry['equipment_state'] = equipment_state
+        entries.append(entry)
+        
+        if with_timeline:
+            timeline_entry = {
+                'timestamp': timestamp,
+                'error_event': error_event,
+                'error_description': error_description,
+            }
+            # 目標達成イベントを追加
+            if achievement_event:
+                timeline_entry['achievement_event'] = True
+                timeline_entry['achievement_description'] = achievement_description
+            timeline.append(timeline_entry)
+    return entries, timeline
+
+
+def replay_response(body: bytes, etag: str, cache_status: str, mimetype: str = REPLAY_MIMETYPE_JSON,
+                    status: int = 200) -> Response:
+    """シリアライズ済みのリプレイのレスポンス（ETag付き、再利用時は必ず再検証させる）"""
+    response = Response(body, status=status, mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['Vary'] = 'Accept'
+    response.headers['X-Replay-Cache'] = cache_status
+    return response
+
+
+def encode_replay_cursor(timestamp: datetime, skip: int) -> str:
+    """リプレイの続きを取得するためのカーソル（最後のタイムスタンプと、その時刻の取得済み件数）"""
+    raw = json.dumps([timestamp.isoformat(), skip]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_replay_cursor(cursor: str) -> tuple:
+    """
+    カーソルを (タイムスタンプ, 取得済み件数) に変換
+    
+    Raises:
+        ValueError: カーソルが不正な場合
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, skip = json.loads(raw.decode('utf-8'))
+        timestamp = datetime.fromisoformat(timestamp)
+    except Exception:
+        raise ValueError('cursor is invalid')
+    if not isinstance(skip, int) or skip < 0:
+        raise ValueError('cursor is invalid')
+    return timestamp, skip
+
+
+def parse_replay_time(name: str, origin: datetime):
+    """
+    リプレイの時間範囲のパラメータを取得
+    ISO 8601形式の時刻、または訓練開始からの秒数を受け付ける
+    
+    Returns:
+        タイムゾーンなしのUTC（指定がない場合はNone）
+    
+    Raises:
+        ValueError: 形式が不正な場合
+    """
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        seconds = None
+    if seconds is not None and math.isfinite(seconds):
+        return origin + timedelta(seconds=seconds)
+    try:
+        return to_naive_utc(parse_timestamp(value))
+    except ValueError:
+        raise ValueError(f'{name} must be an ISO 8601 timestamp or seconds from the session start')
+
+
 class ReplaySessionResource(Resource):
     """
     リプレイセッションAPI
@@ -3759,11 +4195,56 @@ class ReplaySessionResource(Resource):
         Args:
             session_id: 訓練セッションID
         
+        Query Parameters:
+            from: 取得する範囲の開始（ISO 8601形式の時刻、または訓練開始からの秒数。この時刻を含む）
+            to: 取得する範囲の終了（同上。この時刻を含まない）
+            cursor: 前のページの next_cursor（続きを取得する場合、from より優先）
+            limit: 1ページあたりの操作ログ件数（デフォルト: REPLAY_PAGE_SIZE）
+            keyframes: true の場合、シーク用のキーフレームの一覧を含める
+            keyframe_interval: キーフレームの間隔（秒、デフォルト: REPLAY_KEYFRAME_SECONDS）
+            max_points: 概要チャート用に操作ログ（と KPIタイムライン）をこの件数以下に間引く（イベントの行は別に残す）
+                        （位置・速度・操作値の系列の形状を保ち、エラー・目標達成イベントは必ず残す）
+            downsample: 間引きのアルゴリズム（lttb / minmax、デフォルト: lttb）
+        
+        いずれの範囲・ページのパラメータも指定しない場合は全件を返す
+        範囲・ページを指定した場合は window（next_cursor, has_more）を含み、
+        cursor 指定時（2ページ目以降）はAI評価・リプレイデータ・KPIスコアを省略する
+        レスポンスは訓練セッションの内容のバージョンごとにキャッシュし、ETag（If-None-Match で304）を返す
+        
+        Accept ヘッダーで application/msgpack または application/vnd.apache.arrow.stream（pyarrowがある場合）を
+        指定すると、操作ログを列ごとの配列（replay_formats モジュールを参照）で返す（KPIタイムラインは省略）
+        
         Returns:
             リプレイデータ（操作ログ、AI評価、KPIスコア、KPIタイムライン）
         """
+        windowed = any(request.args.get(name) for name in ('from', 'to', 'cursor', 'limit'))
+        cursor = request.args.get('cursor')
+        try:
+            limit = int(request.args.get('limit', REPLAY_PAGE_SIZE))
+            keyframe_interval = float(request.args.get('keyframe_interval', REPLAY_KEYFRAME_SECONDS))
+        except ValueError:
+            return {'success': False, 'error': 'limit and keyframe_interval must be numbers'}, 400
+        if limit < 1 or not math.isfinite(keyframe_interval) or keyframe_interval <= 0:
+            return {'success': False, 'error': 'limit and keyframe_interval must be positive'}, 400
+        limit = min(limit, REPLAY_PAGE_SIZE_MAX)
+        max_points = request.args.get('max_points')
+        algorithm = request.args.get('downsample', 'lttb')
+        if max_points is not None:
+            try:
+                max_points = int(max_points)
+            except ValueError:
+                return {'success': False, 'error': 'max_points must be an integer'}, 400
+            if max_points < MIN_POINTS:
+                return {'success': False, 'error': f'max_points must be at least {MIN_POINTS}'}, 400
+        if algorithm not in DOWNSAMPLE_ALGORITHMS:
+            return {'success': False, 'error': f'downsample must be one of: {", ".join(DOWNSAMPLE_ALGORITHMS)}'}, 400
+        mimetype = negotiate_replay_mimetype(request.accept_mimetypes)
+        if mimetype is None:
+            return {'success': False, 'error': 'Requested representation is not available'}, 406
+        
         session_db = db.get_session()
         try:
+            # AI評価・リプレイデータはキャッシュにない場合のみ読み出す（2ページ目以降は読み出さない）
             training_session = session_db.query(TrainingSession).filter(
                 TrainingSession.session_id == session_id
             ).first()
@@ -3778,94 +4259,119 @@ class ReplaySessionResource(Resource):
                 if user and user.role == 'trainee' and training_session.worker_id is not None and training_session.worker_id != user.worker_id:
                     return {'success': False, 'error': 'Access denied'}, 403
             
-            # 操作ログを取得（OperationLogテーブルから）
-            operation_logs_list = []
-            operation_logs = session_db.query(OperationLog).filter(
-                OperationLog.training_session_id == training_session.id
-            ).order_by(OperationLog.timestamp).all()
-            
-            for log in operation_logs:
-                log_entry = {
-                    'timestamp': serialize_date(log.timestamp),
-                    'operation_type': log.operation_type,
-                    'operation_value': log.operation_value,
-                    'error_event': log.error_event,
-                    'error_description': log.error_description,
-                    'achievement_event': log.achievement_event if hasattr(log, 'achievement_event') else False,
-                    'achievement_description': log.achievement_description if hasattr(log, 'achievement_description') else None,
-                    'event_type': log.event_type if hasattr(log, 'event_type') else 'operation',
-                }
-                
-                # 状態ログ（重機姿勢、位置、速度）
-                if log.position_x is not None or log.position_y is not None or log.position_z is not None or log.velocity is not None:
-                    log_entry['state_log'] = {
-                        'position': {
-                            'x': log.position_x,
-                            'y': log.position_y,
-                            'z': log.position_z,
-                        },
-                        'velocity': log.velocity,
-                    }
-                
-                # 重機状態（equipment_state）
-                if log.equipment_state:
-                    try:
-                        log_entry['equipment_state'] = json.loads(log.equipment_state)
-                    except:
-                        log_entry['equipment_state'] = log.equipment_state
-                
-                operation_logs_list.append(log_entry)
+            # キャッシュのキー・ETag（訓練セッションの内容のバージョン、クエリパラメータ、レスポンスの形式）
+            representation = hashlib.sha1(
+                json.dumps([mimetype, sorted(request.args.items(multi=True))]).encode('utf-8')
+            ).hexdigest()[:16]
+            version = training_session.content_version or 0
+            cache_key = (training_session.session_id, training_session.id, version, representation)
+            etag = f'{training_session.id}-{version}-{representation}'
+            if request.if_none_match.contains(etag):
+                return replay_response(b'', etag, 'not-modified', mimetype, 304)
+            cached = replay_cache.get(cache_key)
+            if cached is not None:
+                return replay_response(cached[0], etag, cached[1], mimetype)
+            
+            # 時間範囲・カーソルを解釈（時刻はタイムゾーンなしのUTCで比較）
+            origin = to_naive_utc(training_session.session_start_time)
+            try:
+                start = parse_replay_time('from', origin)
+                end = parse_replay_time('to', origin)
+                skip = 0
+                if cursor:
+                    start, skip = decode_replay_cursor(cursor)
+            except ValueError as e:
+                return {'success': False, 'error': str(e)}, 400
+            
+            # 操作ログを取得（行形式・列指向ブロックのどちらに保存されていても同じ形式で取得）
+            # 範囲指定時は範囲内のみをインデックスで読み出し、次のページの有無の確認用に1件多く取得する
+            if windowed:
+                operation_logs = load_operation_logs(session_db, training_session.id, start, end, skip + limit + 1)
+                operation_logs = operation_logs[skip:]
+                has_more = len(operation_logs) > limit
+                operation_logs = operation_logs[:limit]
+                next_cursor = None
+                if has_more:
+                    # 最後のタイムスタンプと同じ時刻の取得済み件数（前のページの分を含む）を記録
+                    last = operation_logs[-1].timestamp
+                    same = sum(1 for log in operation_logs if log.timestamp == last)
+                    next_cursor = encode_replay_cursor(last, same + (skip if last == start else 0))
+                window_count = len(operation_logs)
+            else:
+                operation_logs = load_operation_logs(session_db, training_session.id)
             
-            # リプレイデータを構築
+            # 概要チャート用の間引き（カーソルは間引く前の操作ログで決定済み）
+            original_count = len(operation_logs)
+            if max_points is not None:
+                operation_logs = downsample_records(operation_logs, max_points, algorithm)
+            
+            # KPIスコアを取得（KPIがある場合は操作ログと同じ走査でKPIタイムラインを構築）
+            kpi = session_db.query(KPIScore).filter(
+                KPIScore.training_session_id == training_session.id
+            ).first()
+            
+            # リプレイデータを構築（バイナリ形式の操作ログはシリアライズ時に列ごとの配列に変換）
             replay_data = {
                 'session_id': training_session.session_id,
                 'worker_id': training_session.worker_id,
                 'session_start_time': serialize_date(training_session.session_start_time),
                 'session_end_time': serialize_date(training_session.session_end_time),
                 'duration_seconds': training_session.duration_seconds,
-                'operation_logs': operation_logs_list,  # OperationLogテーブルから取得
-                'ai_evaluation': json.loads(training_session.ai_evaluation_json) if training_session.ai_evaluation_json else {},
-                'replay_data': json.loads(training_session.replay_data_json) if training_session.replay_data_json else {},
             }
+            if mimetype == REPLAY_MIMETYPE_JSON:
+                replay_data['operation_logs'], kpi_timeline = build_replay_entries(operation_logs, kpi is not None)
+            if not cursor:
+                replay_data['ai_evaluation'] = json.loads(training_session.ai_evaluation_json) if training_session.ai_evaluation_json else {}
+                replay_data['replay_data'] = json.loads(training_session.replay_data_json) if training_session.replay_data_json else {}
+            
+            if windowed:
+                replay_data['window'] = {
+                    'from': serialize_date(start),
+                    'to': serialize_date(end),
+                    'limit': limit,
+                    'count': window_count,
+                    'has_more': has_more,
+                    'next_cursor': next_cursor,
+                }
+            if max_points is not None:
+                replay_data['downsampling'] = {
+                    'algorithm': algorithm,
+                    'max_points': max_points,
+                    'original_count': original_count,
+                    'count': len(operation_logs),
+                }
             
-            # KPIスコアを取得
-            kpi = session_db.query(KPIScore).filter(
-                KPIScore.training_session_id == training_session.id
-            ).first()
+            if request.args.get('keyframes', '').lower() == 'true':
+                # シーク用のキーフレーム（区間の最初の操作ログから取得するためのカーソル）
+                replay_data['keyframes'] = [{
+                    'offset_seconds': offset,
+                    'timestamp': serialize_date(timestamp),
+                    'cursor': encode_replay_cursor(timestamp, 0),
+                } for offset, timestamp in operation_log_keyframes(
+                    session_db, training_session.id, origin, keyframe_interval
+                )]
             
             if kpi:
-                replay_data['kpi_scores'] = {
-                    'safety_score': kpi.safety_score,
-                    'error_count': kpi.error_count,
-                    'procedure_compliance_rate': kpi.procedure_compliance_rate,
-                    'work_time_seconds': kpi.work_time_seconds,
-                    'achievement_rate': kpi.achievement_rate,
-                    'accuracy_score': kpi.accuracy_score,
-                    'efficiency_score': kpi.efficiency_score,
-                    'overall_score': kpi.overall_score,
-                }
-                
-                # KPI時系列データを構築（操作ログから）
-                kpi_timeline = []
-                operation_logs = session_db.query(OperationLog).filter(
-                    OperationLog.training_session_id == training_session.id
-                ).order_by(OperationLog.timestamp).all()
-                
-                for log in operation_logs:
-                    kpi_timeline_entry = {
-                        'timestamp': serialize_date(log.timestamp),
-                        'error_event': log.error_event,
-                        'error_description': log.error_description,
+                if not cursor:
+                    replay_data['kpi_scores'] = {
+                        'safety_score': kpi.safety_score,
+                        'error_count': kpi.error_count,
+                        'procedure_compliance_rate': kpi.procedure_compliance_rate,
+                        'work_time_seconds': kpi.work_time_seconds,
+                        'achievement_rate': kpi.achievement_rate,
+                        'accuracy_score': kpi.accuracy_score,
+                        'efficiency_score': kpi.efficiency_score,
+                        'overall_score': kpi.overall_score,
                     }
-                    # 目標達成イベントを追加
-                    if hasattr(log, 'achievement_event') and log.achievement_event:
-                        kpi_timeline_entry['achievement_event'] = True
-                        kpi_timeline_entry['achievement_description'] = log.achievement_description if hasattr(log, 'achievement_description') else None
-                    kpi_timeline.append(kpi_timeline_entry)
-                
-                replay_data['kpi_timeline'] = kpi_timeline
+                if mimetype == REPLAY_MIMETYPE_JSON:
+                    replay_data['kpi_timeline'] = kpi_timeline
             
-            return {'success': True, 'data': replay_data}, 200
+            if mimetype == REPLAY_MIMETYPE_JSON:
+                body = (json.dumps({'success': True, 'data': replay_data}) + '\n').encode('utf-8')
+            else:
+                body = encode_replay(mimetype, replay_data, operation_logs)
+            replay_cache.put(cache_key, body)
+            return replay_response(body, etag, 'miss', mimetype)
         except Exception as e:
             return {'success': False, 'error': str(e)}, 500
         finally:
@@ -3892,6 +4398,11 @@ api.add_resource(MFADisableResource, '/api/auth/mfa/disable')
 api.add_resource(MFAGenerateBackupCodesResource, '/api/auth/mfa/backup-codes')
 api.add_resource(UserListResource, '/api/users')
 api.add_resource(UnityTrainingSessionResource, '/api/unity/training-session')
+api.add_resource(UnityChunkedSessionResource, '/api/unity/training-session/chunked')
+api.add_resource(UnityChunkListResource, '/api/unity/training-session/<string:session_id>/chunks')
+api.add_resource(UnityChunkResource, '/api/unity/training-session/<string:session_id>/chunks/<int:sequence>')
+api.add_resource(UnityChunkedSessionFinalizeResource, '/api/unity/training-session/<string:session_id>/finalize')
+api.add_resource(IngestionStatusResource, '/api/ingestion/<string:ticket>')
 api.add_resource(ReplaySessionResource, '/api/replay/<string:session_id>')
 
 
@@ -4005,6 +4516,53 @@ def handle_unity_status_update(data):
     return {'status': 'error', 'message': 'session_id required'}
 
 
+@socketio.on('telemetry_batch')
+def handle_telemetry_batch(data):
+    """
+    Unityからのライブテレメトリを受信
+    訓練中の操作ログをバッチ単位で受信し、サーバー側でまとめてデータベースに書き込む
+    （訓練終了時のREST送信ではKPI・AI評価のみを送信すればよい）
+    応答の backpressure が true の場合、クライアントは retry_after_ms 以上待ってから送信を再開し、
+    status が rejected のバッチは同じ連番で再送する（受信済みの連番は重複して保存されない）
+    
+    Args:
+        data: {
+            'session_id': セッションID,
+            'sequence': バッチの連番（セッション内で一意、分割アップロードのチャンクと共通）,
+            'operation_logs': 操作ログのリスト,
+            'session_start_time': 開始時刻（必須。セッションの作成と offset_ms の基準に使用）,
+            'worker_id': 訓練生ID（セッションを作成する場合）
+        }
+    
+    Returns:
+        受付結果（status, accepted, buffered, backpressure, retry_after_ms）
+    """
+    if not isinstance(data, dict) or not data.get('session_id'):
+        return {'status': 'error', 'message': 'session_id required'}
+    start_background_workers()
+    sequence = data.get('sequence')
+    if not isinstance(sequence, int) or isinstance(sequence, bool) or sequence < 0:
+        return {'status': 'error', 'message': 'sequence must be a non-negative integer'}
+    # 書き込み時にセッションを作成できるよう、開始時刻のないバッチはバッファに追加しない
+    error = validate_chunked_session_open(data) or validate_operation_log_chunk(data)
+    if error:
+        return {'status': 'error', 'message': error}
+    meta = {
+        key: data[key] for key in ('session_start_time', 'worker_id', 'training_menu_id')
+        if data.get(key) is not None
+    }
+    return telemetry_buffer.add(data['session_id'], sequence, data['operation_logs'], meta)
+
+
+@socketio.on('telemetry_status')
+def handle_telemetry_status(data=None):
+    """
+    ライブテレメトリのバッファ状態を取得
+    バックプレッシャーで送信を止めているクライアントが再開できるか確認するために使用
+    """
+    return telemetry_buffer.status()
+
+
 @socketio.on('admin_intervention')
 def handle_admin_intervention(data):
     """
@@ -4168,5 +4726,6 @@ if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     # WebSocket対応のため、socketio.run()を使用
+    start_background_workers()
     socketio.run(app, host='0.0.0.0', port=port, debug=debug, use_reloader=False)
 
@@ -2,18 +2,111 @@
 データベースモデルと初期化
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Float, Boolean, Date
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Float, Boolean, Date, UniqueConstraint, LargeBinary, Index
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, deferred
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime
+from array import array
 import os
+import sys
+import zlib
+import base64
 import hashlib
 import secrets
 import socket
 from urllib.parse import urlparse
 
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
 Base = declarative_base()
 
+# 圧縮テキスト列の圧縮方式（zlib, zstd, none。zstdはzstandardがインストールされていない場合zlibを使用）
+COMPRESSED_TEXT_CODEC = os.getenv('COMPRESSED_TEXT_CODEC', 'zlib').lower()
+
+# 圧縮レベル（省略時は各方式の既定値: zlib 6, zstd 3）
+COMPRESSED_TEXT_LEVEL = int(os.getenv('COMPRESSED_TEXT_LEVEL')) if os.getenv('COMPRESSED_TEXT_LEVEL') else None
+
+# このバイト数未満のテキストは圧縮しない
+COMPRESSED_TEXT_MIN_BYTES = int(os.getenv('COMPRESSED_TEXT_MIN_BYTES', '256'))
+
+
+class SkillIdArray(TypeDecorator):
+    """
+    スキルID配列型
+    PostgreSQLでは integer[]（GINインデックスで検索可能）、
+    その他のデータベースでは32bit整数（リトルエンディアン）をパックしたバイナリとして保存する
+    """
+    impl = LargeBinary
+    cache_ok = True
+    
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(postgresql.ARRAY(Integer))
+        return dialect.type_descriptor(LargeBinary())
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if dialect.name == 'postgresql':
+            return list(value)
+        packed = array('i', value)
+        if sys.byteorder != 'little':
+            packed.byteswap()
+        return packed.tobytes()
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if dialect.name == 'postgresql':
+            return list(value)
+        unpacked = array('i')
+        unpacked.frombytes(bytes(value))
+        if sys.byteorder != 'little':
+            unpacked.byteswap()
+        return unpacked.tolist()
+
+
+class CompressedText(TypeDecorator):
+    """
+    圧縮テキスト型
+    テキストを圧縮し、形式を示すプレフィックス（'zlib:' または 'zstd:'）付きのBase64文字列としてTEXT列に保存する
+    プレフィックスのない値（圧縮導入前の行や短いテキスト）はそのまま返すため、既存の行も読み出せる
+    JSON文字列は 'z' で始まらないため、JSON用の列ではプレフィックスと衝突しない
+    """
+    impl = Text
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        data = value.encode('utf-8')
+        if COMPRESSED_TEXT_CODEC == 'none' or len(data) < COMPRESSED_TEXT_MIN_BYTES:
+            return value
+        if COMPRESSED_TEXT_CODEC == 'zstd' and ZSTD_AVAILABLE:
+            level = 3 if COMPRESSED_TEXT_LEVEL is None else COMPRESSED_TEXT_LEVEL
+            prefix, compressed = 'zstd:', zstandard.ZstdCompressor(level=level).compress(data)
+        else:
+            level = 6 if COMPRESSED_TEXT_LEVEL is None else COMPRESSED_TEXT_LEVEL
+            prefix, compressed = 'zlib:', zlib.compress(data, level)
+        return prefix + base64.b64encode(compressed).decode('ascii')
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if value.startswith('zlib:'):
+            return zlib.decompress(base64.b64decode(value[5:])).decode('utf-8')
+        if value.startswith('zstd:'):
+            if not ZSTD_AVAILABLE:
+                raise RuntimeError('zstandard is required to read zstd-compressed text')
+            return zstandard.ZstdDecompressor().decompress(base64.b64decode(value[5:])).decode('utf-8')
+        return value
+
 
 class User(Base):
     """ユーザーモデル（認証・認可）"""
@@ -70,6 +163,7 @@ class JobPosting(Base):
     company_name = Column(String(100), nullable=False)
     description = Column(Text)
     required_skills = Column(Text)  # カンマ区切りでスキルを保存
+    skill_ids = Column(SkillIdArray)  # 正規スキルIDの配列（required_skillsから書き込み時に生成）
     location = Column(String(100))
     salary_min = Column(Integer)
     salary_max = Column(Integer)
@@ -92,6 +186,7 @@ class Applicant(Base):
     phone = Column(String(500))  # 暗号化された値を保存するため、サイズを拡張
     address = Column(String(200))
     skills = Column(Text)  # カンマ区切りでスキルを保存
+    skill_ids = Column(SkillIdArray)  # 正規スキルIDの配列（skillsから書き込み時に生成）
     experience_years = Column(Integer, default=0)
     education = Column(String(200))
     created_at = Column(DateTime, default=datetime.now)
@@ -148,13 +243,39 @@ class Skill(Base):
     name = Column(String(100), nullable=False, unique=True)
     category = Column(String(50))  # プログラミング、言語、その他など
     description = Column(Text)
+    aliases = Column(Text)  # 別名（カンマ区切り、例: Python3, パイソン）
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
 
+class SkillTerm(Base):
+    """未登録スキル名モデル（skillsテーブルにないスキル名に固定のスキルID（-id）を割り当てる）"""
+    __tablename__ = 'skill_terms'
+    # 削除・ロールバックされたIDを再利用しない（プロセス内のキャッシュと食い違わないようにする）
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(Text, nullable=False, unique=True)  # 正規化したスキル名
+    created_at = Column(DateTime, default=datetime.now)
+
+
+class SkillIndexChange(Base):
+    """スキルインデックスの変更ログ（他のプロセスでコミットされた応募者・求人のスキル変更をインデックスへ反映する）"""
+    __tablename__ = 'skill_index_changes'
+    
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(20), nullable=False)  # applicant, job, skills（スキル名・別名の変更）
+    row_id = Column(Integer)  # 応募者ID・求人ID
+    created_at = Column(DateTime, default=datetime.now, index=True)
+
+
 class Matching(Base):
     """マッチング結果モデル"""
     __tablename__ = 'matchings'
+    # 応募者×求人ごとに1件（一括UPSERTの競合キー）
+    __table_args__ = (
+        UniqueConstraint('applicant_id', 'job_posting_id', name='uq_matchings_applicant_job'),
+    )
     
     id = Column(Integer, primary_key=True)
     applicant_id = Column(Integer, ForeignKey('applicants.id'), nullable=False)
@@ -186,6 +307,7 @@ class Worker(Base):
     japanese_level = Column(String(20))  # 日本語レベル（N1, N2, N3, N4, N5）
     english_level = Column(String(20))  # 英語レベル
     skills = Column(Text)  # スキル（カンマ区切り）
+    skill_ids = Column(SkillIdArray)  # 正規スキルIDの配列（skillsから書き込み時に生成）
     experience_years = Column(Integer, default=0)
     education = Column(String(200))
     current_status = Column(String(50), default='登録中')  # 登録中、面談中、就労中、休職中など
@@ -592,9 +714,11 @@ class TrainingSession(Base):
     session_end_time = Column(DateTime, nullable=False)
     duration_seconds = Column(Integer)  # セッション時間（秒）
     # operation_logs_json = Column(Text, nullable=True)  # 操作ログ（JSON形式でタイムライン記録）- データベースマイグレーションで追加される（一時的にコメントアウト）
-    ai_evaluation_json = Column(Text)  # AI評価コメント（JSON形式）
-    replay_data_json = Column(Text)  # リプレイ用データ（JSON形式）
+    # AI評価・リプレイデータは圧縮して保存し、一覧などで不要な場合は読み込まない（undefer_group('payload')で一括取得）
+    ai_evaluation_json = deferred(Column(CompressedText), group='payload')  # AI評価コメント（JSON形式）
+    replay_data_json = deferred(Column(CompressedText), group='payload')  # リプレイ用データ（JSON形式）
     status = Column(String(50), default='完了')  # 完了、中断、エラー
+    content_version = Column(Integer, default=0)  # 内容のバージョン（操作ログ・KPIなどの更新ごとに加算、リプレイのキャッシュキー）
     created_at = Column(DateTime, default=datetime.now)
     
     # リレーション
@@ -602,6 +726,9 @@ class TrainingSession(Base):
     training_menu = relationship("TrainingMenu", back_populates="training_sessions")
     kpi_scores = relationship("KPIScore", back_populates="training_session", cascade="all, delete-orphan")
     operation_logs = relationship("OperationLog", back_populates="training_session", cascade="all, delete-orphan")
+    operation_log_chunks = relationship("OperationLogChunk", back_populates="training_session", cascade="all, delete-orphan")
+    operation_log_blocks = relationship("OperationLogBlock", back_populates="training_session", cascade="all, delete-orphan")
+    operation_log_keyframes = relationship("OperationLogKeyframe", back_populates="training_session", cascade="all, delete-orphan")
 
 
 class KPIScore(Base):
@@ -636,6 +763,13 @@ class OperationLog(Base):
     """
     __tablename__ = 'operation_logs'
     
+    __table_args__ = (
+        # 再送時の差分更新で既存の行を特定するための自然キー（連番のない旧データはNULL）
+        Index('uq_operation_logs_session_sequence', 'training_session_id', 'sequence', unique=True),
+        # リプレイの時間範囲の読み出し用（訓練セッションID + タイムスタンプ）
+        Index('ix_operation_logs_session_timestamp', 'training_session_id', 'timestamp'),
+    )
+    
     id = Column(Integer, primary_key=True)
     training_session_id = Column(Integer, ForeignKey('training_sessions.id'), nullable=False)  # 訓練セッションID
     timestamp = Column(DateTime, nullable=False)  # 操作タイムスタンプ（操作が発生した時刻）
@@ -651,12 +785,85 @@ class OperationLog(Base):
     achievement_event = Column(Boolean, default=False)  # 目標達成イベントが発生したかどうか
     achievement_description = Column(Text)  # 目標達成説明
     event_type = Column(String(50))  # イベントタイプ（error, achievement, operation）
+    sequence = Column(Integer)  # セッション内の連番（再送時の差分更新に使用）
+    content_hash = Column(String(16))  # 行の内容のハッシュ（再送時に変更された行を判定）
     created_at = Column(DateTime, default=datetime.now)  # 作成日時
     
     # リレーション
     training_session = relationship("TrainingSession", back_populates="operation_logs")  # 訓練セッションとの関連
 
 
+class OperationLogBlock(Base):
+    """
+    操作ログブロックモデル（列指向の圧縮形式）
+    訓練セッションの操作ログを一定行数ごとに列指向で圧縮して保存するテーブル
+    （OPERATION_LOG_STORAGE=columnar の場合に使用、形式は operation_log_blocks モジュールを参照）
+    """
+    __tablename__ = 'operation_log_blocks'
+    
+    __table_args__ = (
+        UniqueConstraint('training_session_id', 'block_index', name='uq_operation_log_blocks_session_block'),
+        # リプレイの時間範囲に重なるブロックの検索用
+        Index('ix_operation_log_blocks_session_time', 'training_session_id', 'start_time', 'end_time'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    training_session_id = Column(Integer, ForeignKey('training_sessions.id'), nullable=False)  # 訓練セッションID
+    block_index = Column(Integer, nullable=False)  # セッション内のブロック番号
+    start_time = Column(DateTime, nullable=False)  # ブロック内の最初のタイムスタンプ
+    end_time = Column(DateTime, nullable=False)  # ブロック内の最後のタイムスタンプ
+    row_count = Column(Integer, nullable=False)  # ブロックに含まれる操作ログの件数
+    encoding = Column(String(20), nullable=False)  # ブロック形式（columnar-v1）
+    data = Column(LargeBinary, nullable=False)  # 圧縮した列データ
+    created_at = Column(DateTime, default=datetime.now)  # 作成日時
+    
+    # リレーション
+    training_session = relationship("TrainingSession", back_populates="operation_log_blocks")  # 訓練セッションとの関連
+
+
+class OperationLogKeyframe(Base):
+    """
+    操作ログキーフレームモデル（リプレイのシーク用の索引）
+    訓練開始から一定秒数ごとの区間について、区間内の最初のタイムスタンプを操作ログの保存時に記録するテーブル
+    （リプレイの要求時に操作ログ全体を走査しないために使用、形式は operation_log_blocks モジュールを参照）
+    """
+    __tablename__ = 'operation_log_keyframes'
+
+    __table_args__ = (
+        UniqueConstraint('training_session_id', 'bucket', name='uq_operation_log_keyframes_session_bucket'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    training_session_id = Column(Integer, ForeignKey('training_sessions.id'), nullable=False)  # 訓練セッションID
+    interval_seconds = Column(Float, nullable=False)  # 区間の長さ（秒）
+    bucket = Column(Integer, nullable=False)  # 区間の番号（訓練開始からの経過秒数 / 区間の長さ）
+    first_time = Column(DateTime, nullable=False)  # 区間内の最初のタイムスタンプ
+
+    # リレーション
+    training_session = relationship("TrainingSession", back_populates="operation_log_keyframes")  # 訓練セッションとの関連
+
+
+class OperationLogChunk(Base):
+    """
+    操作ログチャンクモデル（分割アップロードの受信記録）
+    分割アップロードで受信したチャンクの連番を記録し、再送されたチャンクの重複保存を防ぐテーブル
+    """
+    __tablename__ = 'operation_log_chunks'
+    
+    __table_args__ = (
+        UniqueConstraint('training_session_id', 'sequence', name='uq_operation_log_chunks_session_sequence'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    training_session_id = Column(Integer, ForeignKey('training_sessions.id'), nullable=False)  # 訓練セッションID
+    sequence = Column(Integer, nullable=False)  # チャンクの連番（0から開始）
+    row_count = Column(Integer, nullable=False, default=0)  # チャンクに含まれる操作ログの件数
+    created_at = Column(DateTime, default=datetime.now)  # 受信日時
+    
+    # リレーション
+    training_session = relationship("TrainingSession", back_populates="operation_log_chunks")  # 訓練セッションとの関連
+
+
 class Milestone(Base):
     """マイルストーンモデル"""
     __tablename__ = 'milestones'
@@ -1069,7 +1276,9 @@ class Database:
                 pool_pre_ping=True
             )
         else:
-            # connect_argsを使用
+            # connect_argsを使用（psycopg2用のパラメータのため、SQLiteなどでは渡さない）
+            if not db_url.startswith('postgresql'):
+                connect_args = {}
             self.engine = create_engine(
                 db_url, 
                 echo=False,
@@ -1086,10 +1295,12 @@ class Database:
         データベーステーブルを作成
         Base.metadataに定義されたすべてのテーブルをデータベースに作成する
         """
+        from sqlalchemy import text, inspect
+        # skill_termsテーブルの導入前は未登録スキルにハッシュ値のIDを使用していたため、スキルID配列をすべて再生成する
+        had_skill_terms = inspect(self.engine).has_table('skill_terms')
         Base.metadata.create_all(self.engine)
         
         # 既存のテーブルにカラムを追加（マイグレーション）
-        from sqlalchemy import text, inspect
         inspector = inspect(self.engine)
         
         # training_sessionsテーブルに不足しているカラムを追加
@@ -1103,6 +1314,7 @@ class Database:
                     'operation_logs_json': 'TEXT',
                     'ai_evaluation_json': 'TEXT',
                     'replay_data_json': 'TEXT',
+                    'content_version': 'INTEGER DEFAULT 0',
                 }
                 
                 for col_name, col_type in required_columns.items():
@@ -1199,6 +1411,8 @@ class Database:
                     'achievement_event': 'BOOLEAN DEFAULT FALSE',
                     'achievement_description': 'TEXT',
                     'event_type': 'VARCHAR(50)',
+                    'sequence': 'INTEGER',
+                    'content_hash': 'VARCHAR(16)',
                 }
                 
                 for col_name, col_type in required_columns.items():
@@ -1224,6 +1438,22 @@ class Database:
                         print(f"operation_logsテーブルに{col_name}カラムを追加しました。")
                     else:
                         print(f"operation_logsテーブルに{col_name}カラムは既に存在します。")
+                
+                # 差分更新用の一意インデックス（訓練セッションID + 連番）
+                with self.engine.begin() as conn:
+                    conn.execute(text(
+                        "CREATE UNIQUE INDEX IF NOT EXISTS uq_operation_logs_session_sequence "
+                        "ON operation_logs (training_session_id, sequence)"
+                    ))
+                    # リプレイの時間範囲の読み出し用インデックス（訓練セッションID + タイムスタンプ）
+                    conn.execute(text(
+                        "CREATE INDEX IF NOT EXISTS ix_operation_logs_session_timestamp "
+                        "ON operation_logs (training_session_id, timestamp)"
+                    ))
+                    conn.execute(text(
+                        "CREATE INDEX IF NOT EXISTS ix_operation_log_blocks_session_time "
+                        "ON operation_log_blocks (training_session_id, start_time, end_time)"
+                    ))
             except Exception as e:
                 print(f"operation_logsテーブルのカラム追加エラー: {e}")
                 import traceback
@@ -1270,6 +1500,88 @@ class Database:
                 import traceback
                 traceback.print_exc()
         
+        # skillsテーブルに別名カラムを追加（スキル正規化辞書用）
+        if 'skills' in inspector.get_table_names():
+            try:
+                columns = [col['name'] for col in inspector.get_columns('skills')]
+                if 'aliases' not in columns:
+                    with self.engine.begin() as conn:
+                        conn.execute(text("ALTER TABLE skills ADD COLUMN aliases TEXT"))
+                    print("skillsテーブルにaliasesカラムを追加しました。")
+                else:
+                    print("skillsテーブルにaliasesカラムは既に存在します。")
+            except Exception as e:
+                print(f"skillsテーブルのカラム追加エラー: {e}")
+                import traceback
+                traceback.print_exc()
+        
+        # applicants/job_postings/workersテーブルにスキルID配列カラムを追加
+        for table_name in ['applicants', 'job_postings', 'workers']:
+            if table_name in inspector.get_table_names():
+                try:
+                    columns = [col['name'] for col in inspector.get_columns(table_name)]
+                    db_type = self.engine.dialect.name
+                    if 'skill_ids' not in columns:
+                        col_type = 'INTEGER[]' if db_type == 'postgresql' else 'BLOB'
+                        with self.engine.begin() as conn:
+                            conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN skill_ids {col_type}"))
+                        print(f"{table_name}テーブルにskill_idsカラムを追加しました。")
+                    else:
+                        print(f"{table_name}テーブルにskill_idsカラムは既に存在します。")
+                    if db_type == 'postgresql':
+                        # 「スキルXを持つ行」を検索するためのGINインデックス
+                        with self.engine.begin() as conn:
+                            conn.execute(text(
+                                f"CREATE INDEX IF NOT EXISTS ix_{table_name}_skill_ids ON {table_name} USING gin (skill_ids)"
+                            ))
+                except Exception as e:
+                    print(f"{table_name}テーブルのskill_idsカラム追加エラー: {e}")
+                    import traceback
+                    traceback.print_exc()
+        
+        # 既存行のスキルID配列を生成（未生成の行のみ）
+        try:
+            from .skills import refresh_skill_ids
+            session = self.get_session()
+            try:
+                updated = refresh_skill_ids(session, only_missing=had_skill_terms)
+                if updated:
+                    print(f"スキルID配列を{updated}件生成しました。")
+            finally:
+                session.close()
+        except Exception as e:
+            print(f"スキルID配列の生成エラー: {e}")
+            import traceback
+            traceback.print_exc()
+        
+        # matchingsテーブルに応募者×求人の一意制約を追加（一括UPSERT用）
+        if 'matchings' in inspector.get_table_names():
+            try:
+                unique_columns = [
+                    set(c['column_names']) for c in inspector.get_unique_constraints('matchings')
+                ] + [
+                    set(i['column_names']) for i in inspector.get_indexes('matchings') if i.get('unique')
+                ]
+                if {'applicant_id', 'job_posting_id'} not in unique_columns:
+                    with self.engine.begin() as conn:
+                        # 重複している行は最新（IDが最大）の1件のみ残す
+                        conn.execute(text("""
+                            DELETE FROM matchings WHERE id NOT IN (
+                                SELECT MAX(id) FROM matchings GROUP BY applicant_id, job_posting_id
+                            )
+                        """))
+                        conn.execute(text(
+                            "CREATE UNIQUE INDEX IF NOT EXISTS uq_matchings_applicant_job "
+                            "ON matchings (applicant_id, job_posting_id)"
+                        ))
+                    print("matchingsテーブルに一意制約を追加しました。")
+                else:
+                    print("matchingsテーブルの一意制約は既に存在します。")
+            except Exception as e:
+                print(f"matchingsテーブルの一意制約追加エラー: {e}")
+                import traceback
+                traceback.print_exc()
+        
         print("データベースを初期化しました。")
     
     def get_session(self):
@@ -0,0 +1,214 @@
+"""
+時系列の間引きモジュール
+リプレイの概要チャート用に、操作ログ（20Hz）の位置・速度・操作値の系列を形状を保ったまま間引く
+間引きは行の選択として行うため、選択した行はそのまま操作ログとしてシリアライズできる
+
+アルゴリズム:
+    - lttb: Largest-Triangle-Three-Buckets（隣接する点と作る三角形の面積が最大の点を各区間から選ぶ）
+    - minmax: 各区間の最小値・最大値の点を選ぶ（スパイクを確実に残す）
+"""
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+# 間引きのアルゴリズム
+DOWNSAMPLE_ALGORITHMS = ('lttb', 'minmax')
+
+# 間引きの対象の系列（OperationLogRecord の項目）
+DOWNSAMPLE_SERIES = ('position_x', 'position_y', 'position_z', 'velocity', 'operation_value')
+
+# 間引き後の最小点数（LTTBは先頭・末尾と1区間以上が必要）
+MIN_POINTS = 3
+
+# 系列間で選ばれた行が重なって上限の行数に満たない場合に、系列ごとの点数を増やして選び直す最大回数
+REFINE_STEPS = 4
+
+
+def lttb_indices(xs: list, ys: list, threshold: int) -> list:
+    """
+    LTTBで残す点の位置を取得
+
+    Args:
+        xs: x座標（昇順）
+        ys: y座標
+        threshold: 残す点の数（先頭・末尾を含む）
+
+    Returns:
+        残す点の位置（昇順）
+    """
+    count = len(xs)
+    if threshold >= count or threshold < MIN_POINTS:
+        return list(range(count))
+    if NUMPY_AVAILABLE:
+        xs = np.asarray(xs, dtype='float64')
+        ys = np.asarray(ys, dtype='float64')
+    every = (count - 2) / (threshold - 2)
+    selected = [0]
+    previous = 0
+    for bucket in range(threshold - 2):
+        # 次の区間の平均（三角形の3点目）
+        next_start = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, count)
+        start = int(bucket * every) + 1
+        end = next_start
+        ax, ay = xs[previous], ys[previous]
+        if NUMPY_AVAILABLE:
+            cx = xs[next_start:next_end].mean()
+            cy = ys[next_start:next_end].mean()
+            areas = np.abs((ax - cx) * (ys[start:end] - ay) - (ax - xs[start:end]) * (cy - ay))
+            previous = start + int(areas.argmax())
+        else:
+            span = next_end - next_start
+            cx = sum(xs[next_start:next_end]) / span
+            cy = sum(ys[next_start:next_end]) / span
+            best_area = -1.0
+            for index in range(start, end):
+                area = abs((ax - cx) * (ys[index] - ay) - (ax - xs[index]) * (cy - ay))
+                if area > best_area:
+                    best_area, previous = area, index
+        selected.append(previous)
+    selected.append(count - 1)
+    return selected
+
+
+def minmax_indices(xs: list, ys: list, threshold: int) -> list:
+    """
+    区間ごとの最小値・最大値で残す点の位置を取得
+
+    Args:
+        xs: x座標（昇順、区間の分割は点の数で行うため値は使用しない）
+        ys: y座標
+        threshold: 残す点の数の上限（先頭・末尾を含む）
+
+    Returns:
+        残す点の位置（昇順）
+    """
+    count = len(ys)
+    if threshold >= count or threshold < MIN_POINTS:
+        return list(range(count))
+    selected = {0, count - 1}
+    if NUMPY_AVAILABLE:
+        ys = np.asarray(ys, dtype='float64')
+    buckets = (threshold - 2) // 2
+    if buckets == 0:
+        # 1点しか残せない場合は、先頭・末尾の中間値から最も離れた点を選ぶ
+        middle = (ys[0] + ys[-1]) / 2
+        selected.add(max(range(1, count - 1), key=lambda index: abs(ys[index] - middle)))
+        return sorted(selected)
+    every = (count - 2) / buckets
+    for bucket in range(buckets):
+        start = int(bucket * every) + 1
+        end = min(int((bucket + 1) * every) + 1, count - 1)
+        if start >= end:
+            continue
+        if NUMPY_AVAILABLE:
+            values = ys[start:end]
+            selected.add(start + int(values.argmin()))
+            selected.add(start + int(values.argmax()))
+        else:
+            values = ys[start:end]
+            selected.add(start + min(range(len(values)), key=values.__getitem__))
+            selected.add(start + max(range(len(values)), key=values.__getitem__))
+    return sorted(selected)
+
+
+def _spread(items: list, count: int) -> list:
+    """
+    等間隔に要素を選択（2件以上の場合は先頭・末尾を含む）
+
+    Args:
+        items: 選択元の要素
+        count: 選択する件数
+
+    Returns:
+        選択した要素（元の順序）
+    """
+    if count >= len(items):
+        return list(items)
+    if count <= 0:
+        return []
+    if count == 1:
+        return [items[len(items) // 2]]
+    step = (len(items) - 1) / (count - 1)
+    return [items[round(index * step)] for index in range(count)]
+
+
+def downsample_records(records: list, max_points: int, algorithm: str = 'lttb') -> list:
+    """
+    操作ログを間引く（位置・速度・操作値の系列の形状を保つ行を選択）
+    エラー・目標達成イベントの行、先頭・末尾の行は必ず残す
+
+    Args:
+        records: タイムスタンプ順の操作ログ（OperationLogRecord または同じ項目を持つ行）
+        max_points: 残す行数の上限（イベントの行はこれとは別に残す）
+        algorithm: 'lttb' または 'minmax'
+
+    Returns:
+        選択した操作ログ（タイムスタンプ順）
+    """
+    count = len(records)
+    if count <= max_points:
+        return records
+    select = minmax_indices if algorithm == 'minmax' else lttb_indices
+
+    origin = records[0].timestamp
+    seconds = [(record.timestamp - origin).total_seconds() for record in records]
+    # 値が変化する系列ごとに点数を割り当てる（NULLの行は系列から除き、値が一定の系列は形状がないため除く）
+    series = []
+    for name in DOWNSAMPLE_SERIES:
+        positions = [index for index, record in enumerate(records) if getattr(record, name) is not None]
+        if len(positions) < MIN_POINTS:
+            continue
+        ys = [getattr(records[index], name) for index in positions]
+        if min(ys) == max(ys):
+            continue
+        series.append((positions, [seconds[index] for index in positions], ys))
+
+    def select_rows(budget):
+        keep = {0, count - 1}
+        for positions, xs, ys in series:
+            keep.update(positions[index] for index in select(xs, ys, budget))
+        return keep
+
+    if series:
+        # 各系列が先頭・末尾以外に選ぶ点の合計が上限に収まる点数から始める
+        budget = max(MIN_POINTS, 2 + (max_points - 2) // len(series))
+        keep = select_rows(budget)
+        over_rows = None
+        if len(keep) > max_points:
+            # 系列数が多く最小の点数でも上限を超える場合は、選んだ行から等間隔に残す
+            keep = set(_spread(sorted(keep), max_points))
+        else:
+            # 系列間で同じ行が選ばれた分は、上限を超えない範囲で各系列の点数を増やして補う
+            # （超えた点数がある場合はその間を二分探索）
+            over = None
+            for _ in range(REFINE_STEPS):
+                if len(keep) >= max_points or budget >= count:
+                    break
+                if over is None:
+                    larger = max(budget + 1, budget * max_points // len(keep))
+                else:
+                    larger = (budget + over) // 2
+                if larger <= budget:
+                    break
+                candidate = select_rows(larger)
+                if len(candidate) > max_points:
+                    over, over_rows = larger, candidate
+                else:
+                    budget, keep = larger, candidate
+            if over_rows is not None and len(keep) < max_points:
+                # 残りの行数は、上限を超えた点数で追加で選ばれた行から等間隔に補う
+                keep.update(_spread(sorted(over_rows - keep), max_points - len(keep)))
+    else:
+        # 数値の系列がない場合は等間隔に選択
+        step = (count - 1) / max(max_points - 1, 1)
+        keep = {round(index * step) for index in range(max_points)}
+
+    for index, record in enumerate(records):
+        if record.error_event or record.achievement_event:
+            keep.add(index)
+    return [records[index] for index in sorted(keep)]
@@ -0,0 +1,1124 @@
+"""
+操作ログ一括取り込みモジュール
+Unityシミュレーターから送信された操作ログをORMオブジェクトを経由せずに行タプルへ変換し、
+チャンク単位の一括INSERT（PostgreSQLではCOPY FROM STDIN）で保存する
+"""
+
+import os
+import io
+import json
+import base64
+import hashlib
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, update, func
+
+from .database import OperationLog, OperationLogBlock, OperationLogChunk, TrainingSession, KPIScore
+from .operation_log_blocks import (
+    BLOCK_ENCODING, encode_block, to_naive_utc,
+    index_operation_log_keyframes, rebuild_operation_log_keyframes, delete_operation_log_keyframes,
+)
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+# 操作ログを一括保存する際の1チャンクあたりの行数
+OPERATION_LOG_CHUNK_SIZE = int(os.getenv('OPERATION_LOG_CHUNK_SIZE', '5000'))
+
+# PostgreSQL（psycopg2）でCOPY FROM STDINを使用するかどうか
+OPERATION_LOG_USE_COPY = os.getenv('OPERATION_LOG_USE_COPY', 'true').lower() == 'true'
+
+# 操作ログの保存形式（rows: operation_logsテーブルに1行ずつ、columnar: 列指向の圧縮ブロック）
+OPERATION_LOG_STORAGE = os.getenv('OPERATION_LOG_STORAGE', 'rows').lower()
+
+# 列指向ブロック1つあたりの行数（20Hzで約10分）
+OPERATION_LOG_BLOCK_ROWS = int(os.getenv('OPERATION_LOG_BLOCK_ROWS', '12000'))
+
+# 行タプルの列順（operation_logsテーブルのカラム名）
+OPERATION_LOG_COLUMNS = (
+    'training_session_id',
+    'timestamp',
+    'operation_type',
+    'operation_value',
+    'equipment_state',
+    'position_x',
+    'position_y',
+    'position_z',
+    'velocity',
+    'error_event',
+    'error_description',
+    'achievement_event',
+    'achievement_description',
+    'event_type',
+    'sequence',
+    'content_hash',
+    'created_at',
+)
+
+# 行タプル内の連番・ハッシュの位置（差分更新で使用）
+_SEQUENCE_POSITION = OPERATION_LOG_COLUMNS.index('sequence')
+_HASH_POSITION = OPERATION_LOG_COLUMNS.index('content_hash')
+
+# 差分更新で更新対象にする列（内容の列とハッシュ）
+_CONTENT_COLUMNS = OPERATION_LOG_COLUMNS[1:_SEQUENCE_POSITION]
+
+# 分割アップロードで受信中の訓練セッションの状態
+SESSION_STATUS_RECEIVING = '受信中'
+
+# MessagePack形式のリクエストボディとして扱うContent-Type
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+
+# 取り込みデータの種別（取り込みキューのハンドラ選択に使用）
+INGESTION_KIND_UNITY = 'unity_training_session'
+INGESTION_KIND_LEGACY = 'training_session'
+
+# エポック秒・ミリ秒の原点（UTC、タイムゾーンなし）
+_EPOCH = datetime(1970, 1, 1)
+
+# DB-APIのparamstyleごとの位置パラメータ
+_POSITIONAL_PLACEHOLDERS = {'qmark': '?', 'format': '%s', 'pyformat': '%s'}
+
+logger = logging.getLogger(__name__)
+
+
+def parse_timestamp(value) -> datetime:
+    """ISO 8601形式のタイムスタンプ（末尾のZを含む）をdatetimeに変換（MessagePackのTimestamp型はそのまま返す）"""
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def parse_session_time(value) -> datetime:
+    """
+    訓練セッションの開始・終了時刻をdatetime（UTC、タイムゾーンなし）に変換
+    操作ログのタイムスタンプと同じ基準で保存し、開始時刻からの経過秒による範囲指定をずれなくする
+    """
+    return to_naive_utc(parse_timestamp(value))
+
+
+def _milliseconds_to_datetimes(values: list, origin_us: int = 0) -> list:
+    """
+    ミリ秒の列をdatetime（UTC、タイムゾーンなし）のリストに変換
+
+    Args:
+        values: ミリ秒（数値）のリスト
+        origin_us: 基準時刻（エポックからのマイクロ秒、省略時はエポック）
+    """
+    if NUMPY_AVAILABLE:
+        microseconds = np.rint(np.asarray(values, dtype='float64') * 1000).astype('int64') + origin_us
+        return microseconds.astype('datetime64[us]').astype(object).tolist()
+    origin = _EPOCH + timedelta(microseconds=origin_us)
+    return [origin + timedelta(milliseconds=value) for value in values]
+
+
+def _parse_log_timestamp(log_data: dict, session_start: datetime, default: datetime) -> datetime:
+    """操作ログ1件のタイムスタンプを変換（parse_log_timestamps() の一括変換ができない場合に使用）"""
+    value = log_data.get('timestamp')
+    if isinstance(value, str):
+        if value.endswith('Z'):
+            return datetime.fromisoformat(value[:-1])
+        return to_naive_utc(parse_timestamp(value))
+    if isinstance(value, datetime):
+        return to_naive_utc(value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # エポックミリ秒
+        return _EPOCH + timedelta(milliseconds=value)
+    offset = log_data.get('offset_ms')
+    if offset is not None:
+        if session_start is None:
+            raise ValueError('offset_ms requires session_start_time')
+        return to_naive_utc(session_start) + timedelta(milliseconds=offset)
+    if default is not None:
+        return default
+    raise ValueError('each operation log requires a timestamp')
+
+
+def parse_log_timestamps(logs: list, session_start: datetime = None, default: datetime = None) -> list:
+    """
+    操作ログのタイムスタンプを一括でdatetime（UTC、タイムゾーンなし）に変換
+    タイムスタンプは次のいずれかの形式で指定できる（形式が揃っている場合は行ごとの形式の判定を省略する）
+      - timestamp: ISO 8601文字列（末尾のZを含む）
+        すべてZ付きの場合は datetime.fromisoformat で1件ずつ解析する（置換・タイムゾーン変換を省略）
+        numpyのdatetime64での一括解析は、datetimeへの変換を含めると速くならないため使用しない
+      - timestamp: エポックミリ秒（数値、numpyがある場合は配列演算で一括変換）
+      - offset_ms: session_start_time からの経過ミリ秒（同上）
+
+    Args:
+        logs: 操作ログ（辞書）のリスト
+        session_start: 訓練セッションの開始時刻（offset_ms の基準）
+        default: タイムスタンプがない場合の値（省略時はValueError）
+
+    Returns:
+        datetimeのリスト（logsと同じ順序）
+    """
+    if not logs:
+        return []
+    first = logs[0].get('timestamp')
+    try:
+        if isinstance(first, str):
+            # ISO 8601（UTCの 'Z' 付きの場合はタイムゾーンなしのまま解析）
+            fromisoformat = datetime.fromisoformat
+            values = [log_data['timestamp'] for log_data in logs]
+            if all(value[-1] == 'Z' for value in values):
+                return [fromisoformat(value[:-1]) for value in values]
+        elif isinstance(first, (int, float)) and not isinstance(first, bool):
+            # エポックミリ秒
+            return _milliseconds_to_datetimes([log_data['timestamp'] for log_data in logs])
+        elif first is None and logs[0].get('offset_ms') is not None and session_start is not None:
+            # 開始時刻からの経過ミリ秒
+            start = to_naive_utc(session_start) - _EPOCH
+            origin_us = (start.days * 86400 + start.seconds) * 1000000 + start.microseconds
+            return _milliseconds_to_datetimes([log_data['offset_ms'] for log_data in logs], origin_us)
+    except (KeyError, TypeError, ValueError, IndexError, AttributeError):
+        # 形式が混在している場合は1件ずつ変換
+        pass
+    return [_parse_log_timestamp(log_data, session_start, default) for log_data in logs]
+
+
+def decode_msgpack_body(body: bytes):
+    """
+    MessagePack形式のリクエストボディをデコード
+    Timestamp拡張型はdatetime（UTC）、バイナリ型はbytesとしてデコードする
+
+    Args:
+        body: リクエストボディ
+
+    Returns:
+        デコードしたオブジェクト
+    """
+    return msgpack.unpackb(body, raw=False, timestamp=3, strict_map_key=False)
+
+
+def decode_equipment_state(equipment_state):
+    """
+    重機状態をデコード
+    'msgpack:' プレフィックス付きの文字列はBase64 + MessagePackとしてデコードする
+    バイト列（MessagePack形式のリクエストボディのバイナリ型）はMessagePackとしてデコードする
+
+    Args:
+        equipment_state: 重機状態（辞書、'msgpack:'プレフィックス付き文字列、バイト列、またはNone）
+
+    Returns:
+        重機状態の辞書（デコードできない場合はNone）
+    """
+    if isinstance(equipment_state, str) and equipment_state.startswith('msgpack:'):
+        try:
+            compressed_data = base64.b64decode(equipment_state[8:])  # 'msgpack:'プレフィックスを除去
+            if MSGPACK_AVAILABLE:
+                return msgpack.unpackb(compressed_data, raw=False)
+            return json.loads(equipment_state[8:])
+        except Exception as e:
+            logger.error(f'Failed to decode MessagePack data: {e}')
+            return None
+    if isinstance(equipment_state, dict):
+        return equipment_state
+    if isinstance(equipment_state, bytes) and MSGPACK_AVAILABLE:
+        try:
+            return msgpack.unpackb(equipment_state, raw=False)
+        except Exception as e:
+            logger.error(f'Failed to decode MessagePack data: {e}')
+            return None
+    return None
+
+
+def _content_hash(content: tuple) -> str:
+    """行の内容（訓練セッションID・連番・作成日時を除く列）のハッシュを計算"""
+    return hashlib.blake2b(repr(content).encode('utf-8'), digest_size=8).hexdigest()
+
+
+def build_operation_log_rows(training_session_id: int, logs: list, implicit_sequence: bool = True,
+                             session_start: datetime = None) -> list:
+    """
+    Unity形式（snake_case）の操作ログを行タプルに変換
+    連番は操作ログの sequence を使用し、指定がない場合はリスト内の位置とする
+
+    Args:
+        training_session_id: 訓練セッションの内部ID
+        logs: 操作ログ（辞書）のリスト
+        implicit_sequence: sequence の指定がない場合にリスト内の位置を連番とするかどうか
+            （Falseの場合はNULL。分割アップロードのチャンクなど、リストがセッション全体ではない場合に使用）
+        session_start: 訓練セッションの開始時刻（offset_ms 形式のタイムスタンプの基準）
+
+    Returns:
+        OPERATION_LOG_COLUMNS の列順のタプルのリスト
+    """
+    now = datetime.now()
+    timestamps = parse_log_timestamps(logs, session_start)
+    rows = []
+    append = rows.append
+    for index, log_data in enumerate(logs):
+        equipment_state = decode_equipment_state(log_data.get('equipment_state'))
+        error_event = log_data.get('error_event', False)
+        achievement_event = log_data.get('achievement_event', False)
+        # イベントタイプを判定
+        if error_event:
+            event_type = 'error'
+        elif achievement_event:
+            event_type = 'achievement'
+        else:
+            event_type = 'operation'
+        content = (
+            timestamps[index],
+            log_data.get('operation_type'),
+            log_data.get('operation_value'),
+            json.dumps(equipment_state) if equipment_state else None,
+            log_data.get('position_x'),
+            log_data.get('position_y'),
+            log_data.get('position_z'),
+            log_data.get('velocity'),
+            error_event,
+            log_data.get('error_description'),
+            achievement_event,
+            log_data.get('achievement_description'),
+            event_type,
+        )
+        append((
+            training_session_id,
+            *content,
+            log_data.get('sequence', index if implicit_sequence else None),
+            _content_hash(content),
+            now,
+        ))
+    return rows
+
+
+def build_legacy_operation_log_rows(training_session_id: int, logs: list) -> list:
+    """
+    旧形式（camelCase、/api/training-sessions）の操作ログを行タプルに変換
+
+    Args:
+        training_session_id: 訓練セッションの内部ID
+        logs: 操作ログ（辞書）のリスト
+
+    Returns:
+        OPERATION_LOG_COLUMNS の列順のタプルのリスト
+    """
+    now = datetime.now()
+    timestamps = parse_log_timestamps(logs, default=now)
+    return [(
+        training_session_id,
+        timestamps[index],
+        log_data.get('operationType'),
+        log_data.get('operationValue'),
+        log_data.get('equipmentState'),
+        log_data.get('positionX'),
+        log_data.get('positionY'),
+        log_data.get('positionZ'),
+        log_data.get('velocity'),
+        log_data.get('errorEvent', False),
+        log_data.get('errorDescription'),
+        False,
+        None,
+        None,
+        index,
+        None,
+        now,
+    ) for index, log_data in enumerate(logs)]
+
+
+def _copy_value(value) -> str:
+    """COPYのテキスト形式の値に変換（NULLは\\N、区切り文字・改行・バックスラッシュはエスケープ）"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, str):
+        return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _copy_rows(session, rows: list, chunk_size: int):
+    """PostgreSQL（psycopg2）のCOPY FROM STDINで行を保存"""
+    sql = f"COPY {OperationLog.__tablename__} ({', '.join(OPERATION_LOG_COLUMNS)}) FROM STDIN"
+    raw_connection = session.connection().connection
+    cursor = raw_connection.cursor()
+    try:
+        for start in range(0, len(rows), chunk_size):
+            buffer = io.StringIO()
+            buffer.writelines(
+                '\t'.join(map(_copy_value, row)) + '\n' for row in rows[start:start + chunk_size]
+            )
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+    finally:
+        cursor.close()
+
+
+def _executemany_rows(session, rows: list, chunk_size: int):
+    """
+    ドライバのexecutemanyで行を保存
+    位置パラメータのINSERT文と型変換関数は1回だけ用意し、行ごとのSQLAlchemyのパラメータ処理を省く
+    """
+    dialect = session.get_bind().dialect
+    placeholder = _POSITIONAL_PLACEHOLDERS.get(dialect.paramstyle)
+    table = OperationLog.__table__
+    if placeholder is None or dialect.name == 'postgresql':
+        # PostgreSQLはSQLAlchemyのinsertmanyvalues（複数行VALUES）の方が高速
+        stmt = insert(table)
+        for start in range(0, len(rows), chunk_size):
+            session.execute(stmt, [dict(zip(OPERATION_LOG_COLUMNS, row)) for row in rows[start:start + chunk_size]])
+        return
+
+    sql = (
+        f"INSERT INTO {table.name} ({', '.join(OPERATION_LOG_COLUMNS)}) "
+        f"VALUES ({', '.join([placeholder] * len(OPERATION_LOG_COLUMNS))})"
+    )
+    processors = []
+    for position, column in enumerate(OPERATION_LOG_COLUMNS):
+        processor = table.c[column].type.dialect_impl(dialect).bind_processor(dialect)
+        if processor is not None:
+            processors.append((position, processor))
+    connection = session.connection()
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        if processors:
+            converted = []
+            for row in chunk:
+                row = list(row)
+                for position, processor in processors:
+                    row[position] = processor(row[position])
+                converted.append(tuple(row))
+            chunk = converted
+        connection.exec_driver_sql(sql, chunk)
+
+
+def bulk_insert_operation_logs(session, rows: list, chunk_size: int = None) -> int:
+    """
+    操作ログの行タプルを一括保存（コミットは呼び出し側で行う）
+    PostgreSQL（psycopg2）ではCOPY FROM STDIN、それ以外はチャンク単位のexecutemanyで保存する
+
+    Args:
+        session: データベースセッション
+        rows: OPERATION_LOG_COLUMNS の列順のタプルのリスト
+        chunk_size: 1チャンクあたりの行数（省略時はOPERATION_LOG_CHUNK_SIZE）
+
+    Returns:
+        保存した行数
+    """
+    if not rows:
+        return 0
+    chunk_size = chunk_size or OPERATION_LOG_CHUNK_SIZE
+    dialect = session.get_bind().dialect
+    if OPERATION_LOG_USE_COPY and dialect.name == 'postgresql' and dialect.driver == 'psycopg2':
+        _copy_rows(session, rows, chunk_size)
+    else:
+        _executemany_rows(session, rows, chunk_size)
+    return len(rows)
+
+
+def replace_operation_logs(session, training_session_id: int, rows: list, chunk_size: int = None) -> int:
+    """
+    訓練セッションの操作ログを置き換え（既存のログを削除してから一括保存、コミットは呼び出し側で行う）
+
+    Args:
+        session: データベースセッション
+        training_session_id: 訓練セッションの内部ID
+        rows: OPERATION_LOG_COLUMNS の列順のタプルのリスト
+        chunk_size: 1チャンクあたりの行数（省略時はOPERATION_LOG_CHUNK_SIZE）
+
+    Returns:
+        保存した行数
+    """
+    _delete_operation_logs(session, training_session_id)
+    inserted = bulk_insert_operation_logs(session, rows, chunk_size)
+    index_operation_log_keyframes(session, training_session_id, [row[1] for row in rows])
+    return inserted
+
+
+def _delete_operation_logs(session, training_session_id: int) -> int:
+    """
+    訓練セッションの操作ログ（行形式・ブロック）、キーフレームの索引、分割アップロードの受信記録を削除し、
+    削除した操作ログの件数を返す
+    """
+    deleted = session.query(OperationLog).filter(
+        OperationLog.training_session_id == training_session_id
+    ).delete(synchronize_session=False)
+    block_rows = session.query(func.coalesce(func.sum(OperationLogBlock.row_count), 0)).filter(
+        OperationLogBlock.training_session_id == training_session_id
+    ).scalar()
+    if block_rows:
+        session.query(OperationLogBlock).filter(
+            OperationLogBlock.training_session_id == training_session_id
+        ).delete(synchronize_session=False)
+        deleted += int(block_rows)
+    delete_operation_log_keyframes(session, training_session_id)
+    # 分割アップロードの受信記録も破棄（置き換え後のログと整合しなくなるため）
+    session.query(OperationLogChunk).filter(
+        OperationLogChunk.training_session_id == training_session_id
+    ).delete(synchronize_session=False)
+    return deleted
+
+
+def sync_operation_logs(session, training_session_id: int, rows: list, prune: bool = True,
+                        chunk_size: int = None) -> dict:
+    """
+    訓練セッションの操作ログを差分更新（コミットは呼び出し側で行う）
+    連番で既存の行と突き合わせ、新しい行は追加、内容のハッシュが変わった行のみ更新する
+    連番のない行（旧データ、分割アップロードのチャンク）や列指向ブロックが含まれる場合は置き換えにフォールバックする
+
+    Args:
+        session: データベースセッション
+        training_session_id: 訓練セッションの内部ID
+        rows: build_operation_log_rows() で作成した行タプルのリスト
+        prune: 送信されなかった連番の既存行を削除するかどうか（rowsがセッション全体の場合はTrue）
+        chunk_size: 1チャンクあたりの行数（省略時はOPERATION_LOG_CHUNK_SIZE）
+
+    Returns:
+        {'inserted': 追加件数, 'updated': 更新件数, 'deleted': 削除件数, 'unchanged': 変更なしの件数}
+    """
+    incoming = {row[_SEQUENCE_POSITION]: row for row in rows}
+    unsequenced = session.query(OperationLog.id).filter(
+        OperationLog.training_session_id == training_session_id,
+        OperationLog.sequence.is_(None)
+    ).first() or session.query(OperationLogBlock.id).filter(
+        OperationLogBlock.training_session_id == training_session_id
+    ).first()
+    if None in incoming or unsequenced:
+        deleted = _delete_operation_logs(session, training_session_id)
+        inserted = bulk_insert_operation_logs(session, rows, chunk_size)
+        index_operation_log_keyframes(session, training_session_id, [row[1] for row in rows])
+        return {'inserted': inserted, 'updated': 0, 'deleted': deleted, 'unchanged': 0}
+
+    query = session.query(OperationLog.id, OperationLog.sequence, OperationLog.content_hash).filter(
+        OperationLog.training_session_id == training_session_id
+    )
+    if not prune and incoming:
+        # 送信された範囲の行のみ突き合わせる（追記の場合は既存の行を読み込まない）
+        query = query.filter(OperationLog.sequence.between(min(incoming), max(incoming)))
+    existing = {sequence: (log_id, content_hash) for log_id, sequence, content_hash in query}
+
+    inserts = []
+    updates = []
+    for sequence, row in incoming.items():
+        current = existing.get(sequence)
+        if current is None:
+            inserts.append(row)
+        elif current[1] != row[_HASH_POSITION]:
+            values = dict(zip(_CONTENT_COLUMNS, row[1:_SEQUENCE_POSITION]))
+            values['id'] = current[0]
+            values['content_hash'] = row[_HASH_POSITION]
+            updates.append(values)
+    deletes = [log_id for sequence, (log_id, _) in existing.items() if sequence not in incoming] if prune else []
+
+    chunk_size = chunk_size or OPERATION_LOG_CHUNK_SIZE
+    for start in range(0, len(deletes), chunk_size):
+        session.query(OperationLog).filter(
+            OperationLog.id.in_(deletes[start:start + chunk_size])
+        ).delete(synchronize_session=False)
+    for start in range(0, len(updates), chunk_size):
+        session.execute(update(OperationLog), updates[start:start + chunk_size])
+    bulk_insert_operation_logs(session, inserts, chunk_size)
+    if updates or deletes:
+        # 既存の行のタイムスタンプが変わった・削除された場合は索引を作り直す
+        rebuild_operation_log_keyframes(session, training_session_id)
+    else:
+        index_operation_log_keyframes(session, training_session_id, [row[1] for row in inserts])
+    return {
+        'inserted': len(inserts),
+        'updated': len(updates),
+        'deleted': len(deletes),
+        'unchanged': len(incoming) - len(inserts) - len(updates),
+    }
+
+
+def insert_operation_log_blocks(session, training_session_id: int, rows: list, block_rows: int = None) -> int:
+    """
+    操作ログの行タプルを列指向の圧縮ブロックとして保存（コミットは呼び出し側で行う）
+    行はタイムスタンプ順に並べ、既存のブロックの後ろに追加する
+
+    Args:
+        session: データベースセッション
+        training_session_id: 訓練セッションの内部ID
+        rows: OPERATION_LOG_COLUMNS の列順のタプルのリスト
+        block_rows: 1ブロックあたりの行数（省略時はOPERATION_LOG_BLOCK_ROWS）
+
+    Returns:
+        保存した行数
+    """
+    if not rows:
+        return 0
+    next_index = session.query(func.max(OperationLogBlock.block_index)).filter(
+        OperationLogBlock.training_session_id == training_session_id
+    ).scalar()
+    next_index = 0 if next_index is None else next_index + 1
+    blocks = _build_operation_log_blocks(training_session_id, rows, block_rows, next_index)
+    session.execute(insert(OperationLogBlock), blocks)
+    index_operation_log_keyframes(session, training_session_id, [row[1] for row in rows])
+    return len(rows)
+
+
+def _build_operation_log_blocks(training_session_id: int, rows: list, block_rows: int = None,
+                                first_index: int = 0) -> list:
+    """操作ログの行タプルをタイムスタンプ順に並べ、列指向ブロック（operation_log_blocksテーブルの行）に変換"""
+    block_rows = block_rows or OPERATION_LOG_BLOCK_ROWS
+    rows = sorted(rows, key=lambda row: to_naive_utc(row[1]))
+    now = datetime.now()
+    blocks = []
+    for start in range(0, len(rows), block_rows):
+        chunk = rows[start:start + block_rows]
+        columns = dict(zip(OPERATION_LOG_COLUMNS, zip(*chunk)))
+        blocks.append({
+            'training_session_id': training_session_id,
+            'block_index': first_index + len(blocks),
+            'start_time': to_naive_utc(chunk[0][1]),
+            'end_time': to_naive_utc(chunk[-1][1]),
+            'row_count': len(chunk),
+            'encoding': BLOCK_ENCODING,
+            'data': encode_block(columns),
+            'created_at': now,
+        })
+    return blocks
+
+
+def replace_operation_log_blocks(session, training_session_id: int, rows: list, block_rows: int = None) -> dict:
+    """
+    訓練セッションの操作ログを列指向ブロックで置き換え（コミットは呼び出し側で行う）
+    ブロックは差分更新できないため、変換したブロックが保存済みのブロックと同一の場合（内容が変わらない再送）のみ
+    何もせず、それ以外は既存の操作ログを削除してから保存する
+
+    Returns:
+        {'inserted': 追加件数, 'updated': 0, 'deleted': 削除件数, 'unchanged': 変更なしの件数}
+    """
+    blocks = _build_operation_log_blocks(training_session_id, rows, block_rows)
+    has_rows = session.query(OperationLog.id).filter(
+        OperationLog.training_session_id == training_session_id
+    ).first()
+    if not has_rows:
+        stored = [data for data, in session.query(OperationLogBlock.data).filter(
+            OperationLogBlock.training_session_id == training_session_id
+        ).order_by(OperationLogBlock.block_index)]
+        if stored == [block['data'] for block in blocks]:
+            return {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': len(rows)}
+    deleted = _delete_operation_logs(session, training_session_id)
+    if blocks:
+        session.execute(insert(OperationLogBlock), blocks)
+        index_operation_log_keyframes(session, training_session_id, [row[1] for row in rows])
+    return {'inserted': len(rows), 'updated': 0, 'deleted': deleted, 'unchanged': 0}
+
+
+def store_operation_logs(session, training_session_id: int, rows: list) -> int:
+    """
+    操作ログの行タプルを設定された保存形式（OPERATION_LOG_STORAGE）で追加保存（コミットは呼び出し側で行う）
+
+    Returns:
+        保存した行数
+    """
+    if OPERATION_LOG_STORAGE == 'columnar':
+        return insert_operation_log_blocks(session, training_session_id, rows)
+    inserted = bulk_insert_operation_logs(session, rows)
+    index_operation_log_keyframes(session, training_session_id, [row[1] for row in rows])
+    return inserted
+
+
+def _validate_timestamps(data: dict, keys: tuple):
+    """指定したキーのタイムスタンプが解析できるか検証（エラーメッセージまたはNoneを返す）"""
+    for key in keys:
+        value = data.get(key)
+        if value is None:
+            continue
+        try:
+            parse_timestamp(value)
+        except (AttributeError, TypeError, ValueError):
+            return f'{key} must be an ISO 8601 timestamp'
+    return None
+
+
+def validate_unity_training_session(data) -> str:
+    """
+    Unity形式の訓練セッションを検証
+
+    Args:
+        data: リクエストボディ
+
+    Returns:
+        エラーメッセージ（問題がない場合はNone）
+    """
+    if not isinstance(data, dict):
+        return 'Request body must be a JSON object'
+    if not data.get('session_id'):
+        return 'session_id is required'
+    error = _validate_timestamps(data, ('session_start_time', 'session_end_time'))
+    if error:
+        return error
+    logs = data.get('operation_logs')
+    if logs is not None and isinstance(logs, list):
+        return _validate_operation_logs(logs)
+    return None
+
+
+def _validate_log_timestamp(timestamp):
+    """
+    操作ログ1件のタイムスタンプを検証（エラーメッセージまたはNoneを返す）
+    保存時（取り込みキューの場合はワーカー）に解析できない値はここで拒否する
+    """
+    if isinstance(timestamp, bool) or not isinstance(timestamp, (str, int, float, datetime)):
+        return 'operation log timestamp must be an ISO 8601 string or epoch milliseconds'
+    if isinstance(timestamp, str):
+        try:
+            if timestamp.endswith('Z'):
+                datetime.fromisoformat(timestamp[:-1])
+            else:
+                parse_timestamp(timestamp)
+        except ValueError:
+            return f'operation log timestamp {timestamp!r} is not an ISO 8601 timestamp'
+    elif not isinstance(timestamp, datetime):
+        try:
+            _EPOCH + timedelta(milliseconds=timestamp)
+        except (OverflowError, ValueError):
+            return 'operation log timestamp must be finite epoch milliseconds'
+    return None
+
+
+def _validate_operation_logs(logs: list):
+    """Unity形式の操作ログを検証（エラーメッセージまたはNoneを返す）"""
+    sequences = set()
+    for log_data in logs:
+        if not isinstance(log_data, dict):
+            return 'each operation log must be an object'
+        timestamp = log_data.get('timestamp')
+        if timestamp is None or timestamp == '':
+            if not isinstance(log_data.get('offset_ms'), (int, float)):
+                return 'each operation log requires a timestamp or offset_ms'
+        else:
+            error = _validate_log_timestamp(timestamp)
+            if error:
+                return error
+        sequence = log_data.get('sequence')
+        if (sequence is None) != (logs[0].get('sequence') is None):
+            # 連番の指定がない行はリスト内の位置を連番とするため、指定した行と衝突しないよう混在は受け付けない
+            return 'operation log sequence must be set on every log or on none'
+        if sequence is not None and (not isinstance(sequence, int) or isinstance(sequence, bool) or sequence < 0):
+            return 'operation log sequence must be a non-negative integer'
+        if sequence is not None:
+            # 連番で既存の行と突き合わせるため、同じ連番の行は受け付けない
+            if sequence in sequences:
+                return f'operation log sequence {sequence} is duplicated'
+            sequences.add(sequence)
+    return None
+
+
+def validate_training_session(data) -> str:
+    """
+    旧形式（/api/training-sessions）の訓練セッションを検証
+
+    Args:
+        data: リクエストボディ
+
+    Returns:
+        エラーメッセージ（問題がない場合はNone）
+    """
+    if not isinstance(data, dict):
+        return 'Request body must be a JSON object'
+    if not data.get('sessionId'):
+        return 'sessionId is required'
+    error = _validate_timestamps(data, ('session_start_time', 'session_end_time'))
+    if error:
+        return error
+    logs = data.get('operationLogs', [])
+    if not isinstance(logs, list) or not all(isinstance(log_data, dict) for log_data in logs):
+        return 'operationLogs must be a list of objects'
+    # 連番はリスト内の位置とするため重複しない。タイムスタンプがない行は受信時刻とする
+    for log_data in logs:
+        timestamp = log_data.get('timestamp')
+        if timestamp is None:
+            if log_data.get('offset_ms') is not None:
+                return 'offset_ms is not supported for operationLogs; use timestamp'
+            continue
+        error = _validate_log_timestamp(timestamp)
+        if error:
+            return error
+    return None
+
+
+def persist_unity_training_session(session_db, data: dict) -> dict:
+    """
+    Unity形式の訓練セッションを保存（コミットは呼び出し側で行う）
+    同じsession_idのセッションが存在する場合は更新し、操作ログは連番で突き合わせて差分のみ反映する
+    operation_logs_partial が true の場合、operation_logs は追記分のみとみなし、送信されなかった行は削除しない
+
+    Args:
+        session_db: データベースセッション
+        data: 訓練セッション（操作ログ、AI評価、リプレイデータ、KPIスコアを含む）
+
+    Returns:
+        {'session_id': セッションID, 'id': 訓練セッションの内部ID, 'operation_logs': 差分更新の件数（操作ログを含む場合）}
+    """
+    # セッションIDが存在するか確認
+    existing_session = session_db.query(TrainingSession).filter(
+        TrainingSession.session_id == data.get('session_id')
+    ).first()
+
+    # worker_idのバリデーション（0の場合はNULLに設定）
+    worker_id = data.get('worker_id')
+    if worker_id == 0 or worker_id is None:
+        # worker_idが0またはNoneの場合は、NULLに設定（外部キー制約違反を回避）
+        worker_id = None
+        logger.warning(f'UnityTrainingSession: worker_id=0 or None, setting to NULL for session_id={data.get("session_id")}')
+
+    changed = False
+    if existing_session:
+        # 既存セッションの更新
+        session_obj = existing_session
+        # worker_idが0の場合は更新しない
+        if worker_id is not None:
+            changed |= _assign(session_obj, 'worker_id', worker_id)
+        if session_obj.status == SESSION_STATUS_RECEIVING:
+            # ライブテレメトリ・分割アップロードで作成したセッションを完了
+            if data.get('session_end_time'):
+                changed |= _assign(session_obj, 'session_end_time', parse_session_time(data['session_end_time']))
+            if data.get('duration_seconds') is not None:
+                changed |= _assign(session_obj, 'duration_seconds', data['duration_seconds'])
+            changed |= _assign(session_obj, 'status', data.get('status', '完了'))
+    else:
+        # 新規セッションの作成（開始・終了時刻が必須）
+        if not data.get('session_start_time') or not data.get('session_end_time'):
+            raise ValueError('session_start_time and session_end_time are required for a new session')
+        session_obj = TrainingSession(
+            session_id=data.get('session_id'),
+            worker_id=worker_id,  # NULLまたは有効なworker_id
+            training_menu_id=data.get('training_menu_id'),
+            session_start_time=parse_session_time(data['session_start_time']),
+            session_end_time=parse_session_time(data['session_end_time']),
+            duration_seconds=data.get('duration_seconds'),
+            status=data.get('status', '完了'),
+        )
+        session_db.add(session_obj)
+        session_db.flush()  # IDを取得するためにflush
+
+    changed |= _apply_session_details(session_db, session_obj, data)
+
+    # 操作ログを個別に保存（タイムライン用、再送の場合は追加・変更された行のみ反映）
+    result = {'session_id': session_obj.session_id, 'id': session_obj.id}
+    if 'operation_logs' in data and isinstance(data['operation_logs'], list):
+        rows = build_operation_log_rows(session_obj.id, data['operation_logs'],
+                                        session_start=session_obj.session_start_time)
+        partial = data.get('operation_logs_partial') is True
+        if OPERATION_LOG_STORAGE == 'columnar' and partial:
+            # 列指向ブロックは差分更新できないため、追記分はブロックを追加する
+            inserted = insert_operation_log_blocks(session_db, session_obj.id, rows)
+            result['operation_logs'] = {'inserted': inserted, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+        elif OPERATION_LOG_STORAGE == 'columnar':
+            result['operation_logs'] = replace_operation_log_blocks(session_db, session_obj.id, rows)
+        else:
+            result['operation_logs'] = sync_operation_logs(session_db, session_obj.id, rows, prune=not partial)
+        counts = result['operation_logs']
+        changed |= counts['inserted'] + counts['updated'] + counts['deleted'] > 0
+
+    if existing_session and changed:
+        # 内容が変わらない再送ではバージョンを変えない（リプレイのキャッシュ・ETagを維持）
+        bump_content_version(session_db, session_obj.id)
+    return result
+
+
+def bump_content_version(session_db, training_session_id: int):
+    """訓練セッションの内容のバージョンを加算（リプレイのキャッシュを無効化、コミットは呼び出し側で行う）"""
+    session_db.execute(
+        update(TrainingSession)
+        .where(TrainingSession.id == training_session_id)
+        .values(content_version=func.coalesce(TrainingSession.content_version, 0) + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _assign(obj, name: str, value) -> bool:
+    """属性の値が異なる場合のみ設定し、変更したかどうかを返す"""
+    if getattr(obj, name) == value:
+        return False
+    setattr(obj, name, value)
+    return True
+
+
+def _apply_session_details(session_db, session_obj: TrainingSession, data: dict) -> bool:
+    """
+    AI評価、リプレイデータ、KPIスコアを訓練セッションに保存
+
+    Returns:
+        保存済みの内容から変わったかどうか（content_version の加算の判定に使用）
+    """
+    changed = False
+    # AI評価、リプレイデータを保存
+    if 'ai_evaluation' in data:
+        changed |= _assign(session_obj, 'ai_evaluation_json', json.dumps(data['ai_evaluation']))
+
+    if 'replay_data' in data:
+        changed |= _assign(session_obj, 'replay_data_json', json.dumps(data['replay_data']))
+
+    # KPIスコアを保存
+    if 'kpi_scores' in data:
+        kpi_data = data['kpi_scores']
+        existing_kpi = session_db.query(KPIScore).filter(
+            KPIScore.training_session_id == session_obj.id
+        ).first()
+
+        if existing_kpi:
+            # 既存KPIの更新
+            kpi = existing_kpi
+        else:
+            # 新規KPIの作成
+            kpi = KPIScore(training_session_id=session_obj.id)
+            session_db.add(kpi)
+            changed = True
+
+        changed |= _assign(kpi, 'safety_score', kpi_data.get('safety_score'))
+        changed |= _assign(kpi, 'error_count', kpi_data.get('error_count', 0))
+        changed |= _assign(kpi, 'procedure_compliance_rate', kpi_data.get('procedure_compliance_rate'))
+        changed |= _assign(kpi, 'work_time_seconds', kpi_data.get('work_time_seconds'))
+        changed |= _assign(kpi, 'achievement_rate', kpi_data.get('achievement_rate'))
+        changed |= _assign(kpi, 'accuracy_score', kpi_data.get('accuracy_score'))
+        changed |= _assign(kpi, 'efficiency_score', kpi_data.get('efficiency_score'))
+        changed |= _assign(kpi, 'overall_score', kpi_data.get('overall_score'))
+        changed |= _assign(kpi, 'notes', kpi_data.get('notes'))
+    return changed
+
+
+def persist_training_session(session, data: dict) -> dict:
+    """
+    旧形式（/api/training-sessions）の訓練セッションを保存（コミットは呼び出し側で行う）
+
+    Args:
+        session: データベースセッション
+        data: 訓練セッション（KPI、操作ログを含む）
+
+    Returns:
+        {'session_id': 訓練セッションの内部ID}
+    """
+    # 訓練セッション作成
+    training_session = TrainingSession(
+        session_id=data.get('sessionId'),
+        worker_id=data.get('traineeId'),
+        training_menu_id=data.get('training_menu_id'),
+        session_start_time=parse_session_time(data['session_start_time']) if data.get('session_start_time') else datetime.now(),
+        session_end_time=parse_session_time(data['session_end_time']) if data.get('session_end_time') else datetime.now(),
+        duration_seconds=data.get('duration_seconds'),
+        status=data.get('status', '完了'),
+    )
+    session.add(training_session)
+    session.flush()
+
+    # KPIスコア保存
+    kpi_data = data.get('kpi', {})
+    if kpi_data:
+        kpi_score = KPIScore(
+            training_session_id=training_session.id,
+            safety_score=kpi_data.get('safetyScore'),
+            error_count=kpi_data.get('errorCount', 0),
+            procedure_compliance_rate=kpi_data.get('procedureComplianceRate'),
+            work_time_seconds=kpi_data.get('workTimeSeconds'),
+            achievement_rate=kpi_data.get('achievementRate'),
+            accuracy_score=kpi_data.get('accuracyScore'),
+            efficiency_score=kpi_data.get('efficiencyScore'),
+            overall_score=kpi_data.get('overallScore'),
+            notes=kpi_data.get('notes'),
+        )
+        session.add(kpi_score)
+
+    # 操作ログ保存
+    operation_logs = data.get('operationLogs', [])
+    store_operation_logs(session, training_session.id, build_legacy_operation_log_rows(training_session.id, operation_logs))
+
+    return {'session_id': training_session.id}
+
+
+def validate_chunked_session_open(data) -> str:
+    """
+    分割アップロードの開始リクエストを検証
+
+    Args:
+        data: リクエストボディ
+
+    Returns:
+        エラーメッセージ（問題がない場合はNone）
+    """
+    if not isinstance(data, dict):
+        return 'Request body must be a JSON object'
+    if not data.get('session_id'):
+        return 'session_id is required'
+    if not data.get('session_start_time'):
+        return 'session_start_time is required'
+    return _validate_timestamps(data, ('session_start_time',))
+
+
+def validate_operation_log_chunk(data) -> str:
+    """
+    分割アップロードのチャンク（operation_logsを含むオブジェクト、または操作ログの配列）を検証
+
+    Returns:
+        エラーメッセージ（問題がない場合はNone）
+    """
+    logs = data.get('operation_logs') if isinstance(data, dict) else data
+    if not isinstance(logs, list):
+        return 'operation_logs must be a list'
+    return _validate_operation_logs(logs)
+
+
+def open_chunked_session(session_db, data: dict) -> dict:
+    """
+    分割アップロードを開始（コミットは呼び出し側で行う）
+    訓練セッションを受信中の状態で作成する。同じsession_idのセッションが存在する場合はそれを再開する
+
+    Args:
+        session_db: データベースセッション
+        data: 訓練セッションの基本情報（session_id, worker_id, training_menu_id, session_start_time）
+
+    Returns:
+        {'session_id': セッションID, 'id': 訓練セッションの内部ID, 'received_chunks': 受信済みの連番のリスト}
+    """
+    session_obj = session_db.query(TrainingSession).filter(
+        TrainingSession.session_id == data['session_id']
+    ).first()
+    if session_obj is None:
+        start_time = parse_session_time(data['session_start_time'])
+        session_obj = TrainingSession(
+            session_id=data['session_id'],
+            worker_id=data.get('worker_id') or None,  # 0の場合はNULL（外部キー制約違反を回避）
+            training_menu_id=data.get('training_menu_id'),
+            session_start_time=start_time,
+            session_end_time=start_time,  # 終了時刻は完了時に更新
+            status=SESSION_STATUS_RECEIVING,
+        )
+        session_db.add(session_obj)
+        session_db.flush()
+    return {
+        'session_id': session_obj.session_id,
+        'id': session_obj.id,
+        'received_chunks': received_chunk_sequences(session_db, session_obj.id),
+    }
+
+
+def received_chunk_sequences(session_db, training_session_id: int) -> list:
+    """受信済みのチャンクの連番を昇順で取得"""
+    rows = session_db.query(OperationLogChunk.sequence).filter(
+        OperationLogChunk.training_session_id == training_session_id
+    ).order_by(OperationLogChunk.sequence).all()
+    return [sequence for sequence, in rows]
+
+
+def append_operation_log_chunk(session_db, training_session_id: int, sequence: int, logs: list,
+                               session_start: datetime = None) -> dict:
+    """
+    操作ログのチャンクを保存（コミットは呼び出し側で行う）
+    受信記録を先に作成するため、同じ連番のチャンクが同時に送信された場合は一意制約違反（IntegrityError）になる
+
+    Args:
+        session_db: データベースセッション
+        training_session_id: 訓練セッションの内部ID
+        sequence: チャンクの連番
+        logs: Unity形式の操作ログのリスト
+        session_start: 訓練セッションの開始時刻（offset_ms 形式のタイムスタンプの基準）
+
+    Returns:
+        {'sequence': 連番, 'row_count': 件数, 'duplicate': 受信済みのチャンクだったかどうか}
+    """
+    existing = session_db.query(OperationLogChunk).filter(
+        OperationLogChunk.training_session_id == training_session_id,
+        OperationLogChunk.sequence == sequence
+    ).first()
+    if existing:
+        # 再送されたチャンクは保存しない
+        return {'sequence': sequence, 'row_count': existing.row_count, 'duplicate': True}
+
+    session_db.add(OperationLogChunk(
+        training_session_id=training_session_id,
+        sequence=sequence,
+        row_count=len(logs),
+    ))
+    session_db.flush()
+    rows = build_operation_log_rows(training_session_id, logs, implicit_sequence=False, session_start=session_start)
+    store_operation_logs(session_db, training_session_id, rows)
+    bump_content_version(session_db, training_session_id)
+    return {'sequence': sequence, 'row_count': len(logs), 'duplicate': False}
+
+
+def append_operation_log_batches(session_db, training_session_id: int, batches: list,
+                                 session_start: datetime = None) -> dict:
+    """
+    連番付きの操作ログのバッチをまとめて保存（ライブテレメトリ用、コミットは呼び出し側で行う）
+    分割アップロードのチャンクと同じ受信記録を使用し、受信済みの連番のバッチは保存しない
+
+    Args:
+        session_db: データベースセッション
+        training_session_id: 訓練セッションの内部ID
+        batches: (連番, Unity形式の操作ログのリスト) のリスト
+        session_start: 訓練セッションの開始時刻（offset_ms 形式のタイムスタンプの基準）
+
+    Returns:
+        {'batches': 保存したバッチ数, 'duplicates': 受信済みだったバッチ数, 'rows': 保存した行数}
+    """
+    sequences = {sequence for sequence, _ in batches}
+    received = {
+        sequence for sequence, in session_db.query(OperationLogChunk.sequence).filter(
+            OperationLogChunk.training_session_id == training_session_id,
+            OperationLogChunk.sequence.in_(sequences)
+        )
+    }
+    new_batches = []
+    for sequence, logs in batches:
+        if sequence in received:
+            continue
+        received.add(sequence)
+        new_batches.append((sequence, logs))
+    if not new_batches:
+        return {'batches': 0, 'duplicates': len(batches), 'rows': 0}
+
+    now = datetime.now()
+    session_db.execute(insert(OperationLogChunk), [{
+        'training_session_id': training_session_id,
+        'sequence': sequence,
+        'row_count': len(logs),
+        'created_at': now,
+    } for sequence, logs in new_batches])
+    logs = [log_data for _, batch_logs in new_batches for log_data in batch_logs]
+    rows = build_operation_log_rows(training_session_id, logs, implicit_sequence=False, session_start=session_start)
+    store_operation_logs(session_db, training_session_id, rows)
+    bump_content_version(session_db, training_session_id)
+    return {'batches': len(new_batches), 'duplicates': len(batches) - len(new_batches), 'rows': len(rows)}
+
+
+def finalize_chunked_session(session_db, session_obj: TrainingSession, data: dict) -> dict:
+    """
+    分割アップロードを完了（コミットは呼び出し側で行う）
+    終了時刻、状態、AI評価、リプレイデータ、KPIスコアを保存する
+
+    Args:
+        session_db: データベースセッション
+        session_obj: 訓練セッション
+        data: 完了時の情報（session_end_time, duration_seconds, status, ai_evaluation, replay_data, kpi_scores）
+
+    Returns:
+        {'session_id': セッションID, 'id': 訓練セッションの内部ID, 'chunk_count': チャンク数, 'operation_log_count': 操作ログ件数}
+    """
+    if data.get('session_end_time'):
+        session_obj.session_end_time = parse_session_time(data['session_end_time'])
+    if data.get('duration_seconds') is not None:
+        session_obj.duration_seconds = data['duration_seconds']
+    session_obj.status = data.get('status', '完了')
+    _apply_session_details(session_db, session_obj, data)
+    bump_content_version(session_db, session_obj.id)
+
+    chunk_count, row_count = session_db.query(
+        func.count(OperationLogChunk.id), func.coalesce(func.sum(OperationLogChunk.row_count), 0)
+    ).filter(OperationLogChunk.training_session_id == session_obj.id).one()
+    return {
+        'session_id': session_obj.session_id,
+        'id': session_obj.id,
+        'chunk_count': chunk_count,
+        'operation_log_count': int(row_count),
+    }
+
+
+# 取り込みキューのハンドラ（種別 → 保存関数）
+INGESTION_HANDLERS = {
+    INGESTION_KIND_UNITY: persist_unity_training_session,
+    INGESTION_KIND_LEGACY: persist_training_session,
+}
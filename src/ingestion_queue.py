@@ -0,0 +1,412 @@
+"""
+取り込みキューモジュール（write-behind）
+訓練セッションの受信データをローカルのSQLiteファイル（スプール）に永続化してすぐに応答し、
+バックグラウンドワーカーがバッチ単位でデータベースへ書き込む
+スプールはプロセスをまたいで共有でき、処理中のデータはワーカーがリース（処理権の有効期限）を更新し続け、
+リースが切れたデータ（ワーカーが停止したもの）だけが再処理される
+"""
+
+import os
+import json
+import time
+import uuid
+import base64
+import socket
+import sqlite3
+import logging
+import tempfile
+import threading
+from datetime import datetime
+from contextlib import closing
+
+
+# スプールファイルのパス（既定は一時ディレクトリ、本番環境では永続化されるボリューム上のパスを指定する）
+INGESTION_QUEUE_PATH = os.getenv(
+    'INGESTION_QUEUE_PATH', os.path.join(tempfile.gettempdir(), 'job_assistance', 'ingestion_queue.db')
+)
+
+# バックグラウンドワーカー数（0の場合はこのプロセスでは書き込まない）
+INGESTION_WORKERS = int(os.getenv('INGESTION_WORKERS', '1'))
+
+# ワーカーが1回のトランザクションで書き込む最大件数
+INGESTION_BATCH_SIZE = int(os.getenv('INGESTION_BATCH_SIZE', '10'))
+
+# 書き込みに失敗した場合の最大試行回数
+INGESTION_MAX_ATTEMPTS = int(os.getenv('INGESTION_MAX_ATTEMPTS', '3'))
+
+# キューが空の場合の確認間隔（秒）
+INGESTION_POLL_INTERVAL = float(os.getenv('INGESTION_POLL_INTERVAL', '0.5'))
+
+# 処理中のデータのリースの期間（秒、ワーカーはこの3分の1の間隔で更新し、期限が切れたデータは再処理される）
+INGESTION_LEASE_SECONDS = float(os.getenv('INGESTION_LEASE_SECONDS', '60'))
+
+# 完了したチケットを保持する時間（時間）
+INGESTION_RETENTION_HOURS = float(os.getenv('INGESTION_RETENTION_HOURS', '24'))
+
+# チケットの状態
+STATUS_QUEUED = 'queued'
+STATUS_PROCESSING = 'processing'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+
+logger = logging.getLogger(__name__)
+
+
+def _encode_payload_value(value):
+    """
+    JSONで表現できない値を変換（MessagePack形式のリクエストボディ用）
+    datetimeはISO 8601文字列、バイト列は 'msgpack:' プレフィックス付きのBase64文字列にする
+    """
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return 'msgpack:' + base64.b64encode(value).decode('ascii')
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+class IngestionQueue:
+    """
+    SQLiteファイルを使用した永続キュー
+    登録したデータはコミット（fsync）後にチケットIDを返すため、プロセスが停止しても失われない
+    """
+
+    def __init__(self, path: str = None):
+        """
+        初期化（スプールファイルとテーブルを作成）
+
+        Args:
+            path: スプールファイルのパス（省略時はINGESTION_QUEUE_PATH）
+        """
+        self.path = path or INGESTION_QUEUE_PATH
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                    ticket TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    owner TEXT,
+                    lease_expires_at REAL
+                )
+            """)
+            # リースの列がない古いスプールファイルに列を追加
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(ingestion_jobs)')}
+            for column, column_type in (('owner', 'TEXT'), ('lease_expires_at', 'REAL')):
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE ingestion_jobs ADD COLUMN {column} {column_type}')
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS ix_ingestion_jobs_status ON ingestion_jobs (status, created_at)'
+            )
+
+    def _connect(self):
+        """スプールファイルへの接続を作成（自動コミット、トランザクションは明示的に開始）"""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA synchronous=FULL')
+        return conn
+
+    def enqueue(self, kind: str, payload: dict) -> str:
+        """
+        データをキューに登録
+
+        Args:
+            kind: データの種別（ワーカーのハンドラ選択に使用）
+            payload: 検証済みのリクエストボディ
+
+        Returns:
+            チケットID
+        """
+        ticket = uuid.uuid4().hex
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                'INSERT INTO ingestion_jobs (ticket, kind, payload, status, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (ticket, kind, json.dumps(payload, ensure_ascii=False, default=_encode_payload_value),
+                 STATUS_QUEUED, now, now)
+            )
+        return ticket
+
+    def claim(self, limit: int, owner: str = None, lease_seconds: float = None) -> list:
+        """
+        未処理のデータを古い順に取得して処理中にする（複数プロセスから同時に呼び出しても重複しない）
+
+        Args:
+            limit: 最大件数
+            owner: 処理するワーカーの識別子（リースの更新・完了の記録に使用）
+            lease_seconds: リースの期間（省略時はINGESTION_LEASE_SECONDS）
+
+        Returns:
+            (チケットID, 種別, データ, 試行回数) のリスト
+        """
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = conn.execute(
+                    'SELECT ticket, kind, payload, attempts FROM ingestion_jobs '
+                    'WHERE status = ? ORDER BY created_at LIMIT ?',
+                    (STATUS_QUEUED, limit)
+                ).fetchall()
+                now = time.time()
+                lease_expires_at = now + (INGESTION_LEASE_SECONDS if lease_seconds is None else lease_seconds)
+                conn.executemany(
+                    'UPDATE ingestion_jobs SET status = ?, attempts = attempts + 1, updated_at = ?, '
+                    'owner = ?, lease_expires_at = ? WHERE ticket = ?',
+                    [(STATUS_PROCESSING, now, owner, lease_expires_at, ticket) for ticket, _, _, _ in rows]
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return [(ticket, kind, json.loads(payload), attempts + 1) for ticket, kind, payload, attempts in rows]
+
+    def renew(self, tickets: list, owner: str = None, lease_seconds: float = None) -> int:
+        """
+        処理中のデータのリースを延長（処理中のワーカーが定期的に呼び出す）
+
+        Args:
+            tickets: チケットIDのリスト
+            owner: 処理するワーカーの識別子（claim() で指定したもの）
+            lease_seconds: リースの期間（省略時はINGESTION_LEASE_SECONDS）
+
+        Returns:
+            延長した件数（リースが切れて他のワーカーに渡ったデータは延長しない）
+        """
+        if not tickets:
+            return 0
+        lease_expires_at = time.time() + (INGESTION_LEASE_SECONDS if lease_seconds is None else lease_seconds)
+        with closing(self._connect()) as conn:
+            cursor = conn.executemany(
+                'UPDATE ingestion_jobs SET lease_expires_at = ? WHERE ticket = ? AND status = ? AND owner IS ?',
+                [(lease_expires_at, ticket, STATUS_PROCESSING, owner) for ticket in tickets]
+            )
+            return cursor.rowcount
+
+    def complete(self, ticket: str, result: dict = None):
+        """書き込み完了にする（データ本体は削除し、結果のみ保持）"""
+        with closing(self._connect()) as conn:
+            conn.execute(
+                'UPDATE ingestion_jobs SET status = ?, payload = NULL, result = ?, error = NULL, updated_at = ?, '
+                'lease_expires_at = NULL WHERE ticket = ?',
+                (STATUS_COMPLETED, json.dumps(result, ensure_ascii=False) if result is not None else None,
+                 time.time(), ticket)
+            )
+
+    def fail(self, ticket: str, error: str, attempts: int, max_attempts: int = None):
+        """
+        書き込み失敗を記録（試行回数が上限未満の場合は再度キューに戻す）
+
+        Args:
+            ticket: チケットID
+            error: エラーメッセージ
+            attempts: これまでの試行回数
+            max_attempts: 最大試行回数（省略時はINGESTION_MAX_ATTEMPTS）
+        """
+        max_attempts = max_attempts or INGESTION_MAX_ATTEMPTS
+        status = STATUS_FAILED if attempts >= max_attempts else STATUS_QUEUED
+        with closing(self._connect()) as conn:
+            conn.execute(
+                'UPDATE ingestion_jobs SET status = ?, error = ?, updated_at = ?, lease_expires_at = NULL '
+                'WHERE ticket = ?',
+                (status, error, time.time(), ticket)
+            )
+
+    def recover(self) -> int:
+        """
+        処理中のまま停止したデータをキューに戻す
+        処理中のワーカーはリースを更新し続けるため、リースの期限が切れたもの（ワーカーが停止したもの）だけを対象にする
+
+        Returns:
+            キューに戻した件数
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                'UPDATE ingestion_jobs SET status = ?, updated_at = ?, owner = NULL, lease_expires_at = NULL '
+                'WHERE status = ? AND COALESCE(lease_expires_at, updated_at + ?) < ?',
+                (STATUS_QUEUED, now, STATUS_PROCESSING, INGESTION_LEASE_SECONDS, now)
+            )
+            return cursor.rowcount
+
+    def purge(self, retention_hours: float = None) -> int:
+        """
+        保持期間を過ぎた完了済みのチケットを削除
+
+        Returns:
+            削除した件数
+        """
+        retention_hours = INGESTION_RETENTION_HOURS if retention_hours is None else retention_hours
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                'DELETE FROM ingestion_jobs WHERE status = ? AND updated_at < ?',
+                (STATUS_COMPLETED, time.time() - retention_hours * 3600)
+            )
+            return cursor.rowcount
+
+    def status(self, ticket: str) -> dict:
+        """
+        チケットの状態を取得
+
+        Returns:
+            状態の辞書（存在しない場合はNone）
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                'SELECT ticket, kind, status, attempts, result, error, created_at, updated_at '
+                'FROM ingestion_jobs WHERE ticket = ?',
+                (ticket,)
+            ).fetchone()
+        if row is None:
+            return None
+        ticket, kind, status, attempts, result, error, created_at, updated_at = row
+        return {
+            'ticket': ticket,
+            'kind': kind,
+            'status': status,
+            'attempts': attempts,
+            'result': json.loads(result) if result else None,
+            'error': error,
+            'created_at': created_at,
+            'updated_at': updated_at,
+        }
+
+
+class IngestionWorkerPool:
+    """
+    取り込みキューのバックグラウンドワーカー
+    キューからまとめて取り出したデータを1トランザクションで書き込み、
+    失敗した場合は1件ずつ書き込み直して失敗したデータだけを再試行に回す
+    """
+
+    def __init__(self, ingestion_queue: IngestionQueue, db, handlers: dict,
+                 workers: int = None, batch_size: int = None):
+        """
+        初期化
+
+        Args:
+            ingestion_queue: 取り込みキュー
+            db: データベースインスタンス
+            handlers: 種別 → 保存関数 handler(session, payload) の辞書（戻り値はチケットの結果として保存）
+            workers: ワーカースレッド数（省略時はINGESTION_WORKERS）
+            batch_size: 1回のトランザクションで書き込む最大件数（省略時はINGESTION_BATCH_SIZE）
+        """
+        self.queue = ingestion_queue
+        self.db = db
+        self.handlers = handlers
+        self.workers = INGESTION_WORKERS if workers is None else workers
+        self.batch_size = batch_size or INGESTION_BATCH_SIZE
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._active = set()  # 処理中のチケットID（リースの更新対象）
+        self._active_lock = threading.Lock()
+        self._threads = []
+        self._stopped = threading.Event()
+
+    def _write(self, jobs: list) -> list:
+        """データを1トランザクションで書き込み、結果のリストを返す"""
+        session = self.db.get_session()
+        try:
+            results = [self.handlers[kind](session, payload) for _, kind, payload, _ in jobs]
+            session.commit()
+            return results
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def process_batch(self, jobs: list):
+        """
+        取り出したデータを書き込み
+
+        Args:
+            jobs: IngestionQueue.claim() の戻り値
+        """
+        try:
+            results = self._write(jobs)
+        except Exception as e:
+            if len(jobs) == 1:
+                ticket, kind, _, attempts = jobs[0]
+                logger.error(f'取り込みエラー ({kind} チケット: {ticket}): {e}')
+                self.queue.fail(ticket, str(e), attempts)
+                return
+            # まとめて書き込めなかった場合は1件ずつ書き込み直す
+            for job in jobs:
+                self.process_batch([job])
+            return
+        for (ticket, _, _, _), result in zip(jobs, results):
+            self.queue.complete(ticket, result)
+
+    def process_pending(self) -> int:
+        """
+        キューに溜まったデータをすべて書き込み
+
+        Returns:
+            処理した件数
+        """
+        processed = 0
+        while True:
+            jobs = self.queue.claim(self.batch_size, self.owner)
+            if not jobs:
+                return processed
+            tickets = {ticket for ticket, _, _, _ in jobs}
+            with self._active_lock:
+                self._active |= tickets
+            try:
+                self.process_batch(jobs)
+            finally:
+                with self._active_lock:
+                    self._active -= tickets
+            processed += len(jobs)
+
+    def _heartbeat(self):
+        """処理中のデータのリースを定期的に延長（処理に時間がかかっても他のワーカーに再処理させない）"""
+        while not self._stopped.wait(INGESTION_LEASE_SECONDS / 3):
+            with self._active_lock:
+                tickets = list(self._active)
+            try:
+                self.queue.renew(tickets, self.owner)
+            except Exception as e:
+                logger.error(f'取り込みキューのリース更新エラー: {e}')
+
+    def _run(self):
+        """バックグラウンドでキューを処理"""
+        last_maintenance = 0.0
+        while not self._stopped.is_set():
+            try:
+                if time.time() - last_maintenance > 60:
+                    self.queue.recover()
+                    self.queue.purge()
+                    last_maintenance = time.time()
+                if not self.process_pending():
+                    self._stopped.wait(INGESTION_POLL_INTERVAL)
+            except Exception as e:
+                logger.error(f'取り込みキューの処理エラー: {e}')
+                self._stopped.wait(INGESTION_POLL_INTERVAL)
+
+    def start(self):
+        """ワーカースレッドを開始"""
+        if self._threads or self.workers <= 0:
+            return
+        self._stopped.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'ingestion-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name='ingestion-heartbeat', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self):
+        """ワーカースレッドを停止"""
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
@@ -24,6 +24,10 @@ def main():
     db = database.Database()
     db.init_database()
     
+    # 差分マッチング（求人・応募者の登録・更新時に該当行の組み合わせのみ再計算）
+    rematch_queue = matching.RematchQueue(matching.MatchingService(db))
+    rematch_queue.start()
+    
     while True:
         print("\nメニュー:")
         print("1. 求人情報管理")
@@ -36,6 +40,7 @@ def main():
         choice = input("\n選択してください (0-5): ").strip()
         
         if choice == "0":
+            rematch_queue.stop()
             print("終了します。")
             break
         elif choice == "1":
@@ -2,7 +2,124 @@
 マッチング機能モジュール
 """
 
+import os
+import heapq
+import itertools
+import queue
+import threading
+import logging
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy.dialects import postgresql, sqlite
 from .database import Database, Applicant, JobPosting, Matching, Application
+from .skill_index import (
+    SkillIndex, get_skill_index, add_change_listener, SCORING_OVERLAP, SCORING_IDF, SCORING_MODES
+)
+from .matching_engine import SparseMatchEngine, SCIPY_AVAILABLE
+
+
+# マッチング結果を一括保存する際の1バッチあたりの件数
+MATCHING_SAVE_BATCH_SIZE = int(os.getenv('MATCHING_SAVE_BATCH_SIZE', '1000'))
+
+# 全マッチングの並列実行プロセス数（1の場合は直列実行）
+MATCHING_WORKERS = int(os.getenv('MATCHING_WORKERS', '1'))
+
+# 差分マッチングで変更をまとめて処理するまでの待ち時間（秒）
+MATCHING_REMATCH_DELAY = float(os.getenv('MATCHING_REMATCH_DELAY', '0.5'))
+
+# スコア計算方式の既定値（overlap: 共通スキル数の割合, idf: スキルの希少度で重み付け）
+MATCHING_SCORING = os.getenv('MATCHING_SCORING', SCORING_OVERLAP)
+
+logger = logging.getLogger(__name__)
+
+# 並列マッチングのワーカープロセスが保持する求人側インデックス（読み取り専用）
+_shard_index = None
+
+
+def _match_sort_key(match):
+    """シャードの結果 (スコア, 応募者ID, 求人ID, ...) の並び順（スコアの降順、同点は応募者ID・求人ID順）"""
+    return (-match[0], match[1], match[2])
+
+
+def _score_matches(index: SkillIndex, applicant_ids: list, limit: int = None,
+                   scoring: str = SCORING_OVERLAP) -> list:
+    """
+    指定した応募者と全求人のマッチング結果を計算
+    numpy/scipyが利用可能な場合は疎行列エンジンで一括計算し、
+    それ以外はスキル転置インデックスを使用してスキルを共有する組み合わせのみをスコアリングする
+    
+    Args:
+        index: スキル転置インデックス
+        applicant_ids: 対象の応募者ID（昇順）
+        limit: 上位何件を返すか（省略時は全件）
+        scoring: スコア計算方式
+    
+    Returns:
+        マッチング結果のリスト（スコアの降順、同点は応募者ID・求人ID順）
+    """
+    if SCIPY_AVAILABLE:
+        with index._lock:
+            applicant_skills = {i: index.applicant_skills[i] for i in applicant_ids if i in index.applicant_skills}
+            if scoring == SCORING_IDF:
+                idf, job_weights = index.idf_weights()
+                engine = SparseMatchEngine(applicant_skills, dict(index.job_skills), job_weights, idf)
+            else:
+                engine = SparseMatchEngine(applicant_skills, dict(index.job_skills), dict(index.job_skill_counts))
+        matched_applicant_ids, job_ids, scores = engine.score_all()
+        if limit is not None:
+            matched_applicant_ids, job_ids, scores = matched_applicant_ids[:limit], job_ids[:limit], scores[:limit]
+        return [{
+            'applicant_id': applicant_id,
+            'job_posting_id': job_id,
+            'score': score,
+            'matched_skills': index.matched_skills(applicant_id, job_id)
+        } for applicant_id, job_id, score in zip(matched_applicant_ids.tolist(), job_ids.tolist(), scores.tolist())]
+    
+    matches = []
+    for applicant_id in applicant_ids:
+        overlaps = index.jobs_for_applicant(applicant_id, scoring)
+        for job_id in sorted(overlaps):
+            score = index.score(job_id, overlaps[job_id], scoring)
+            if score > 0:
+                matches.append({
+                    'applicant_id': applicant_id,
+                    'job_posting_id': job_id,
+                    'score': score,
+                    'matched_skills': index.matched_skills(applicant_id, job_id)
+                })
+    
+    # スコア順にソート（同点は応募者ID・求人ID順）
+    matches.sort(key=lambda x: x['score'], reverse=True)
+    return matches[:limit] if limit is not None else matches
+
+
+def _init_shard_worker(jobs_snapshot):
+    """並列マッチングのワーカープロセスを初期化（求人側インデックスを受け取る）"""
+    global _shard_index
+    _shard_index = SkillIndex.from_jobs_snapshot(jobs_snapshot)
+
+
+def _score_shard(applicant_items, limit, scoring):
+    """
+    並列マッチングのワーカー処理（応募者1シャード分）
+    
+    Args:
+        applicant_items: (応募者ID, スキル集合) のリスト（応募者ID昇順）
+        limit: シャードごとに返す上位件数（省略時は全件）
+        scoring: スコア計算方式
+    
+    Returns:
+        (スコア, 応募者ID, 求人ID, マッチしたスキル) のリスト（スコアの降順、同点は応募者ID・求人ID順）
+    """
+    for applicant_id, skill_set in applicant_items:
+        _shard_index.set_applicant_skills(applicant_id, skill_set)
+    try:
+        matches = _score_matches(_shard_index, [applicant_id for applicant_id, _ in applicant_items], limit, scoring)
+        # プロセス間の転送量を減らすためタプルで返す
+        return [(m['score'], m['applicant_id'], m['job_posting_id'], m['matched_skills']) for m in matches]
+    finally:
+        for applicant_id, _ in applicant_items:
+            _shard_index.remove_applicant(applicant_id)
 
 
 class MatchingService:
@@ -16,73 +133,201 @@ class MatchingService:
             db: データベースインスタンス
         """
         self.db = db
+        # スキル転置インデックス（プロセス内で共有され、変更時に差分更新される）
+        self.index = get_skill_index(db)
+    
+    @staticmethod
+    def _resolve_scoring(scoring: str = None) -> str:
+        """
+        スコア計算方式を決定
+        
+        Args:
+            scoring: スコア計算方式（省略時はMATCHING_SCORING）
+        
+        Returns:
+            スコア計算方式
+        
+        Raises:
+            ValueError: 未知の計算方式が指定された場合
+        """
+        scoring = scoring or MATCHING_SCORING
+        if scoring not in SCORING_MODES:
+            raise ValueError(f"scoring must be one of: {', '.join(SCORING_MODES)}")
+        return scoring
     
-    def _calculate_match_score(self, applicant_skills: str, job_skills: str) -> float:
+    def _calculate_match_score(self, applicant_skills: str, job_skills: str, scoring: str = None) -> float:
         """
         マッチングスコアを計算
         
         Args:
             applicant_skills: 応募者のスキル（カンマ区切り）
             job_skills: 求人の必要スキル（カンマ区切り）
+            scoring: スコア計算方式（省略時はMATCHING_SCORING）
+                     idfの場合はインデックス構築済みのIDFを使用する
         
         Returns:
             マッチングスコア (0-100)
         """
+        scoring = self._resolve_scoring(scoring)
         if not applicant_skills or not job_skills:
             return 0.0
         
-        applicant_skill_list = [s.strip().lower() for s in applicant_skills.split(',') if s.strip()]
-        job_skill_list = [s.strip().lower() for s in job_skills.split(',') if s.strip()]
+        # スキル名を正規スキルIDに変換（別名・表記揺れを同一スキルとして扱う）
+        applicant_skill_ids = self.index.normalizer.to_id_set(applicant_skills)
+        job_skill_ids = self.index.normalizer.to_id_set(job_skills)
         
-        if not applicant_skill_list or not job_skill_list:
+        if not applicant_skill_ids or not job_skill_ids:
             return 0.0
         
         # マッチしたスキル数を計算
-        matched_skills = set(applicant_skill_list) & set(job_skill_list)
+        matched_skills = applicant_skill_ids & job_skill_ids
         
-        # スコア計算: (マッチしたスキル数 / 必要スキル数) * 100
-        match_score = (len(matched_skills) / len(job_skill_list)) * 100
+        if scoring == SCORING_IDF:
+            # スコア計算: (マッチしたスキルのIDF合計 / 必要スキルのIDF合計) * 100
+            match_score = (sum(self.index.skill_idf(s) for s in matched_skills)
+                           / sum(self.index.skill_idf(s) for s in job_skill_ids)) * 100
+        else:
+            # スコア計算: (マッチしたスキル数 / 必要スキル数) * 100
+            # 必要スキル数は正規スキルIDの種類数（重複・別名で記載されたスキルは1件として数える）
+            match_score = (len(matched_skills) / len(job_skill_ids)) * 100
         
         return min(match_score, 100.0)
     
-    def match_all(self):
-        """全応募者と全求人をマッチング"""
+    def compute_matches(self, session, workers: int = None, limit: int = None, scoring: str = None) -> list:
+        """
+        全応募者と全求人のマッチング結果を計算
+        
+        Args:
+            session: データベースセッション
+            workers: 並列実行するプロセス数（省略時はMATCHING_WORKERS、1以下の場合は直列実行）
+            limit: 上位何件を返すか（省略時は全件）
+            scoring: スコア計算方式（省略時はMATCHING_SCORING）
+        
+        Returns:
+            マッチング結果のリスト（スコアの降順、同点は応募者ID・求人ID順）
+            並列実行時も直列実行と同一の結果を返す
+        """
+        scoring = self._resolve_scoring(scoring)
+        self.index.ensure_loaded(session)
+        workers = MATCHING_WORKERS if workers is None else workers
+        applicant_ids = self.index.applicant_ids()
+        
+        if workers <= 1 or len(applicant_ids) < workers:
+            return _score_matches(self.index, applicant_ids, limit, scoring)
+        
+        # 応募者をID順の連続したシャードに分割し、各プロセスに求人側インデックスのスナップショットを配布
+        with self.index._lock:
+            applicant_items = [(i, self.index.applicant_skills[i]) for i in applicant_ids if i in self.index.applicant_skills]
+        shard_count = workers * 4
+        shard_size = -(-len(applicant_items) // shard_count)
+        shards = [applicant_items[i:i + shard_size] for i in range(0, len(applicant_items), shard_size)]
+        
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_shard_worker,
+                                 initargs=(self.index.snapshot_jobs(scoring),)) as executor:
+            partial_results = list(executor.map(_score_shard, shards, [limit] * len(shards),
+                                                [scoring] * len(shards)))
+        
+        # 各シャードの結果（ソート済み）をマージ
+        merged = heapq.merge(*partial_results, key=_match_sort_key)
+        if limit is not None:
+            merged = itertools.islice(merged, limit)
+        return [{
+            'applicant_id': applicant_id,
+            'job_posting_id': job_id,
+            'score': score,
+            'matched_skills': matched_skills
+        } for score, applicant_id, job_id, matched_skills in merged]
+    
+    def top_k(self, job_id: int, k: int = 10, session=None, scoring: str = None) -> list:
+        """
+        求人に対するスコア上位K件の応募者候補を取得
+        
+        Args:
+            job_id: 求人ID
+            k: 取得件数
+            session: データベースセッション（省略時は内部で取得）
+            scoring: スコア計算方式（省略時はMATCHING_SCORING）
+        
+        Returns:
+            マッチング結果のリスト（スコアの降順）
+        """
+        scoring = self._resolve_scoring(scoring)
+        own_session = session is None
+        session = session or self.db.get_session()
+        try:
+            self.index.ensure_loaded(session)
+            return [{
+                'applicant_id': applicant_id,
+                'job_posting_id': job_id,
+                'score': score,
+                'matched_skills': self.index.matched_skills(applicant_id, job_id)
+            } for applicant_id, score in self.index.top_applicants_for_job(job_id, k, scoring)]
+        finally:
+            if own_session:
+                session.close()
+    
+    def top_k_jobs(self, applicant_id: int, k: int = 10, session=None, scoring: str = None) -> list:
+        """
+        応募者に対するスコア上位K件の求人候補を取得
+        
+        Args:
+            applicant_id: 応募者ID
+            k: 取得件数
+            session: データベースセッション（省略時は内部で取得）
+            scoring: スコア計算方式（省略時はMATCHING_SCORING）
+        
+        Returns:
+            マッチング結果のリスト（スコアの降順）
+        """
+        scoring = self._resolve_scoring(scoring)
+        own_session = session is None
+        session = session or self.db.get_session()
+        try:
+            self.index.ensure_loaded(session)
+            return [{
+                'applicant_id': applicant_id,
+                'job_posting_id': job_id,
+                'score': score,
+                'matched_skills': self.index.matched_skills(applicant_id, job_id)
+            } for job_id, score in self.index.top_jobs_for_applicant(applicant_id, k, scoring)]
+        finally:
+            if own_session:
+                session.close()
+    
+    def match_all(self, workers: int = None, scoring: str = None):
+        """
+        全応募者と全求人をマッチング
+        
+        Args:
+            workers: 並列実行するプロセス数（省略時はMATCHING_WORKERS）
+            scoring: スコア計算方式（省略時はMATCHING_SCORING）
+        """
         print("\n全マッチング実行")
         print("-" * 30)
         
         session = self.db.get_session()
         try:
-            applicants = session.query(Applicant).all()
-            job_postings = session.query(JobPosting).all()
-            
-            if not applicants or not job_postings:
+            self.index.ensure_loaded(session)
+            if not self.index.applicant_ids() or not self.index.job_ids():
                 print("応募者または求人情報が不足しています。")
                 return
             
-            matches = []
-            for applicant in applicants:
-                for job in job_postings:
-                    score = self._calculate_match_score(applicant.skills or '', job.required_skills or '')
-                    
-                    if score > 0:
-                        matched_skills = set((applicant.skills or '').split(',')) & set((job.required_skills or '').split(','))
-                        matched_skills_str = ', '.join([s.strip() for s in matched_skills if s.strip()])
-                        
-                        matches.append({
-                            'applicant': applicant,
-                            'job': job,
-                            'score': score,
-                            'matched_skills': matched_skills_str
-                        })
-            
-            # スコア順にソート
-            matches.sort(key=lambda x: x['score'], reverse=True)
+            matches = self.compute_matches(session, workers=workers, scoring=scoring)
             
             print(f"\nマッチング結果: {len(matches)}件")
             print("=" * 80)
-            for match in matches[:20]:  # 上位20件を表示
-                print(f"応募者: {match['applicant'].name} (ID: {match['applicant'].id})")
-                print(f"求人: {match['job'].title} (ID: {match['job'].id})")
+            top_matches = matches[:20]  # 上位20件を表示
+            applicants = {a.id: a for a in session.query(Applicant).filter(
+                Applicant.id.in_({m['applicant_id'] for m in top_matches})
+            )}
+            jobs = {j.id: j for j in session.query(JobPosting).filter(
+                JobPosting.id.in_({m['job_posting_id'] for m in top_matches})
+            )}
+            for match in top_matches:
+                applicant = applicants.get(match['applicant_id'])
+                job = jobs.get(match['job_posting_id'])
+                print(f"応募者: {applicant.name if applicant else '不明'} (ID: {match['applicant_id']})")
+                print(f"求人: {job.title if job else '不明'} (ID: {match['job_posting_id']})")
                 print(f"マッチングスコア: {match['score']:.1f}%")
                 print(f"マッチしたスキル: {match['matched_skills']}")
                 print("-" * 80)
@@ -90,20 +335,58 @@ class MatchingService:
             # マッチング結果をデータベースに保存するか確認
             save = input("\nマッチング結果をデータベースに保存しますか？ [y/N]: ").strip().lower()
             if save == 'y':
-                self._save_matches(session, matches)
+                self._save_matches(session, matches, progress=self._print_save_progress)
         
         except Exception as e:
             print(f"エラーが発生しました: {e}")
         finally:
             session.close()
     
-    def _save_matches(self, session, matches):
-        """マッチング結果をデータベースに保存"""
-        try:
+    def _upsert_matches(self, session, matches, batch_size: int = None, progress=None):
+        """
+        マッチング結果をUPSERT（コミットは呼び出し側で行う）
+        PostgreSQL/SQLiteでは INSERT ... ON CONFLICT (applicant_id, job_posting_id) DO UPDATE を
+        バッチ単位で発行し（executemany）、1件ずつの存在確認を行わない
+        
+        Args:
+            session: データベースセッション
+            matches: マッチング結果のリスト
+            batch_size: 1回のINSERT文で保存する件数（省略時はMATCHING_SAVE_BATCH_SIZE）
+            progress: 進捗通知関数 progress(保存済み件数, 全件数)
+        """
+        batch_size = batch_size or MATCHING_SAVE_BATCH_SIZE
+        dialect = session.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            # 文は1回だけ構築し、バッチごとにexecutemanyで実行する
+            # （values()に行を埋め込むとバッチごとにSQLのコンパイルが発生するため）
+            stmt = insert(Matching.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['applicant_id', 'job_posting_id'],
+                set_={
+                    'match_score': stmt.excluded.match_score,
+                    'matched_skills': stmt.excluded.matched_skills,
+                }
+            )
+            total = len(matches)
+            now = datetime.now()
+            for start in range(0, total, batch_size):
+                rows = [{
+                    'applicant_id': match['applicant_id'],
+                    'job_posting_id': match['job_posting_id'],
+                    'match_score': match['score'],
+                    'matched_skills': match['matched_skills'],
+                    'created_at': now,
+                } for match in matches[start:start + batch_size]]
+                session.execute(stmt, rows)
+                if progress:
+                    progress(min(start + batch_size, total), total)
+        else:
+            # ON CONFLICTをサポートしないデータベースは1件ずつ保存
             for match in matches:
                 existing = session.query(Matching).filter(
-                    Matching.applicant_id == match['applicant'].id,
-                    Matching.job_posting_id == match['job'].id
+                    Matching.applicant_id == match['applicant_id'],
+                    Matching.job_posting_id == match['job_posting_id']
                 ).first()
                 
                 if existing:
@@ -111,21 +394,136 @@ class MatchingService:
                     existing.matched_skills = match['matched_skills']
                 else:
                     new_match = Matching(
-                        applicant_id=match['applicant'].id,
-                        job_posting_id=match['job'].id,
+                        applicant_id=match['applicant_id'],
+                        job_posting_id=match['job_posting_id'],
                         match_score=match['score'],
                         matched_skills=match['matched_skills']
                     )
                     session.add(new_match)
-            
+    
+    def _save_matches(self, session, matches, batch_size: int = None, progress=None) -> bool:
+        """
+        マッチング結果をデータベースに保存
+        
+        Args:
+            session: データベースセッション
+            matches: マッチング結果のリスト
+            batch_size: 1回のINSERT文で保存する件数（省略時はMATCHING_SAVE_BATCH_SIZE）
+            progress: 進捗通知関数 progress(保存済み件数, 全件数)
+        
+        Returns:
+            保存に成功した場合True
+        """
+        try:
+            self._upsert_matches(session, matches, batch_size, progress)
             session.commit()
             print("マッチング結果を保存しました。")
+            return True
         except Exception as e:
             session.rollback()
             print(f"保存エラーが発生しました: {e}")
+            return False
+    
+    def rematch_applicant(self, applicant_id: int, session=None, scoring: str = None) -> int:
+        """
+        応募者1件分のマッチング結果を再計算して保存
+        スコアが0になった組み合わせのマッチング結果は削除する
+        
+        Args:
+            applicant_id: 応募者ID
+            session: データベースセッション（省略時は内部で取得）
+            scoring: スコア計算方式（省略時はMATCHING_SCORING）
+        
+        Returns:
+            保存したマッチング結果の件数
+        """
+        scoring = self._resolve_scoring(scoring)
+        own_session = session is None
+        session = session or self.db.get_session()
+        try:
+            self.index.ensure_loaded(session)
+            overlaps = self.index.jobs_for_applicant(applicant_id, scoring)
+            matches = []
+            for job_id in sorted(overlaps):
+                score = self.index.score(job_id, overlaps[job_id], scoring)
+                if score > 0:
+                    matches.append({
+                        'applicant_id': applicant_id,
+                        'job_posting_id': job_id,
+                        'score': score,
+                        'matched_skills': self.index.matched_skills(applicant_id, job_id)
+                    })
+            
+            stale = session.query(Matching).filter(Matching.applicant_id == applicant_id)
+            if matches:
+                stale = stale.filter(Matching.job_posting_id.notin_([m['job_posting_id'] for m in matches]))
+            stale.delete(synchronize_session=False)
+            self._upsert_matches(session, matches)
+            session.commit()
+            return len(matches)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            if own_session:
+                session.close()
+    
+    def rematch_job(self, job_id: int, session=None, scoring: str = None) -> int:
+        """
+        求人1件分のマッチング結果を再計算して保存
+        スコアが0になった組み合わせのマッチング結果は削除する
+        
+        Args:
+            job_id: 求人ID
+            session: データベースセッション（省略時は内部で取得）
+            scoring: スコア計算方式（省略時はMATCHING_SCORING）
+        
+        Returns:
+            保存したマッチング結果の件数
+        """
+        scoring = self._resolve_scoring(scoring)
+        own_session = session is None
+        session = session or self.db.get_session()
+        try:
+            self.index.ensure_loaded(session)
+            overlaps = self.index.applicants_for_job(job_id, scoring)
+            matches = []
+            for applicant_id in sorted(overlaps):
+                score = self.index.score(job_id, overlaps[applicant_id], scoring)
+                if score > 0:
+                    matches.append({
+                        'applicant_id': applicant_id,
+                        'job_posting_id': job_id,
+                        'score': score,
+                        'matched_skills': self.index.matched_skills(applicant_id, job_id)
+                    })
+            
+            stale = session.query(Matching).filter(Matching.job_posting_id == job_id)
+            if matches:
+                stale = stale.filter(Matching.applicant_id.notin_([m['applicant_id'] for m in matches]))
+            stale.delete(synchronize_session=False)
+            self._upsert_matches(session, matches)
+            session.commit()
+            return len(matches)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            if own_session:
+                session.close()
+    
+    @staticmethod
+    def _print_save_progress(saved: int, total: int):
+        """保存の進捗を表示"""
+        print(f"\r保存中: {saved}/{total}件", end='' if saved < total else '\n', flush=True)
     
-    def find_candidates_for_job(self):
-        """求人に対する応募者候補を検索"""
+    def find_candidates_for_job(self, scoring: str = None):
+        """
+        求人に対する応募者候補を検索
+        
+        Args:
+            scoring: スコア計算方式（省略時はMATCHING_SCORING）
+        """
         print("\n求人に対する応募者候補検索")
         print("-" * 30)
         
@@ -144,19 +542,22 @@ class MatchingService:
             print("\n候補者:")
             print("=" * 80)
             
-            applicants = session.query(Applicant).all()
+            scoring = self._resolve_scoring(scoring)
+            self.index.ensure_loaded(session)
+            overlaps = self.index.applicants_for_job(job.id, scoring)
+            applicants = {a.id: a for a in session.query(Applicant).filter(
+                Applicant.id.in_(list(overlaps))
+            )} if overlaps else {}
             candidates = []
             
-            for applicant in applicants:
-                score = self._calculate_match_score(applicant.skills or '', job.required_skills or '')
-                if score > 0:
-                    matched_skills = set((applicant.skills or '').split(',')) & set((job.required_skills or '').split(','))
-                    matched_skills_str = ', '.join([s.strip() for s in matched_skills if s.strip()])
-                    
+            for applicant_id in sorted(overlaps):
+                applicant = applicants.get(applicant_id)
+                score = self.index.score(job.id, overlaps[applicant_id], scoring)
+                if applicant and score > 0:
                     candidates.append({
                         'applicant': applicant,
                         'score': score,
-                        'matched_skills': matched_skills_str
+                        'matched_skills': self.index.matched_skills(applicant_id, job.id)
                     })
             
             # スコア順にソート
@@ -179,8 +580,13 @@ class MatchingService:
         finally:
             session.close()
     
-    def find_jobs_for_applicant(self):
-        """応募者に対する求人候補を検索"""
+    def find_jobs_for_applicant(self, scoring: str = None):
+        """
+        応募者に対する求人候補を検索
+        
+        Args:
+            scoring: スコア計算方式（省略時はMATCHING_SCORING）
+        """
         print("\n応募者に対する求人候補検索")
         print("-" * 30)
         
@@ -199,19 +605,22 @@ class MatchingService:
             print("\n候補求人:")
             print("=" * 80)
             
-            jobs = session.query(JobPosting).all()
+            scoring = self._resolve_scoring(scoring)
+            self.index.ensure_loaded(session)
+            overlaps = self.index.jobs_for_applicant(applicant.id, scoring)
+            jobs = {j.id: j for j in session.query(JobPosting).filter(
+                JobPosting.id.in_(list(overlaps))
+            )} if overlaps else {}
             job_candidates = []
             
-            for job in jobs:
-                score = self._calculate_match_score(applicant.skills or '', job.required_skills or '')
-                if score > 0:
-                    matched_skills = set((applicant.skills or '').split(',')) & set((job.required_skills or '').split(','))
-                    matched_skills_str = ', '.join([s.strip() for s in matched_skills if s.strip()])
-                    
+            for job_id in sorted(overlaps):
+                job = jobs.get(job_id)
+                score = self.index.score(job_id, overlaps[job_id], scoring)
+                if job and score > 0:
                     job_candidates.append({
                         'job': job,
                         'score': score,
-                        'matched_skills': matched_skills_str
+                        'matched_skills': self.index.matched_skills(applicant.id, job_id)
                     })
             
             # スコア順にソート
@@ -235,3 +644,86 @@ class MatchingService:
         finally:
             session.close()
 
+
+
+class RematchQueue:
+    """
+    差分マッチングキュー
+    応募者のスキル・求人の必要スキルの変更（コミット済み）を受け取り、
+    変更された行の組み合わせだけを再計算してマッチング結果をUPSERTする
+    """
+    
+    def __init__(self, service: MatchingService, delay: float = None):
+        """
+        初期化
+        
+        Args:
+            service: マッチングサービス
+            delay: 変更をまとめて処理するまでの待ち時間（秒、省略時はMATCHING_REMATCH_DELAY）
+        """
+        self.service = service
+        self.delay = MATCHING_REMATCH_DELAY if delay is None else delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stopped = threading.Event()
+        add_change_listener(self._on_changes)
+    
+    def _on_changes(self, engine, changes):
+        """コミットされた変更をキューに追加"""
+        if engine is not self.service.db.engine:
+            return
+        for kind, row_id, *_ in changes:
+            self._queue.put((kind, row_id))
+    
+    def process_pending(self) -> int:
+        """
+        キューに溜まった変更を処理
+        同じ行への複数の変更は1回の再計算にまとめる
+        
+        Returns:
+            再計算した行数
+        """
+        pending = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item not in pending:
+                pending.append(item)
+        
+        for kind, row_id in pending:
+            try:
+                if kind == 'applicant':
+                    self.service.rematch_applicant(row_id)
+                elif kind == 'job':
+                    self.service.rematch_job(row_id)
+            except Exception as e:
+                logger.error(f'差分マッチングエラー ({kind} ID: {row_id}): {e}')
+        return len(pending)
+    
+    def _run(self):
+        """バックグラウンドでキューを処理"""
+        while not self._stopped.is_set():
+            try:
+                item = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            self._queue.put(item)
+            # 連続した変更をまとめるため少し待ってから処理
+            self._stopped.wait(self.delay)
+            self.process_pending()
+    
+    def start(self):
+        """バックグラウンド処理スレッドを開始"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='rematch-queue', daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        """バックグラウンド処理スレッドを停止"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
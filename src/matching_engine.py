@@ -0,0 +1,141 @@
+"""
+疎行列マッチングエンジンモジュール
+応募者・求人をスキルの二値疎行列（CSR）に変換し、
+共通スキル数を疎行列積でまとめて計算する
+"""
+
+try:
+    import numpy as np
+    from scipy import sparse
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+
+class SparseMatchEngine:
+    """
+    疎行列マッチングエンジン
+    スコア = (共通スキル数 / 求人の必要スキル数) * 100 を全組み合わせについて一括計算する
+    スキルの重みを指定した場合は (共通スキルの重み合計 / 必要スキルの重み合計) * 100 となる
+    """
+
+    def __init__(self, applicant_skills: dict, job_skills: dict, job_skill_counts: dict,
+                 skill_weights: dict = None):
+        """
+        初期化（スキル集合から疎行列を構築）
+
+        Args:
+            applicant_skills: 応募者ID → スキル集合
+            job_skills: 求人ID → スキル集合
+            job_skill_counts: 求人ID → 必要スキル数（重み指定時は必要スキルの重み合計、スコアの分母）
+            skill_weights: スキルID → 重み（省略時はすべて1）
+        """
+        if not SCIPY_AVAILABLE:
+            raise RuntimeError('SparseMatchEngine requires numpy and scipy')
+
+        self.applicant_ids = np.array(sorted(applicant_skills), dtype=np.int64)
+        self.job_ids = np.array(sorted(job_skills), dtype=np.int64)
+
+        vocabulary = {}
+        self.applicant_matrix = self._build_matrix(
+            [applicant_skills[i] for i in self.applicant_ids.tolist()], vocabulary
+        )
+        # 重みは求人側の行列にのみ持たせる（応募者側は二値のまま）
+        self.job_matrix = self._build_matrix(
+            [job_skills[i] for i in self.job_ids.tolist()], vocabulary, skill_weights
+        )
+        # 語彙数を揃える（応募者側にしか存在しないスキルの列を含める）
+        n_skills = max(len(vocabulary), 1)
+        self.applicant_matrix.resize((len(self.applicant_ids), n_skills))
+        self.job_matrix.resize((len(self.job_ids), n_skills))
+        self.job_matrix_t = self.job_matrix.T.tocsr()
+        self.job_counts = np.array(
+            [job_skill_counts[i] for i in self.job_ids.tolist()], dtype=np.float64
+        )
+
+    @classmethod
+    def from_index(cls, index, skill_weights: dict = None, job_weights: dict = None):
+        """
+        スキル転置インデックスのスナップショットからエンジンを構築
+
+        Args:
+            index: スキル転置インデックス
+            skill_weights: スキルID → 重み（省略時はすべて1）
+            job_weights: 求人ID → 必要スキルの重み合計（skill_weights指定時に使用）
+        """
+        with index._lock:
+            if skill_weights is None:
+                return cls(dict(index.applicant_skills), dict(index.job_skills), dict(index.job_skill_counts))
+            return cls(dict(index.applicant_skills), dict(index.job_skills), job_weights, skill_weights)
+
+    @staticmethod
+    def _build_matrix(skill_sets, vocabulary, skill_weights=None):
+        """スキル集合のリストからCSR行列を構築（語彙は共有して拡張、重み省略時は二値）"""
+        indptr = [0]
+        indices = []
+        weights = []
+        for skill_set in skill_sets:
+            for skill in skill_set:
+                indices.append(vocabulary.setdefault(skill, len(vocabulary)))
+                if skill_weights is not None:
+                    weights.append(skill_weights[skill])
+            indptr.append(len(indices))
+        if skill_weights is None:
+            data = np.ones(len(indices), dtype=np.int32)
+        else:
+            data = np.array(weights, dtype=np.float64)
+        return sparse.csr_matrix(
+            (data, np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+            shape=(len(skill_sets), max(len(vocabulary), 1)),
+        )
+
+    def iter_scores(self, block_size: int = 5000):
+        """
+        応募者をブロック単位に分けてスコアを計算
+
+        Args:
+            block_size: 1回の行列積で処理する応募者数（メモリ使用量の上限）
+
+        Yields:
+            (応募者ID配列, 求人ID配列, スコア配列) のタプル（スコア > 0 の組み合わせのみ）
+        """
+        n_applicants = len(self.applicant_ids)
+        if n_applicants == 0 or len(self.job_ids) == 0:
+            return
+        for start in range(0, n_applicants, block_size):
+            overlaps = (self.applicant_matrix[start:start + block_size] @ self.job_matrix_t).tocoo()
+            if overlaps.nnz == 0:
+                continue
+            scores = np.minimum((overlaps.data.astype(np.float64) / self.job_counts[overlaps.col]) * 100, 100.0)
+            yield self.applicant_ids[overlaps.row + start], self.job_ids[overlaps.col], scores
+
+    def score_all(self, block_size: int = 5000):
+        """
+        全組み合わせのスコアを計算
+
+        Returns:
+            (応募者ID配列, 求人ID配列, スコア配列) のタプル
+            スコアの降順、同点は応募者ID・求人IDの昇順に並ぶ
+        """
+        return self.sort_blocks(list(self.iter_scores(block_size)))
+
+    @staticmethod
+    def sort_blocks(blocks: list):
+        """
+        iter_scoresの結果を連結して並べ替え
+
+        Args:
+            blocks: (応募者ID配列, 求人ID配列, スコア配列) のタプルのリスト
+
+        Returns:
+            (応募者ID配列, 求人ID配列, スコア配列) のタプル
+            スコアの降順、同点は応募者ID・求人IDの昇順に並ぶ
+        """
+        if not blocks:
+            empty = np.array([], dtype=np.int64)
+            return empty, empty, np.array([], dtype=np.float64)
+        applicant_ids = np.concatenate([b[0] for b in blocks])
+        job_ids = np.concatenate([b[1] for b in blocks])
+        scores = np.concatenate([b[2] for b in blocks])
+        order = np.lexsort((job_ids, applicant_ids, -scores))
+        return applicant_ids[order], job_ids[order], scores[order]
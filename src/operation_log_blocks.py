@@ -0,0 +1,484 @@
+"""
+操作ログの列指向ブロック形式モジュール
+訓練セッションの操作ログ（20Hzのテレメトリ）を一定行数ごとのブロックにまとめ、
+列ごとの型付き配列（タイムスタンプ・連番は差分、数値はバイトシャッフル）と
+辞書符号化した操作タイプを圧縮して1行に保存する
+読み出しは行形式（operation_logsテーブル）と共通のレコードで返すため、リプレイ側は保存形式を意識しない
+"""
+
+import os
+import sys
+import json
+import zlib
+import math
+import struct
+from array import array
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .database import OperationLog, OperationLogBlock, OperationLogKeyframe, TrainingSession
+
+
+# 保存時に記録するキーフレームの索引の区間の長さ（秒、リプレイで指定する間隔はこの整数倍の場合に索引を使用）
+OPERATION_LOG_KEYFRAME_SECONDS = float(os.getenv('OPERATION_LOG_KEYFRAME_SECONDS', '10'))
+
+# ブロックの圧縮レベル（zlib、1〜9）
+OPERATION_LOG_BLOCK_COMPRESSION_LEVEL = int(os.getenv('OPERATION_LOG_BLOCK_COMPRESSION_LEVEL', '6'))
+
+# ブロック形式の識別子
+BLOCK_ENCODING = 'columnar-v1'
+
+# 操作ログのレコードの項目（行形式・ブロック形式の読み出し結果で共通）
+OPERATION_LOG_RECORD_FIELDS = (
+    'timestamp',
+    'operation_type',
+    'operation_value',
+    'equipment_state',
+    'position_x',
+    'position_y',
+    'position_z',
+    'velocity',
+    'error_event',
+    'error_description',
+    'achievement_event',
+    'achievement_description',
+    'event_type',
+    'sequence',
+)
+
+OperationLogRecord = namedtuple('OperationLogRecord', OPERATION_LOG_RECORD_FIELDS)
+
+# 列の種類ごとの項目
+_FLOAT_COLUMNS = ('operation_value', 'position_x', 'position_y', 'position_z', 'velocity')
+_BOOL_COLUMNS = ('error_event', 'achievement_event')
+_DICTIONARY_COLUMNS = ('operation_type', 'event_type')
+_TEXT_COLUMNS = ('equipment_state', 'error_description', 'achievement_description')
+
+# タイムスタンプの基準時刻（マイクロ秒単位の整数に変換する際の原点）
+_EPOCH = datetime(1970, 1, 1)
+
+# 連番がNULLの行の値
+_NULL_SEQUENCE = -1
+
+_LITTLE_ENDIAN = sys.byteorder == 'little'
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    """タイムゾーン付きのdatetimeをUTCのタイムゾーンなしに変換（タイムゾーンなしの場合はそのまま）"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _to_microseconds(value: datetime) -> int:
+    """datetimeを基準時刻からのマイクロ秒に変換（タイムゾーン付きの場合はUTCに揃える）"""
+    delta = to_naive_utc(value) - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _delta_encode(values: list) -> list:
+    """整数列を先頭の値と差分の列に変換"""
+    previous = 0
+    deltas = []
+    for value in values:
+        deltas.append(value - previous)
+        previous = value
+    return deltas
+
+
+def _delta_decode(deltas) -> list:
+    """差分の列を整数列に戻す"""
+    total = 0
+    values = []
+    for delta in deltas:
+        total += delta
+        values.append(total)
+    return values
+
+
+def _shuffle(values: array) -> bytes:
+    """
+    数値配列をバイト単位で並べ替え（各要素の同じ位置のバイトをまとめる）
+    変化の小さい上位バイトが連続するため、zlibの圧縮率が大きく向上する
+    """
+    if not _LITTLE_ENDIAN:
+        values = array(values.typecode, values)
+        values.byteswap()
+    raw = values.tobytes()
+    size = values.itemsize
+    return b''.join(raw[i::size] for i in range(size))
+
+
+def _unshuffle(typecode: str, data: bytes) -> array:
+    """_shuffle() の逆変換"""
+    values = array(typecode)
+    size = values.itemsize
+    count = len(data) // size
+    raw = bytearray(len(data))
+    for i in range(size):
+        raw[i::size] = data[i * count:(i + 1) * count]
+    values.frombytes(bytes(raw))
+    if not _LITTLE_ENDIAN:
+        values.byteswap()
+    return values
+
+
+def encode_block(columns: dict, compression_level: int = None) -> bytes:
+    """
+    操作ログの列を1ブロックのバイナリに変換
+
+    Args:
+        columns: 項目名 → 値のシーケンス の辞書（OPERATION_LOG_RECORD_FIELDS の項目を含む）
+        compression_level: zlibの圧縮レベル（省略時はOPERATION_LOG_BLOCK_COMPRESSION_LEVEL）
+
+    Returns:
+        圧縮したブロック
+    """
+    count = len(columns['timestamp'])
+    sections = []
+    header = {'rows': count, 'dictionaries': {}, 'texts': {}, 'arrays': []}
+
+    def add_array(name, values):
+        header['arrays'].append([name, values.typecode, len(values) * values.itemsize])
+        sections.append(_shuffle(values))
+
+    add_array('timestamp', array('q', _delta_encode([_to_microseconds(value) for value in columns['timestamp']])))
+    add_array('sequence', array('q', _delta_encode([
+        _NULL_SEQUENCE if value is None else value for value in columns['sequence']
+    ])))
+    for name in _FLOAT_COLUMNS:
+        # NULLはNaNとして保存
+        add_array(name, array('d', [math.nan if value is None else value for value in columns[name]]))
+    for name in _BOOL_COLUMNS:
+        add_array(name, array('b', [1 if value else 0 for value in columns[name]]))
+    for name in _DICTIONARY_COLUMNS:
+        # 辞書符号化（値の一覧と、各行の値の番号）
+        dictionary = {}
+        codes = [dictionary.setdefault(value, len(dictionary)) for value in columns[name]]
+        header['dictionaries'][name] = list(dictionary)
+        add_array(name, array('H' if len(dictionary) <= 0xFFFF else 'I', codes))
+    for name in _TEXT_COLUMNS:
+        header['texts'][name] = list(columns[name])
+
+    header_bytes = json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    payload = b''.join([struct.pack('<I', len(header_bytes)), header_bytes] + sections)
+    level = OPERATION_LOG_BLOCK_COMPRESSION_LEVEL if compression_level is None else compression_level
+    return zlib.compress(payload, level)
+
+
+def decode_block(data: bytes) -> list:
+    """
+    ブロックをレコードのリストに変換
+
+    Args:
+        data: encode_block() で作成したブロック
+
+    Returns:
+        OperationLogRecord のリスト（ブロック内の順序）
+    """
+    payload = zlib.decompress(data)
+    header_length, = struct.unpack_from('<I', payload)
+    offset = 4 + header_length
+    header = json.loads(payload[4:offset].decode('utf-8'))
+
+    columns = {}
+    for name, typecode, length in header['arrays']:
+        columns[name] = _unshuffle(typecode, payload[offset:offset + length])
+        offset += length
+
+    columns['timestamp'] = [
+        _EPOCH + timedelta(microseconds=value) for value in _delta_decode(columns['timestamp'])
+    ]
+    columns['sequence'] = [
+        None if value == _NULL_SEQUENCE else value for value in _delta_decode(columns['sequence'])
+    ]
+    for name in _FLOAT_COLUMNS:
+        columns[name] = [None if value != value else value for value in columns[name]]
+    for name in _BOOL_COLUMNS:
+        columns[name] = [bool(value) for value in columns[name]]
+    for name in _DICTIONARY_COLUMNS:
+        dictionary = header['dictionaries'][name]
+        columns[name] = [dictionary[code] for code in columns[name]]
+    for name in _TEXT_COLUMNS:
+        columns[name] = header['texts'][name]
+
+    return list(map(OperationLogRecord._make, zip(*(columns[name] for name in OPERATION_LOG_RECORD_FIELDS))))
+
+
+def _decode_timestamps(data: bytes) -> list:
+    """ブロックのタイムスタンプの列のみを取得（他の列は展開しない）"""
+    payload = zlib.decompress(data)
+    header_length, = struct.unpack_from('<I', payload)
+    offset = 4 + header_length
+    header = json.loads(payload[4:offset].decode('utf-8'))
+    name, typecode, length = header['arrays'][0]
+    microseconds = _delta_decode(_unshuffle(typecode, payload[offset:offset + length]))
+    return [_EPOCH + timedelta(microseconds=value) for value in microseconds]
+
+
+def _block_query(session_db, columns, training_session_id: int, start: datetime = None, end: datetime = None):
+    """時間範囲に重なるブロックの検索（範囲外のブロックは読み出さない）"""
+    query = session_db.query(*columns).filter(OperationLogBlock.training_session_id == training_session_id)
+    if start is not None:
+        query = query.filter(OperationLogBlock.end_time >= start)
+    if end is not None:
+        query = query.filter(OperationLogBlock.start_time < end)
+    return query.order_by(OperationLogBlock.start_time, OperationLogBlock.block_index)
+
+
+def _row_query(session_db, columns, training_session_id: int, start: datetime = None, end: datetime = None):
+    """時間範囲の行の検索（訓練セッションID + タイムスタンプのインデックスを使用）"""
+    query = session_db.query(*columns).filter(OperationLog.training_session_id == training_session_id)
+    if start is not None:
+        query = query.filter(OperationLog.timestamp >= start)
+    if end is not None:
+        query = query.filter(OperationLog.timestamp < end)
+    return query
+
+
+def _iter_block_data(session_db, blocks: list, batch_size: int, stop=None):
+    """
+    ブロックのデータを batch_size 件ずつ読み出す
+    stop(開始時刻) が真になったブロックの手前で打ち切り、残りのブロックは読み出さない
+    """
+    for position in range(0, len(blocks), batch_size):
+        batch = blocks[position:position + batch_size]
+        if stop is not None and stop(batch[0][1]):
+            return
+        data = dict(session_db.query(OperationLogBlock.id, OperationLogBlock.data).filter(
+            OperationLogBlock.id.in_([block_id for block_id, _, _ in batch])
+        ))
+        for block_id, start_time, end_time in batch:
+            yield data[block_id], start_time, end_time
+
+
+def load_operation_logs(session_db, training_session_id: int, start: datetime = None, end: datetime = None,
+                        limit: int = None) -> list:
+    """
+    訓練セッションの操作ログをタイムスタンプ順に取得
+    列指向ブロックと行形式（operation_logsテーブル）のどちらに保存されていても同じ形式で返す
+    時間範囲を指定した場合、範囲に重なるブロックと範囲内の行のみを読み出す
+    件数を指定した場合、ブロックを開始時刻順に1件ずつ展開し、limit件目より後に始まるブロックは読み出さない
+
+    Args:
+        session_db: データベースセッション
+        training_session_id: 訓練セッションの内部ID
+        start: 取得する範囲の開始時刻（この時刻を含む、タイムゾーンなしのUTC）
+        end: 取得する範囲の終了時刻（この時刻を含まない、タイムゾーンなしのUTC）
+        limit: 取得する最大件数（先頭から）
+
+    Returns:
+        OperationLogRecord（または同じ項目を持つ行）のリスト
+    """
+    blocks = _block_query(
+        session_db, (OperationLogBlock.id, OperationLogBlock.start_time, OperationLogBlock.end_time),
+        training_session_id, start, end
+    ).all()
+
+    records = []
+    ordered = True
+    previous_end = None
+    # limit件目のタイムスタンプ（これ以降に始まるブロックの行は先頭limit件に入らない）
+    threshold = None
+    batch_size = 1 if limit is not None else max(1, len(blocks))
+    stop = lambda start_time: threshold is not None and start_time >= threshold
+    for data, start_time, end_time in _iter_block_data(session_db, blocks, batch_size, stop):
+        if previous_end is not None and start_time < previous_end:
+            # 時間範囲が重なるブロック（分割アップロードのチャンクなど）がある場合は並べ直す
+            ordered = False
+        previous_end = end_time if previous_end is None else max(previous_end, end_time)
+        decoded = decode_block(data)
+        if (start is not None and start_time < start) or (end is not None and end_time >= end):
+            # 範囲の境界にまたがるブロックは範囲外の行を除く
+            decoded = [
+                record for record in decoded
+                if (start is None or record.timestamp >= start) and (end is None or record.timestamp < end)
+            ]
+        records.extend(decoded)
+        if limit is not None and len(records) >= limit:
+            if not ordered:
+                records.sort(key=lambda record: record.timestamp)
+                ordered = True
+            del records[limit:]
+            threshold = records[-1].timestamp
+
+    query = _row_query(
+        session_db, [getattr(OperationLog, name) for name in OPERATION_LOG_RECORD_FIELDS],
+        training_session_id, start, end
+    ).order_by(OperationLog.timestamp, OperationLog.id)
+    if limit is not None:
+        query = query.limit(limit)
+    rows = query.all()
+    if not records:
+        return rows
+    if rows:
+        records.extend(rows)
+        ordered = False
+    if not ordered:
+        records.sort(key=lambda record: record.timestamp)
+    return records if limit is None else records[:limit]
+
+
+def _keyframe_buckets(timestamps, origin: datetime, interval: float, firsts: dict = None) -> dict:
+    """タイムスタンプを区間ごとに分け、区間の番号 → 区間内の最初のタイムスタンプ の辞書を作成"""
+    firsts = {} if firsts is None else firsts
+    for timestamp in timestamps:
+        bucket = math.floor((timestamp - origin).total_seconds() / interval)
+        first = firsts.get(bucket)
+        if first is None or timestamp < first:
+            firsts[bucket] = timestamp
+    return firsts
+
+
+def _scan_keyframe_buckets(session_db, training_session_id: int, origin: datetime, interval: float) -> dict:
+    """
+    操作ログを走査して区間ごとの最初のタイムスタンプを取得
+    行形式はタイムスタンプの列のみ（インデックスのみ）、ブロックはタイムスタンプの列のみを読み出す
+    """
+    firsts = {}
+    for data, in _block_query(session_db, (OperationLogBlock.data,), training_session_id):
+        _keyframe_buckets(_decode_timestamps(data), origin, interval, firsts)
+    timestamps = (timestamp for timestamp, in _row_query(session_db, (OperationLog.timestamp,), training_session_id))
+    return _keyframe_buckets(timestamps, origin, interval, firsts)
+
+
+def _session_origin(session_db, training_session_id: int) -> datetime:
+    """キーフレームの区間の基準時刻（訓練の開始時刻、タイムゾーンなしのUTC）"""
+    start_time = session_db.query(TrainingSession.session_start_time).filter(
+        TrainingSession.id == training_session_id
+    ).scalar()
+    return to_naive_utc(start_time)
+
+
+def _upsert_keyframes(session_db, training_session_id: int, interval: float, firsts: dict):
+    """
+    キーフレームの索引を保存（既存の区間は早い方のタイムスタンプを残す）
+    PostgreSQL/SQLiteでは INSERT ... ON CONFLICT (training_session_id, bucket) DO UPDATE で一括保存する
+    """
+    if not firsts:
+        return
+    rows = [{
+        'training_session_id': training_session_id,
+        'interval_seconds': interval,
+        'bucket': bucket,
+        'first_time': first,
+    } for bucket, first in firsts.items()]
+    dialect = session_db.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(OperationLogKeyframe.__table__)
+        # PostgreSQLはLEAST、SQLiteは2引数のMIN（スカラー関数）
+        earliest = func.least if dialect == 'postgresql' else func.min
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['training_session_id', 'bucket'],
+            set_={'first_time': earliest(OperationLogKeyframe.__table__.c.first_time, stmt.excluded.first_time)}
+        )
+        session_db.execute(stmt, rows)
+        return
+    # ON CONFLICTをサポートしないデータベースは1件ずつ保存
+    existing = {
+        keyframe.bucket: keyframe for keyframe in session_db.query(OperationLogKeyframe).filter(
+            OperationLogKeyframe.training_session_id == training_session_id,
+            OperationLogKeyframe.bucket.in_(list(firsts))
+        )
+    }
+    for row in rows:
+        keyframe = existing.get(row['bucket'])
+        if keyframe is None:
+            session_db.add(OperationLogKeyframe(**row))
+        elif row['first_time'] < keyframe.first_time:
+            keyframe.first_time = row['first_time']
+    session_db.flush()
+
+
+def delete_operation_log_keyframes(session_db, training_session_id: int):
+    """訓練セッションのキーフレームの索引を削除（コミットは呼び出し側で行う）"""
+    session_db.query(OperationLogKeyframe).filter(
+        OperationLogKeyframe.training_session_id == training_session_id
+    ).delete(synchronize_session=False)
+
+
+def rebuild_operation_log_keyframes(session_db, training_session_id: int):
+    """
+    保存済みの操作ログ全体からキーフレームの索引を作り直す（コミットは呼び出し側で行う）
+    操作ログの更新・削除でタイムスタンプが変わった場合に使用する
+    """
+    delete_operation_log_keyframes(session_db, training_session_id)
+    origin = _session_origin(session_db, training_session_id)
+    interval = OPERATION_LOG_KEYFRAME_SECONDS
+    _upsert_keyframes(session_db, training_session_id, interval,
+                      _scan_keyframe_buckets(session_db, training_session_id, origin, interval))
+
+
+def index_operation_log_keyframes(session_db, training_session_id: int, timestamps: list):
+    """
+    追加保存した操作ログのタイムスタンプでキーフレームの索引を更新（コミットは呼び出し側で行う）
+    索引のない既存の操作ログがある場合（索引の導入前のセッションなど）や区間の長さが変わった場合は作り直す
+
+    Args:
+        session_db: データベースセッション
+        training_session_id: 訓練セッションの内部ID
+        timestamps: 追加した操作ログのタイムスタンプ（保存済み）
+    """
+    if not timestamps:
+        return
+    interval = OPERATION_LOG_KEYFRAME_SECONDS
+    stored_interval = session_db.query(OperationLogKeyframe.interval_seconds).filter(
+        OperationLogKeyframe.training_session_id == training_session_id
+    ).limit(1).scalar()
+    if stored_interval is None:
+        indexed = count_operation_logs(session_db, training_session_id) <= len(timestamps)
+    else:
+        indexed = stored_interval == interval
+    if not indexed:
+        rebuild_operation_log_keyframes(session_db, training_session_id)
+        return
+    origin = _session_origin(session_db, training_session_id)
+    firsts = _keyframe_buckets((to_naive_utc(timestamp) for timestamp in timestamps), origin, interval)
+    _upsert_keyframes(session_db, training_session_id, interval, firsts)
+
+
+def operation_log_keyframes(session_db, training_session_id: int, origin: datetime, interval: float) -> list:
+    """
+    リプレイのシーク用のキーフレーム（一定秒数ごとの区間の最初のタイムスタンプ）を取得
+    保存時に記録した索引の区間の整数倍の間隔の場合は索引から求め、それ以外は操作ログを走査する
+
+    Args:
+        session_db: データベースセッション
+        training_session_id: 訓練セッションの内部ID
+        origin: 区間の基準時刻（訓練の開始時刻、タイムゾーンなしのUTC）
+        interval: キーフレームの間隔（秒）
+
+    Returns:
+        (区間の開始秒数, 区間の最初のタイムスタンプ) のリスト（操作ログのない区間は含まない）
+    """
+    stored = session_db.query(
+        OperationLogKeyframe.interval_seconds, OperationLogKeyframe.bucket, OperationLogKeyframe.first_time
+    ).filter(OperationLogKeyframe.training_session_id == training_session_id).all()
+    if stored:
+        base = stored[0][0]
+        ratio = round(interval / base)
+        if ratio >= 1 and math.isclose(ratio * base, interval):
+            firsts = {}
+            for _, bucket, first in stored:
+                merged = bucket // ratio
+                current = firsts.get(merged)
+                if current is None or first < current:
+                    firsts[merged] = first
+            return [(bucket * interval, firsts[bucket]) for bucket in sorted(firsts)]
+    firsts = _scan_keyframe_buckets(session_db, training_session_id, origin, interval)
+    return [(bucket * interval, firsts[bucket]) for bucket in sorted(firsts)]
+
+
+def count_operation_logs(session_db, training_session_id: int) -> int:
+    """訓練セッションの操作ログの件数を取得（ブロックは展開せずに集計）"""
+    block_rows = session_db.query(func.coalesce(func.sum(OperationLogBlock.row_count), 0)).filter(
+        OperationLogBlock.training_session_id == training_session_id
+    ).scalar()
+    row_count = session_db.query(func.count(OperationLog.id)).filter(
+        OperationLog.training_session_id == training_session_id
+    ).scalar()
+    return int(block_rows) + row_count
@@ -0,0 +1,186 @@
+"""
+リプレイキャッシュモジュール
+リプレイAPIのレスポンス（シリアライズ済みのJSON）をプロセス内のLRUとディスクにキャッシュする
+キーには訓練セッションの内容のバージョン（content_version）を含むため、再送などで内容が変わると
+古いエントリは参照されなくなる（invalidate() はメモリ・ディスクを早めに解放するために使用）
+"""
+
+import os
+import zlib
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+
+# メモリキャッシュの上限（バイト、0の場合はメモリキャッシュを使用しない）
+REPLAY_CACHE_MAX_BYTES = int(os.getenv('REPLAY_CACHE_MAX_BYTES', str(128 * 1024 * 1024)))
+
+# ディスクキャッシュのディレクトリ（空の場合はディスクキャッシュを使用しない）
+REPLAY_CACHE_DIR = os.getenv('REPLAY_CACHE_DIR', '')
+
+# ディスクキャッシュの上限（バイト、圧縮後のサイズ）
+REPLAY_CACHE_DISK_MAX_BYTES = int(os.getenv('REPLAY_CACHE_DISK_MAX_BYTES', str(1024 * 1024 * 1024)))
+
+# ディスクキャッシュの圧縮レベル（zlib、1〜9）
+REPLAY_CACHE_COMPRESSION_LEVEL = int(os.getenv('REPLAY_CACHE_COMPRESSION_LEVEL', '6'))
+
+# ディスクキャッシュのファイルの拡張子
+_DISK_SUFFIX = '.z'
+
+logger = logging.getLogger(__name__)
+
+
+def _session_prefix(session_id: str) -> str:
+    """セッションIDをファイル名に使用できる文字列に変換"""
+    return hashlib.sha1(session_id.encode('utf-8')).hexdigest()[:20]
+
+
+class ReplayCache:
+    """
+    リプレイのレスポンスのキャッシュ
+    キーは (セッションID, 訓練セッションの内部ID, 内容のバージョン, リクエストの表現) のタプル
+    """
+
+    def __init__(self, max_bytes: int = None, directory: str = None, disk_max_bytes: int = None):
+        """
+        初期化
+
+        Args:
+            max_bytes: メモリキャッシュの上限（バイト、省略時はREPLAY_CACHE_MAX_BYTES）
+            directory: ディスクキャッシュのディレクトリ（省略時はREPLAY_CACHE_DIR、空の場合は使用しない）
+            disk_max_bytes: ディスクキャッシュの上限（バイト、省略時はREPLAY_CACHE_DISK_MAX_BYTES）
+        """
+        self.max_bytes = REPLAY_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.directory = REPLAY_CACHE_DIR if directory is None else directory
+        self.disk_max_bytes = REPLAY_CACHE_DISK_MAX_BYTES if disk_max_bytes is None else disk_max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+
+    def _path(self, key: tuple) -> str:
+        """ディスクキャッシュのファイルパス"""
+        session_id, internal_id, version, representation = key
+        name = f'{_session_prefix(session_id)}-{internal_id}-{version}-{representation}{_DISK_SUFFIX}'
+        return os.path.join(self.directory, name)
+
+    def _disk_files(self) -> list:
+        """ディスクキャッシュのファイルの一覧（パス, サイズ, 更新時刻）"""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(_DISK_SUFFIX):
+                stat = entry.stat()
+                files.append((entry.path, stat.st_size, stat.st_mtime))
+        return files
+
+    def get(self, key: tuple):
+        """
+        キャッシュを取得
+
+        Returns:
+            (レスポンスのバイト列, 'memory' または 'disk') のタプル（キャッシュにない場合はNone）
+        """
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                return body, 'memory'
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                body = zlib.decompress(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, zlib.error) as e:
+            logger.warning(f'リプレイキャッシュの読み込みエラー: {e}')
+            return None
+        self._put_memory(key, body)
+        return body, 'disk'
+
+    def put(self, key: tuple, body: bytes):
+        """キャッシュに保存（メモリとディスクの両方）"""
+        self._put_memory(key, body)
+        if self.directory:
+            self._put_disk(key, body)
+
+    def _put_memory(self, key: tuple, body: bytes):
+        """メモリキャッシュに保存（上限を超える場合は古いエントリから削除）"""
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def _put_disk(self, key: tuple, body: bytes):
+        """ディスクキャッシュに保存（一時ファイルに書き込んでから置き換える）"""
+        path = self._path(key)
+        data = zlib.compress(body, REPLAY_CACHE_COMPRESSION_LEVEL)
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(temporary, 'wb') as f:
+                f.write(data)
+            os.replace(temporary, path)
+        except OSError as e:
+            logger.warning(f'リプレイキャッシュの書き込みエラー: {e}')
+            return
+        with self._lock:
+            self._disk_bytes += len(data)
+            over = self._disk_bytes > self.disk_max_bytes
+        if over:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """ディスクキャッシュを上限の9割まで古いファイルから削除"""
+        files = sorted(self._disk_files(), key=lambda item: item[2])
+        total = sum(size for _, size, _ in files)
+        target = self.disk_max_bytes * 0.9
+        for path, size, _ in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+    def invalidate(self, session_id: str):
+        """セッションのキャッシュをすべて削除"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == session_id]:
+                self._bytes -= len(self._entries.pop(key))
+        if not self.directory:
+            return
+        prefix = _session_prefix(session_id) + '-'
+        removed = 0
+        for path, size, _ in self._disk_files():
+            if os.path.basename(path).startswith(prefix):
+                try:
+                    os.remove(path)
+                    removed += size
+                except OSError:
+                    pass
+        with self._lock:
+            self._disk_bytes -= removed
+
+    def stats(self) -> dict:
+        """キャッシュの使用状況"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'disk_bytes': self._disk_bytes if self.directory else None,
+            }
@@ -0,0 +1,158 @@
+"""
+リプレイのバイナリ形式モジュール
+リプレイAPIのレスポンスを、JSON（行ごとのオブジェクト）の代わりに列ごとの配列（struct-of-arrays）で
+MessagePack または Apache Arrow IPC ストリームとして出力する
+キー名を行ごとに繰り返さないため、転送量とクライアントのデコード時間を削減できる
+
+列の形式（両形式で共通）:
+    timestamp_us: UTCのエポックからのマイクロ秒
+    operation_type, event_type, error_description, achievement_description: 文字列（NULLあり）
+    operation_value, position_x, position_y, position_z, velocity: 浮動小数点数（NULLあり）
+    error_event, achievement_event: 真偽値
+    equipment_state: 重機状態のJSON文字列（サーバーでは展開しない）
+"""
+
+import json
+from datetime import datetime, timedelta
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+try:
+    import pyarrow as pa
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+from .operation_log_blocks import OPERATION_LOG_RECORD_FIELDS, to_naive_utc
+
+
+# リプレイのレスポンスの形式
+REPLAY_MIMETYPE_JSON = 'application/json'
+REPLAY_MIMETYPE_MSGPACK = 'application/msgpack'
+REPLAY_MIMETYPE_ARROW = 'application/vnd.apache.arrow.stream'
+
+# MessagePack形式として受け付けるメディアタイプ（別名を含む）
+REPLAY_MSGPACK_ALIASES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+
+# 出力する列（連番は出力しない）
+REPLAY_COLUMNS = tuple(name for name in OPERATION_LOG_RECORD_FIELDS if name not in ('timestamp', 'sequence'))
+
+# Arrowのスキーマのメタデータで、リプレイの列以外の項目（セッション情報・KPIなど）を保存するキー
+ARROW_METADATA_KEY = b'replay'
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def replay_mimetypes() -> list:
+    """サーバーが出力できる形式（優先順、JSONが既定）"""
+    mimetypes = [REPLAY_MIMETYPE_JSON]
+    if MSGPACK_AVAILABLE:
+        mimetypes.extend(REPLAY_MSGPACK_ALIASES)
+    if PYARROW_AVAILABLE:
+        mimetypes.append(REPLAY_MIMETYPE_ARROW)
+    return mimetypes
+
+
+def negotiate_replay_mimetype(accept) -> str:
+    """
+    Acceptヘッダーからレスポンスの形式を決定
+
+    Args:
+        accept: リクエストのAcceptヘッダー（werkzeugのMIMEAccept）
+
+    Returns:
+        レスポンスの形式（受け付けられる形式がない場合はNone）
+    """
+    if not accept:
+        return REPLAY_MIMETYPE_JSON
+    mimetype = accept.best_match(replay_mimetypes())
+    if mimetype in REPLAY_MSGPACK_ALIASES:
+        return REPLAY_MIMETYPE_MSGPACK
+    return mimetype
+
+
+def replay_columns(records: list) -> dict:
+    """
+    操作ログのレコードを列ごとの配列に変換
+
+    Args:
+        records: OPERATION_LOG_RECORD_FIELDS の順の列を持つレコード（load_operation_logs() の結果）
+
+    Returns:
+        列名 → 値のリスト の辞書（timestamp は timestamp_us に変換）
+    """
+    if not records:
+        columns = {name: [] for name in REPLAY_COLUMNS}
+        columns['timestamp_us'] = []
+        return columns
+    transposed = dict(zip(OPERATION_LOG_RECORD_FIELDS, zip(*records)))
+    columns = {'timestamp_us': [(to_naive_utc(value) - _EPOCH) // _MICROSECOND for value in transposed['timestamp']]}
+    for name in REPLAY_COLUMNS:
+        columns[name] = list(transposed[name])
+    # 旧データのNULLは既定値に揃える（JSON形式と同じ値）
+    for name in ('error_event', 'achievement_event'):
+        columns[name] = [bool(value) for value in columns[name]]
+    return columns
+
+
+def encode_replay_msgpack(replay_data: dict, columns: dict) -> bytes:
+    """
+    リプレイをMessagePackに変換
+
+    Args:
+        replay_data: 操作ログ以外の項目（セッション情報、AI評価、KPIスコアなど）
+        columns: replay_columns() の結果
+
+    Returns:
+        {'success': True, 'data': {..., 'operation_log_columns': 列}} のMessagePack
+    """
+    return msgpack.packb({'success': True, 'data': dict(replay_data, operation_log_columns=columns)})
+
+
+def encode_replay_arrow(replay_data: dict, columns: dict) -> bytes:
+    """
+    リプレイをArrow IPCストリームに変換
+    操作ログは1つのレコードバッチ、それ以外の項目はスキーマのメタデータ（キー: replay）にJSONで保存する
+
+    Args:
+        replay_data: 操作ログ以外の項目（セッション情報、AI評価、KPIスコアなど）
+        columns: replay_columns() の結果
+
+    Returns:
+        Arrow IPCストリーム
+    """
+    fields = [
+        ('timestamp_us', pa.timestamp('us', tz='UTC')),
+        ('operation_type', pa.string()),
+        ('operation_value', pa.float64()),
+        ('equipment_state', pa.string()),
+        ('position_x', pa.float64()),
+        ('position_y', pa.float64()),
+        ('position_z', pa.float64()),
+        ('velocity', pa.float64()),
+        ('error_event', pa.bool_()),
+        ('error_description', pa.string()),
+        ('achievement_event', pa.bool_()),
+        ('achievement_description', pa.string()),
+        ('event_type', pa.string()),
+    ]
+    metadata = {ARROW_METADATA_KEY: json.dumps(replay_data).encode('utf-8')}
+    schema = pa.schema(fields, metadata=metadata)
+    batch = pa.record_batch([pa.array(columns[name], type=type_) for name, type_ in fields], schema=schema)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_replay(mimetype: str, replay_data: dict, records: list) -> bytes:
+    """リプレイを指定の形式（MessagePack / Arrow）に変換"""
+    columns = replay_columns(records)
+    if mimetype == REPLAY_MIMETYPE_ARROW:
+        return encode_replay_arrow(replay_data, columns)
+    return encode_replay_msgpack(replay_data, columns)
@@ -0,0 +1,654 @@
+"""
+スキル転置インデックスモジュール
+正規スキルID → 応募者ID / 求人ID の転置インデックスを保持し、
+スキルを1つ以上共有する組み合わせだけをマッチング対象にする
+他のプロセスでコミットされた変更は変更ログ（skill_index_changesテーブル）から差分反映する
+"""
+
+import os
+import heapq
+import math
+import time
+import threading
+import weakref
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, inspect, insert, delete, func, or_
+from sqlalchemy.orm import Session, object_session
+
+from .database import Applicant, JobPosting, SkillIndexChange
+from .skills import SkillNormalizer, get_skill_normalizer
+
+
+# スコア計算方式
+# overlap: 共通スキル数 / 必要スキル数
+# idf: 共通スキルのIDF合計 / 必要スキルのIDF合計（希少なスキルほど重く評価する）
+SCORING_OVERLAP = 'overlap'
+SCORING_IDF = 'idf'
+SCORING_MODES = (SCORING_OVERLAP, SCORING_IDF)
+
+# 変更ログを確認する間隔（秒、他のプロセスの変更がインデックスに反映されるまでの最大の遅れ）
+SKILL_INDEX_CHECK_INTERVAL = float(os.getenv('SKILL_INDEX_CHECK_INTERVAL', '1.0'))
+
+# 変更ログの欠番（コミット順と採番順が異なるトランザクション）を待つ時間（秒）
+SKILL_INDEX_GAP_TIMEOUT = float(os.getenv('SKILL_INDEX_GAP_TIMEOUT', '60'))
+
+# 変更ログの保持期間（時間、これより長く確認しなかったインデックスは全件構築し直す）
+SKILL_INDEX_CHANGE_RETENTION_HOURS = float(os.getenv('SKILL_INDEX_CHANGE_RETENTION_HOURS', '24'))
+
+# 差分反映時に1回のクエリで読み込むID数
+_CATCH_UP_BATCH_SIZE = 500
+
+# コミット待ちの変更を保持するSession.infoのキー
+_PENDING_CHANGES_KEY = 'skill_index_pending_changes'
+
+# 変更ログに未記録の変更を保持するSession.infoのキー
+_UNLOGGED_CHANGES_KEY = 'skill_index_unlogged_changes'
+
+# 古い変更ログを最後に削除した時刻
+_last_pruned = 0.0
+
+# 変更通知を受け取るリスナー（engine, changes を引数に呼び出される）
+_change_listeners = []
+
+# エンジンごとのスキルインデックス（プロセス内で永続化）
+_indexes = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def add_change_listener(listener):
+    """
+    応募者・求人のスキル変更リスナーを登録
+
+    Args:
+        listener: listener(engine, changes) の形式で呼び出される関数
+                  changes は (種別, ID, スキル文字列, スキルID配列) のリスト（削除時はどちらもNone）
+    """
+    if listener not in _change_listeners:
+        _change_listeners.append(listener)
+
+
+def _record_change(kind, target, deleted=False):
+    """フラッシュ中の変更をセッションに記録（コミット時に通知）"""
+    session = object_session(target)
+    if session is None:
+        return
+    if deleted:
+        skills, skill_ids = None, None
+    else:
+        skills = target.skills if kind == 'applicant' else target.required_skills
+        skill_ids = target.skill_ids
+    session.info.setdefault(_PENDING_CHANGES_KEY, []).append((kind, target.id, skills, skill_ids))
+    session.info.setdefault(_UNLOGGED_CHANGES_KEY, []).append((kind, target.id))
+
+
+def _insert_change_log(connection, changes: list):
+    """
+    変更ログを記録（変更と同じトランザクション）
+    1時間に1回、保持期間を過ぎた変更ログを削除する
+
+    Args:
+        connection: データベース接続（またはセッション）
+        changes: (種別, ID) のリスト
+    """
+    global _last_pruned
+    now = datetime.now()
+    connection.execute(insert(SkillIndexChange), [
+        {'kind': kind, 'row_id': row_id, 'created_at': now} for kind, row_id in changes
+    ])
+    if time.monotonic() - _last_pruned > 3600:
+        _last_pruned = time.monotonic()
+        connection.execute(delete(SkillIndexChange).where(
+            SkillIndexChange.created_at < now - timedelta(hours=SKILL_INDEX_CHANGE_RETENTION_HOURS)
+        ))
+
+
+def record_changes(session, changes: list):
+    """
+    ORMのイベントを経由しない変更（一括UPDATEなど）をセッションに記録（コミット時に通知）
+    変更ログにも記録するため、他のプロセスのインデックスにも反映される
+
+    Args:
+        session: データベースセッション
+        changes: (種別, ID, スキル文字列, スキルID配列) のリスト
+                 種別が skills の場合はスキル名・別名の変更（インデックスを全件構築し直す）
+    """
+    session.info.setdefault(_PENDING_CHANGES_KEY, []).extend(changes)
+    _insert_change_log(session, [(kind, row_id) for kind, row_id, *_ in changes])
+
+
+@event.listens_for(Applicant, 'after_insert')
+def _applicant_inserted(mapper, connection, target):
+    _record_change('applicant', target)
+
+
+@event.listens_for(Applicant, 'after_update')
+def _applicant_updated(mapper, connection, target):
+    if inspect(target).attrs.skills.history.has_changes():
+        _record_change('applicant', target)
+
+
+@event.listens_for(Applicant, 'after_delete')
+def _applicant_deleted(mapper, connection, target):
+    _record_change('applicant', target, deleted=True)
+
+
+@event.listens_for(JobPosting, 'after_insert')
+def _job_inserted(mapper, connection, target):
+    _record_change('job', target)
+
+
+@event.listens_for(JobPosting, 'after_update')
+def _job_updated(mapper, connection, target):
+    if inspect(target).attrs.required_skills.history.has_changes():
+        _record_change('job', target)
+
+
+@event.listens_for(JobPosting, 'after_delete')
+def _job_deleted(mapper, connection, target):
+    _record_change('job', target, deleted=True)
+
+
+@event.listens_for(Session, 'after_flush')
+def _log_changes(session, flush_context):
+    """フラッシュした変更を変更ログに記録"""
+    changes = session.info.pop(_UNLOGGED_CHANGES_KEY, None)
+    if changes:
+        _insert_change_log(session.connection(), changes)
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_changes(session):
+    """コミットされた変更をリスナーに通知"""
+    changes = session.info.pop(_PENDING_CHANGES_KEY, None)
+    if not changes:
+        return
+    engine = session.get_bind()
+    for listener in list(_change_listeners):
+        listener(engine, changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    """ロールバックされた変更を破棄"""
+    session.info.pop(_PENDING_CHANGES_KEY, None)
+    session.info.pop(_UNLOGGED_CHANGES_KEY, None)
+
+
+class SkillIndex:
+    """
+    スキル転置インデックス
+    応募者・求人のスキルID集合と、スキルID → 応募者ID / 求人ID の転置リスト（postings）を保持する
+    """
+
+    def __init__(self, normalizer: SkillNormalizer = None):
+        """
+        初期化
+
+        Args:
+            normalizer: スキル正規化辞書（省略時はskillsテーブルを参照しない空の辞書）
+        """
+        self._lock = threading.RLock()
+        self.loaded = False
+        self.normalizer = normalizer or SkillNormalizer()
+        self._normalizer_version = None
+        self.applicant_skills = {}  # 応募者ID → スキルID集合
+        self.job_skills = {}  # 求人ID → スキルID集合
+        self.job_skill_counts = {}  # 求人ID → 必要スキル数（スコアの分母）
+        self.job_skill_texts = {}  # 求人ID → 必要スキル文字列
+        self.job_skill_labels = {}  # 求人ID → [(スキルID, 表示用スキル名)]（表示時に生成）
+        self.skill_applicants = defaultdict(set)  # スキルID → 応募者IDの集合
+        self.skill_jobs = defaultdict(set)  # スキルID → 求人IDの集合
+        self._version = 0  # 応募者・求人が変更されるたびに増加
+        self._idf_cache = None  # (バージョン, スキルID → IDF, 求人ID → 必要スキルのIDF合計)
+        self._pinned_idf = None  # スナップショットから構築した場合に固定するIDF
+        self._change_id = 0  # 反映済みの変更ログの最大ID
+        self._missing_changes = {}  # 変更ログの欠番 → 検出した時刻（後からコミットされる可能性がある）
+        self._checked_at = 0.0  # 変更ログを最後に確認した時刻
+
+    def build(self, session):
+        """
+        データベースからインデックスを全件構築
+
+        Args:
+            session: データベースセッション
+        """
+        self.normalizer.ensure_loaded(session)
+        # 構築中にコミットされた変更は次回の確認で反映する
+        change_id = session.query(func.max(SkillIndexChange.id)).scalar() or 0
+        # 書き込み時に生成済みのスキルID配列を読み込み、未生成の行のみ文字列を解析する
+        applicant_rows = session.query(Applicant.id, Applicant.skill_ids).all()
+        unparsed_applicants = dict(session.query(Applicant.id, Applicant.skills).filter(
+            Applicant.skill_ids.is_(None), Applicant.skills.isnot(None)
+        ).all())
+        job_rows = session.query(JobPosting.id, JobPosting.required_skills, JobPosting.skill_ids).all()
+
+        with self._lock:
+            self._normalizer_version = self.normalizer.version
+            self.applicant_skills.clear()
+            self.job_skills.clear()
+            self.job_skill_counts.clear()
+            self.job_skill_texts.clear()
+            self.job_skill_labels.clear()
+            self.skill_applicants.clear()
+            self.skill_jobs.clear()
+            self._version += 1
+            for applicant_id, skill_ids in applicant_rows:
+                self.update_applicant(applicant_id, unparsed_applicants.get(applicant_id), skill_ids)
+            for job_id, required_skills, skill_ids in job_rows:
+                self.update_job(job_id, required_skills, skill_ids)
+            self._change_id = change_id
+            self._missing_changes.clear()
+            self._checked_at = time.monotonic()
+            self.loaded = True
+
+    def ensure_loaded(self, session):
+        """
+        未構築、またはスキル正規化辞書が更新された場合はインデックスを構築
+        構築済みの場合は SKILL_INDEX_CHECK_INTERVAL ごとに変更ログを確認し、他のプロセスの変更を反映する
+        """
+        if not self.loaded or self.normalizer.stale or self._normalizer_version != self.normalizer.version:
+            self.build(session)
+            return
+        elapsed = time.monotonic() - self._checked_at
+        if elapsed >= SKILL_INDEX_CHANGE_RETENTION_HOURS * 3600:
+            # 未反映の変更ログが削除されている可能性がある
+            self.build(session)
+        elif elapsed >= SKILL_INDEX_CHECK_INTERVAL:
+            self.catch_up(session)
+
+    def catch_up(self, session):
+        """
+        変更ログから未反映の変更を読み込み、変更された応募者・求人をデータベースから差分反映
+        採番順にコミットされなかった変更ログの欠番は SKILL_INDEX_GAP_TIMEOUT の間、確認を続ける
+
+        Args:
+            session: データベースセッション
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._checked_at = now
+            last = self._change_id
+            condition = SkillIndexChange.id > last
+            if self._missing_changes:
+                condition = or_(condition, SkillIndexChange.id.in_(list(self._missing_changes)))
+            rows = session.query(SkillIndexChange.id, SkillIndexChange.kind, SkillIndexChange.row_id).filter(
+                condition
+            ).order_by(SkillIndexChange.id).all()
+            if not rows and not self._missing_changes:
+                return
+            seen = {change_id for change_id, _, _ in rows}
+            newest = max(seen | {last})
+            for change_id in range(last + 1, newest):
+                if change_id not in seen:
+                    self._missing_changes.setdefault(change_id, now)
+            self._missing_changes = {
+                change_id: found_at for change_id, found_at in self._missing_changes.items()
+                if change_id not in seen and now - found_at < SKILL_INDEX_GAP_TIMEOUT
+            }
+            self._change_id = newest
+            if not rows:
+                return
+            if any(kind == 'skills' for _, kind, _ in rows):
+                # スキル名・別名が変更された場合は辞書から読み直す
+                self.normalizer.invalidate()
+                self.build(session)
+                return
+            applicant_ids = sorted({row_id for _, kind, row_id in rows if kind == 'applicant'})
+            job_ids = sorted({row_id for _, kind, row_id in rows if kind == 'job'})
+            changes = []
+            for kind, model, column, ids in (
+                ('applicant', Applicant, Applicant.skills, applicant_ids),
+                ('job', JobPosting, JobPosting.required_skills, job_ids),
+            ):
+                for start in range(0, len(ids), _CATCH_UP_BATCH_SIZE):
+                    batch = ids[start:start + _CATCH_UP_BATCH_SIZE]
+                    found = {
+                        row_id: (text, skill_ids) for row_id, text, skill_ids in
+                        session.query(model.id, column, model.skill_ids).filter(model.id.in_(batch))
+                    }
+                    for row_id in batch:
+                        # 削除された行はどちらもNone
+                        text, skill_ids = found.get(row_id, (None, None))
+                        changes.append((kind, row_id, text, skill_ids))
+            self.apply_changes(changes)
+
+    def update_applicant(self, applicant_id: int, skills: str, skill_ids: list = None):
+        """
+        応募者のスキルを登録・更新
+
+        Args:
+            applicant_id: 応募者ID
+            skills: スキル（カンマ区切り、skill_idsがない場合のみ解析）
+            skill_ids: 生成済みのスキルID配列
+        """
+        if skill_ids is not None:
+            self.set_applicant_skills(applicant_id, frozenset(skill_ids))
+        else:
+            self.set_applicant_skills(applicant_id, self.normalizer.to_id_set(skills))
+
+    def set_applicant_skills(self, applicant_id: int, skill_set: frozenset):
+        """応募者のスキルID集合を登録・更新"""
+        with self._lock:
+            self.remove_applicant(applicant_id)
+            if not skill_set:
+                return
+            self._version += 1
+            self.applicant_skills[applicant_id] = skill_set
+            for skill in skill_set:
+                self.skill_applicants[skill].add(applicant_id)
+
+    def remove_applicant(self, applicant_id: int):
+        """応募者をインデックスから削除"""
+        with self._lock:
+            if applicant_id in self.applicant_skills:
+                self._version += 1
+            for skill in self.applicant_skills.pop(applicant_id, ()):
+                postings = self.skill_applicants.get(skill)
+                if postings is not None:
+                    postings.discard(applicant_id)
+                    if not postings:
+                        del self.skill_applicants[skill]
+
+    def update_job(self, job_id: int, required_skills: str, skill_ids: list = None):
+        """
+        求人の必要スキルを登録・更新
+
+        Args:
+            job_id: 求人ID
+            required_skills: 必要スキル（カンマ区切り、表示用。skill_idsがない場合は解析）
+            skill_ids: 生成済みのスキルID配列
+        """
+        with self._lock:
+            self.remove_job(job_id)
+            if skill_ids is not None:
+                skill_set = frozenset(skill_ids)
+            else:
+                skill_set = self.normalizer.to_id_set(required_skills)
+            if not skill_set:
+                return
+            self._version += 1
+            self.job_skills[job_id] = skill_set
+            # 別名で同じスキルが重複して記載されていても1スキルとして数える
+            self.job_skill_counts[job_id] = len(skill_set)
+            self.job_skill_texts[job_id] = required_skills
+            for skill in skill_set:
+                self.skill_jobs[skill].add(job_id)
+
+    def remove_job(self, job_id: int):
+        """求人をインデックスから削除"""
+        with self._lock:
+            if job_id in self.job_skills:
+                self._version += 1
+            self.job_skill_counts.pop(job_id, None)
+            self.job_skill_texts.pop(job_id, None)
+            self.job_skill_labels.pop(job_id, None)
+            for skill in self.job_skills.pop(job_id, ()):
+                postings = self.skill_jobs.get(skill)
+                if postings is not None:
+                    postings.discard(job_id)
+                    if not postings:
+                        del self.skill_jobs[skill]
+
+    def snapshot_jobs(self, scoring: str = SCORING_OVERLAP) -> tuple:
+        """
+        求人側のインデックスのスナップショットを取得（並列マッチングのワーカー配布用）
+
+        Args:
+            scoring: スコア計算方式（idfの場合は全体から計算したIDFを含める）
+
+        Returns:
+            (求人スキル集合, 必要スキル数, 表示用スキル名, IDFまたはNone) のタプル
+        """
+        with self._lock:
+            labels = {job_id: self._job_labels(job_id) for job_id in self.job_skills}
+            idf = self.idf_weights() if scoring == SCORING_IDF else None
+            return dict(self.job_skills), dict(self.job_skill_counts), labels, idf
+
+    @classmethod
+    def from_jobs_snapshot(cls, snapshot: tuple):
+        """
+        求人側のスナップショットから読み取り専用のインデックスを構築
+        IDFはスナップショット時点の値に固定する（ワーカーは応募者の一部しか保持しないため）
+        """
+        index = cls()
+        job_skills, job_skill_counts, job_skill_labels, idf = snapshot
+        index.job_skills = job_skills
+        index.job_skill_counts = job_skill_counts
+        index.job_skill_labels = job_skill_labels
+        index._pinned_idf = idf
+        for job_id, skill_set in job_skills.items():
+            for skill in skill_set:
+                index.skill_jobs[skill].add(job_id)
+        index.loaded = True
+        return index
+
+    def apply_changes(self, changes):
+        """
+        コミットされた変更を差分適用
+
+        Args:
+            changes: (種別, ID, スキル文字列, スキルID配列) のリスト（削除時はどちらもNone）
+        """
+        with self._lock:
+            if not self.loaded or self.normalizer.stale:
+                # 未構築、またはスキル正規化辞書が無効化された場合は次回の構築時にデータベースから読み込まれる
+                self.loaded = False
+                return
+            for kind, row_id, skills, skill_ids in changes:
+                if kind == 'applicant':
+                    if skills is None and skill_ids is None:
+                        self.remove_applicant(row_id)
+                    else:
+                        self.update_applicant(row_id, skills, skill_ids)
+                elif kind == 'job':
+                    if skills is None and skill_ids is None:
+                        self.remove_job(row_id)
+                    else:
+                        self.update_job(row_id, skills, skill_ids)
+
+    def applicant_ids(self) -> list:
+        """スキルを持つ応募者IDの一覧を取得（ID順）"""
+        with self._lock:
+            return sorted(self.applicant_skills)
+
+    def job_ids(self) -> list:
+        """必要スキルが設定された求人IDの一覧を取得（ID順）"""
+        with self._lock:
+            return sorted(self.job_skills)
+
+    def jobs_for_applicant(self, applicant_id: int, scoring: str = SCORING_OVERLAP) -> dict:
+        """
+        応募者とスキルを共有する求人を取得
+
+        Args:
+            applicant_id: 応募者ID
+            scoring: スコア計算方式
+
+        Returns:
+            求人ID → 共通スキル数（idfの場合は共通スキルのIDF合計） の辞書
+        """
+        overlaps = defaultdict(int)
+        with self._lock:
+            idf = self.idf_weights()[0] if scoring == SCORING_IDF else None
+            for skill in self.applicant_skills.get(applicant_id, ()):
+                weight = idf[skill] if idf is not None else 1
+                for job_id in self.skill_jobs.get(skill, ()):
+                    overlaps[job_id] += weight
+        return overlaps
+
+    def applicants_for_job(self, job_id: int, scoring: str = SCORING_OVERLAP) -> dict:
+        """
+        求人とスキルを共有する応募者を取得
+
+        Args:
+            job_id: 求人ID
+            scoring: スコア計算方式
+
+        Returns:
+            応募者ID → 共通スキル数（idfの場合は共通スキルのIDF合計） の辞書
+        """
+        overlaps = defaultdict(int)
+        with self._lock:
+            idf = self.idf_weights()[0] if scoring == SCORING_IDF else None
+            for skill in self.job_skills.get(job_id, ()):
+                weight = idf[skill] if idf is not None else 1
+                for applicant_id in self.skill_applicants.get(skill, ()):
+                    overlaps[applicant_id] += weight
+        return overlaps
+
+    def top_applicants_for_job(self, job_id: int, k: int, scoring: str = SCORING_OVERLAP) -> list:
+        """
+        求人に対するスコア上位K件の応募者を取得
+        必要スキルをすべて持つ応募者（スコア100）の積集合がK件以上あれば、
+        転置リストを短い順に積集合を取った時点で打ち切る
+
+        Args:
+            job_id: 求人ID
+            k: 取得件数
+            scoring: スコア計算方式
+
+        Returns:
+            (応募者ID, スコア) のリスト（スコアの降順、同点は応募者ID順）
+        """
+        with self._lock:
+            skills = self.job_skills.get(job_id)
+            if not skills or k <= 0:
+                return []
+            postings = sorted((self.skill_applicants.get(s, set()) for s in skills), key=len)
+            full_match = set(postings[0])
+            for posting in postings[1:]:
+                if len(full_match) < k:
+                    break
+                full_match &= posting
+            else:
+                # 必要スキルをすべて持つ応募者はどちらの計算方式でもスコア100
+                if len(full_match) >= k:
+                    return [(applicant_id, 100.0) for applicant_id in heapq.nsmallest(k, full_match)]
+
+        overlaps = self.applicants_for_job(job_id, scoring)
+        top = heapq.nlargest(k, overlaps.items(), key=lambda item: (item[1], -item[0]))
+        return [(applicant_id, self.score(job_id, overlap, scoring)) for applicant_id, overlap in top]
+
+    def top_jobs_for_applicant(self, applicant_id: int, k: int, scoring: str = SCORING_OVERLAP) -> list:
+        """
+        応募者に対するスコア上位K件の求人を取得
+        上位K件のみを有界ヒープで保持する
+
+        Args:
+            applicant_id: 応募者ID
+            k: 取得件数
+            scoring: スコア計算方式
+
+        Returns:
+            (求人ID, スコア) のリスト（スコアの降順、同点は求人ID順）
+        """
+        if k <= 0:
+            return []
+        overlaps = self.jobs_for_applicant(applicant_id, scoring)
+        scored = ((self.score(job_id, overlap, scoring), -job_id) for job_id, overlap in overlaps.items())
+        return [(-neg_job_id, score) for score, neg_job_id in heapq.nlargest(k, scored)]
+
+    def score(self, job_id: int, overlap: float, scoring: str = SCORING_OVERLAP) -> float:
+        """
+        共通スキル数からマッチングスコアを計算
+
+        Args:
+            job_id: 求人ID
+            overlap: 共通スキル数（idfの場合は共通スキルのIDF合計）
+            scoring: スコア計算方式
+
+        Returns:
+            マッチングスコア (0-100)
+        """
+        if scoring == SCORING_IDF:
+            total = self.idf_weights()[1].get(job_id)
+        else:
+            total = self.job_skill_counts.get(job_id)
+        if not total:
+            return 0.0
+        return min((overlap / total) * 100, 100.0)
+
+    def idf_weights(self) -> tuple:
+        """
+        スキルのIDF（逆文書頻度）を取得
+        文書数は応募者数 + 求人数、文書頻度は転置リストの長さから求める。
+        IDFは応募者・求人が変更された後の最初の参照時にのみ再計算され、組み合わせごとには計算しない
+
+        Returns:
+            (スキルID → IDF, 求人ID → 必要スキルのIDF合計) のタプル
+        """
+        if self._pinned_idf is not None:
+            return self._pinned_idf
+        with self._lock:
+            cache = self._idf_cache
+            if cache is None or cache[0] != self._version:
+                n_docs = len(self.applicant_skills) + len(self.job_skills)
+                idf = {}
+                for skill in self.skill_applicants.keys() | self.skill_jobs.keys():
+                    df = len(self.skill_applicants.get(skill, ())) + len(self.skill_jobs.get(skill, ()))
+                    idf[skill] = math.log((1 + n_docs) / (1 + df)) + 1.0
+                job_weights = {
+                    job_id: sum(idf[skill] for skill in skill_set)
+                    for job_id, skill_set in self.job_skills.items()
+                }
+                cache = self._idf_cache = (self._version, idf, job_weights)
+            return cache[1], cache[2]
+
+    def skill_idf(self, skill_id: int) -> float:
+        """スキル1件のIDFを取得（インデックスに存在しないスキルは文書頻度0として扱う）"""
+        idf = self.idf_weights()[0].get(skill_id)
+        if idf is None:
+            n_docs = len(self.applicant_skills) + len(self.job_skills)
+            idf = math.log(1 + n_docs) + 1.0
+        return idf
+
+    def _job_labels(self, job_id: int) -> list:
+        """求人の (スキルID, 表示用スキル名) のリストを取得（初回のみ必要スキル文字列を解析）"""
+        labels = self.job_skill_labels.get(job_id)
+        if labels is None:
+            labels = self.normalizer.to_ids(self.job_skill_texts.get(job_id))
+            self.job_skill_labels[job_id] = labels
+        return labels
+
+    def matched_skills(self, applicant_id: int, job_id: int) -> str:
+        """マッチしたスキルを表示用文字列で取得（求人の記載順）"""
+        applicant_skills = self.applicant_skills.get(applicant_id, frozenset())
+        seen = set()
+        labels = []
+        for skill_id, label in self._job_labels(job_id):
+            if skill_id in applicant_skills and skill_id not in seen:
+                seen.add(skill_id)
+                labels.append(label)
+        return ', '.join(labels)
+
+
+def _apply_to_index(engine, changes):
+    """コミットされた変更を該当エンジンのインデックスへ反映"""
+    index = _indexes.get(engine)
+    if index is not None:
+        index.apply_changes(changes)
+
+
+add_change_listener(_apply_to_index)
+
+
+def get_skill_index(db) -> SkillIndex:
+    """
+    データベースに対応するスキルインデックスを取得
+    インデックスはエンジン単位でプロセス内に保持され、
+    応募者・求人の変更がコミットされるたびに差分更新される
+
+    Args:
+        db: データベースインスタンス
+
+    Returns:
+        SkillIndex: スキル転置インデックス
+    """
+    with _indexes_lock:
+        index = _indexes.get(db.engine)
+        if index is None:
+            index = SkillIndex(get_skill_normalizer(db.engine))
+            _indexes[db.engine] = index
+        return index
@@ -2,8 +2,335 @@
 スキル管理モジュール
 """
 
+import itertools
+import threading
+import unicodedata
+import weakref
 from datetime import datetime
-from .database import Database, Skill
+from sqlalchemy import event, select, update, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from .database import Database, Skill, SkillTerm, Applicant, JobPosting, Worker
+
+
+# エンジンごとのスキル正規化辞書（プロセス内キャッシュ）
+_normalizers = weakref.WeakKeyDictionary()
+_normalizers_lock = threading.Lock()
+
+# スキルID配列（skill_ids）の生成元となるスキル文字列カラム
+SKILL_TEXT_COLUMNS = {
+    Applicant: 'skills',
+    JobPosting: 'required_skills',
+    Worker: 'skills',
+}
+
+# スキルID配列の再生成時に差分マッチングへ通知する変更の種別
+_REMATCH_KINDS = {
+    Applicant: 'applicant',
+    JobPosting: 'job',
+}
+
+
+def normalize_skill_name(name: str) -> str:
+    """
+    スキル名を正規化
+    NFKC正規化（全角英数字→半角など）、小文字化、空白の統一を行う
+    
+    Args:
+        name: スキル名
+    
+    Returns:
+        正規化されたスキル名
+    """
+    return ' '.join(unicodedata.normalize('NFKC', name).lower().split())
+
+
+def split_skill_names(text: str) -> list:
+    """カンマ区切りの文字列を分割（読点「、」も区切りとして扱う）"""
+    if not text:
+        return []
+    return [s.strip() for s in text.replace('、', ',').split(',') if s.strip()]
+
+
+# データベースを参照できない場合に未登録スキルへ割り当てる一時ID（保存しない、skill_termsのIDと重ならない範囲）
+_TRANSIENT_ID_START = -(2 ** 40)
+
+
+def _dialect_insert(connection):
+    """接続のデータベースに対応するINSERT文（競合時に何もしない指定ができるもの、非対応の場合はNone）"""
+    bind = connection.get_bind() if isinstance(connection, Session) else connection
+    return {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}.get(bind.dialect.name)
+
+
+class SkillNormalizer:
+    """
+    スキル正規化辞書
+    skillsテーブルのスキル名・別名、skill_termsテーブルの未登録スキル名を正規化した文字列 → スキルIDのキャッシュを保持する
+    skillsテーブルが変更されると無効化され、次回の読み込み時に再構築される
+    """
+    
+    def __init__(self, engine=None):
+        """
+        初期化
+        
+        Args:
+            engine: 未登録スキルのIDを参照するデータベースエンジン（省略時はデータベースを参照せず一時IDを使用）
+        """
+        self._lock = threading.RLock()
+        self._engine = weakref.ref(engine) if engine is not None else None
+        self.alias_to_id = {}  # 正規化したスキル名・別名 → スキルID
+        self.names = {}  # スキルID → スキル名
+        self.version = 0  # 読み込みごとに増加（インデックスの再構築判定用）
+        self.stale = True
+        self._created = set()  # このプロセスで追加した未登録スキル名（コミット前にロールバックされる可能性がある）
+        self._transient = {}  # 正規化したスキル名 → 一時ID
+        self._transient_ids = itertools.count(_TRANSIENT_ID_START, -1)
+    
+    def load(self, connection):
+        """
+        skillsテーブルから辞書を読み込み
+        
+        Args:
+            connection: データベース接続（またはセッション）
+        """
+        rows = connection.execute(select(Skill.id, Skill.name, Skill.aliases)).all()
+        terms = connection.execute(select(SkillTerm.id, SkillTerm.name)).all()
+        alias_to_id = {}
+        names = {}
+        for skill_id, name, aliases in rows:
+            names[skill_id] = name
+            alias_to_id[normalize_skill_name(name)] = skill_id
+        # スキル名を優先し、別名・未登録スキル名は登録されていないものだけを追加
+        for skill_id, name, aliases in rows:
+            for alias in split_skill_names(aliases):
+                alias_to_id.setdefault(normalize_skill_name(alias), skill_id)
+        for term_id, name in terms:
+            alias_to_id.setdefault(name, -term_id)
+        with self._lock:
+            self.alias_to_id = alias_to_id
+            self.names = names
+            self._created.clear()
+            self._transient.clear()
+            self.version += 1
+            self.stale = False
+    
+    def ensure_loaded(self, connection):
+        """無効化されている場合のみ辞書を読み込み"""
+        if self.stale:
+            self.load(connection)
+    
+    def invalidate(self):
+        """辞書を無効化（skillsテーブルの変更時）"""
+        self.stale = True
+    
+    def discard_created(self):
+        """このプロセスで追加した未登録スキル名をキャッシュから除く（ロールバック時、次回の参照時に読み直す）"""
+        with self._lock:
+            for name in self._created:
+                self.alias_to_id.pop(name, None)
+            self._created.clear()
+    
+    def skill_id(self, name: str, connection=None) -> int:
+        """
+        スキル名を正規スキルIDに変換
+        skillsテーブルに登録されていないスキルは、skill_termsテーブルに登録したIDの負の値を返す
+        （プロセスをまたいでも同じ値になり、異なるスキル名が同じIDになることはない）
+        
+        Args:
+            name: スキル名（未正規化でも可）
+            connection: 未登録スキルをskill_termsテーブルに追加する接続（またはセッション）
+                        省略時は追加せず、登録済みでなければ一時ID（保存しない）を返す
+        
+        Returns:
+            スキルID
+        """
+        normalized = normalize_skill_name(name)
+        skill_id = self.alias_to_id.get(normalized)
+        if skill_id is not None:
+            return skill_id
+        if connection is not None:
+            skill_id = self._insert_term(connection, normalized)
+        else:
+            skill_id = self._find_term(normalized)
+            if skill_id is None:
+                with self._lock:
+                    skill_id = self._transient.get(normalized)
+                    if skill_id is None:
+                        skill_id = self._transient[normalized] = next(self._transient_ids)
+                return skill_id
+        with self._lock:
+            self.alias_to_id[normalized] = skill_id
+        return skill_id
+    
+    def _insert_term(self, connection, normalized: str) -> int:
+        """未登録スキル名をskill_termsテーブルに追加してIDを取得（登録済みの場合はそのIDを返す）"""
+        table = SkillTerm.__table__
+        dialect_insert = _dialect_insert(connection)
+        query = select(table.c.id).where(table.c.name == normalized)
+        if dialect_insert is not None:
+            # 他のプロセスが同時に追加した場合は、そちらのIDを使用する
+            connection.execute(
+                dialect_insert(table).values(name=normalized, created_at=datetime.now())
+                .on_conflict_do_nothing(index_elements=['name'])
+            )
+            term_id = connection.execute(query).scalar_one()
+        else:
+            term_id = connection.execute(query).scalar()
+            if term_id is None:
+                term_id = connection.execute(
+                    table.insert().values(name=normalized, created_at=datetime.now())
+                ).inserted_primary_key[0]
+        with self._lock:
+            self._created.add(normalized)
+        return -term_id
+    
+    def _find_term(self, normalized: str):
+        """他のプロセスで追加された未登録スキル名のIDを取得（見つからない場合はNone）"""
+        engine = self._engine() if self._engine is not None else None
+        if engine is None:
+            return None
+        with engine.connect() as conn:
+            term_id = conn.execute(select(SkillTerm.id).where(SkillTerm.name == normalized)).scalar()
+        return -term_id if term_id is not None else None
+    
+    def to_ids(self, text: str, connection=None) -> list:
+        """
+        カンマ区切りのスキル文字列をスキルIDに変換
+        
+        Args:
+            text: スキル文字列
+            connection: 未登録スキルを追加する接続（skill_id() を参照）
+        
+        Returns:
+            (スキルID, 表示用スキル名) のリスト（入力順、重複は保持）
+        """
+        return [(self.skill_id(name, connection), name) for name in split_skill_names(text)]
+    
+    def to_id_set(self, text: str, connection=None) -> frozenset:
+        """カンマ区切りのスキル文字列をスキルIDの集合に変換"""
+        return frozenset(skill_id for skill_id, _ in self.to_ids(text, connection))
+
+
+def _invalidate_normalizer(mapper, connection, target):
+    """skillsテーブルの変更時に該当エンジンの辞書を無効化"""
+    normalizer = _normalizers.get(connection.engine)
+    if normalizer is not None:
+        normalizer.invalidate()
+
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Skill, _event_name, _invalidate_normalizer)
+
+
+def _assign_skill_ids(mapper, connection, target):
+    """書き込み時にスキル文字列からスキルID配列を生成"""
+    column = SKILL_TEXT_COLUMNS[mapper.class_]
+    state = inspect(target)
+    if state.has_identity and not state.attrs[column].history.has_changes():
+        return
+    normalizer = get_skill_normalizer(connection.engine)
+    normalizer.ensure_loaded(connection)
+    skill_ids = normalizer.to_id_set(getattr(target, column), connection)
+    target.skill_ids = sorted(skill_ids) if skill_ids else None
+
+
+for _model in SKILL_TEXT_COLUMNS:
+    event.listen(_model, 'before_insert', _assign_skill_ids)
+    event.listen(_model, 'before_update', _assign_skill_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_created_terms(session):
+    """ロールバックで取り消された可能性のある未登録スキル名をキャッシュから除く"""
+    bind = session.get_bind()
+    normalizer = _normalizers.get(getattr(bind, 'engine', bind))
+    if normalizer is not None:
+        normalizer.discard_created()
+
+
+def refresh_skill_ids(session, only_missing: bool = False) -> int:
+    """
+    応募者・求人・就労者のスキルID配列を再生成
+    skillsテーブル（スキル名・別名）の変更後に呼び出す
+    スキルID配列が変わった応募者・求人は、コミット時にスキルインデックスと差分マッチングへ通知される
+    
+    Args:
+        session: データベースセッション
+        only_missing: Trueの場合、スキルID配列が未生成の行のみ対象にする
+    
+    Returns:
+        更新した行数
+    """
+    normalizer = get_skill_normalizer(session.get_bind())
+    normalizer.load(session)
+    updated = 0
+    changes = []
+    for model, column in SKILL_TEXT_COLUMNS.items():
+        query = session.query(model.id, getattr(model, column), model.skill_ids)
+        if only_missing:
+            query = query.filter(model.skill_ids.is_(None), getattr(model, column).isnot(None))
+        rows = []
+        for row_id, text, current in query:
+            skill_ids = normalizer.to_id_set(text, session)
+            skill_ids = sorted(skill_ids) if skill_ids else None
+            if skill_ids != current:
+                rows.append({'id': row_id, 'skill_ids': skill_ids})
+                if model in _REMATCH_KINDS:
+                    changes.append((_REMATCH_KINDS[model], row_id, text, skill_ids))
+        if rows:
+            session.execute(update(model), rows)
+            updated += len(rows)
+    if not only_missing:
+        # スキル名・別名の変更を他のプロセスのスキルインデックスに通知
+        changes.append(('skills', None, None, None))
+    if changes:
+        # 一括UPDATEはORMのイベントを発生させないため、変更された応募者・求人をコミット時に通知する
+        # （スキルインデックスへの反映と差分マッチングの再計算）
+        from .skill_index import record_changes
+        record_changes(session, changes)
+    session.commit()
+    return updated
+
+
+def find_ids_with_skill(session, model, skill_id: int) -> list:
+    """
+    指定したスキルを持つ行のIDを取得
+    PostgreSQLではskill_ids（integer[]、GINインデックス）に対する包含検索を使用する
+    
+    Args:
+        session: データベースセッション
+        model: Applicant、JobPosting、Workerのいずれか
+        skill_id: スキルID
+    
+    Returns:
+        IDのリスト
+    """
+    if session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import array
+        rows = session.query(model.id).filter(
+            model.skill_ids.op('@>', is_comparison=True)(array([skill_id]))
+        ).order_by(model.id)
+        return [row_id for row_id, in rows]
+    rows = session.query(model.id, model.skill_ids).filter(model.skill_ids.isnot(None)).order_by(model.id)
+    return [row_id for row_id, skill_ids in rows if skill_id in skill_ids]
+
+
+def get_skill_normalizer(engine) -> SkillNormalizer:
+    """
+    エンジンに対応するスキル正規化辞書を取得
+    
+    Args:
+        engine: SQLAlchemyエンジン
+    
+    Returns:
+        SkillNormalizer: スキル正規化辞書
+    """
+    with _normalizers_lock:
+        normalizer = _normalizers.get(engine)
+        if normalizer is None:
+            normalizer = SkillNormalizer(engine)
+            _normalizers[engine] = normalizer
+        return normalizer
 
 
 class SkillsManager:
@@ -26,6 +353,7 @@ class SkillsManager:
         name = input("スキル名: ").strip()
         category = input("カテゴリ（プログラミング、言語、その他など）: ").strip()
         description = input("説明: ").strip()
+        aliases = input("別名（カンマ区切り、例: Python3, パイソン）: ").strip()
         
         session = self.db.get_session()
         try:
@@ -38,11 +366,13 @@ class SkillsManager:
             skill = Skill(
                 name=name,
                 category=category,
-                description=description
+                description=description,
+                aliases=aliases
             )
             session.add(skill)
             session.commit()
             print(f"スキルを登録しました（ID: {skill.id}）")
+            refresh_skill_ids(session)
         except Exception as e:
             session.rollback()
             print(f"エラーが発生しました: {e}")
@@ -71,6 +401,8 @@ class SkillsManager:
                     current_category = skill.category
                 
                 print(f"  ID: {skill.id} | {skill.name}")
+                if skill.aliases:
+                    print(f"    別名: {skill.aliases}")
                 if skill.description:
                     print(f"    説明: {skill.description}")
                 print("-" * 80)
@@ -82,14 +414,15 @@ class SkillsManager:
         print("\nスキル検索")
         print("-" * 30)
         
-        keyword = input("検索キーワード（スキル名、カテゴリ、説明）: ").strip()
+        keyword = input("検索キーワード（スキル名、カテゴリ、説明、別名）: ").strip()
         
         session = self.db.get_session()
         try:
             skills = session.query(Skill).filter(
                 (Skill.name.contains(keyword)) |
                 (Skill.category.contains(keyword)) |
-                (Skill.description.contains(keyword))
+                (Skill.description.contains(keyword)) |
+                (Skill.aliases.contains(keyword))
             ).all()
             
             if not skills:
@@ -100,6 +433,8 @@ class SkillsManager:
             print("-" * 80)
             for skill in skills:
                 print(f"ID: {skill.id} | {skill.name} | カテゴリ: {skill.category}")
+                if skill.aliases:
+                    print(f"  別名: {skill.aliases}")
                 if skill.description:
                     print(f"  説明: {skill.description}")
                 print("-" * 80)
@@ -140,8 +475,13 @@ class SkillsManager:
             if description:
                 skill.description = description
             
+            aliases = input(f"別名（現在: {skill.aliases or 'なし'}）: ").strip()
+            if aliases:
+                skill.aliases = aliases
+            
             session.commit()
             print("スキル情報を更新しました。")
+            refresh_skill_ids(session)
         
         except ValueError:
             print("無効なIDです。")
@@ -172,6 +512,7 @@ class SkillsManager:
                 session.delete(skill)
                 session.commit()
                 print("スキルを削除しました。")
+                refresh_skill_ids(session)
             else:
                 print("削除をキャンセルしました。")
         
@@ -0,0 +1,275 @@
+"""
+ライブテレメトリバッファモジュール
+訓練中にUnityからSocket.IOで送信される操作ログのバッチをセッションごとにメモリへ溜め、
+一定件数または一定時間ごとにまとめてデータベースへ書き込む
+バッファの合計行数には上限があり、上限に近づくとクライアントに送信の抑制（バックプレッシャー）を通知する
+"""
+
+import os
+import time
+import logging
+import threading
+
+
+# セッションのバッファがこの行数に達したら書き込む
+TELEMETRY_FLUSH_ROWS = int(os.getenv('TELEMETRY_FLUSH_ROWS', '1000'))
+
+# バッファの最大保持時間（秒、この時間を過ぎたら行数に関わらず書き込む）
+TELEMETRY_FLUSH_INTERVAL = float(os.getenv('TELEMETRY_FLUSH_INTERVAL', '1.0'))
+
+# 全セッション合計のバッファ行数の上限（超える場合はバッチを受け付けない）
+TELEMETRY_MAX_BUFFERED_ROWS = int(os.getenv('TELEMETRY_MAX_BUFFERED_ROWS', '50000'))
+
+# 書き込みに失敗したバッファを破棄するまでの試行回数
+TELEMETRY_MAX_ATTEMPTS = int(os.getenv('TELEMETRY_MAX_ATTEMPTS', '5'))
+
+# バックプレッシャーを開始・解除する割合（上限に対する合計行数の割合）
+TELEMETRY_HIGH_WATERMARK = float(os.getenv('TELEMETRY_HIGH_WATERMARK', '0.8'))
+TELEMETRY_LOW_WATERMARK = float(os.getenv('TELEMETRY_LOW_WATERMARK', '0.5'))
+
+# バッチの受付結果
+STATUS_ACCEPTED = 'accepted'
+STATUS_REJECTED = 'rejected'
+
+logger = logging.getLogger(__name__)
+
+
+class _SessionBuffer:
+    """セッションごとのバッファ（未書き込みのバッチ、書き込み中を含む行数、最初のバッチの受信時刻、書き込み中かどうか）"""
+
+    __slots__ = ('batches', 'rows', 'since', 'meta', 'failures', 'writing')
+
+    def __init__(self):
+        self.batches = []
+        self.rows = 0
+        self.since = None
+        self.meta = {}
+        self.failures = 0
+        self.writing = False
+
+
+class TelemetryBuffer:
+    """
+    セッションごとの操作ログバッファ
+    add() はメモリに追加するだけで、データベースへの書き込みはバックグラウンドスレッドで行う
+    """
+
+    def __init__(self, writer, flush_rows: int = None, flush_interval: float = None, max_rows: int = None):
+        """
+        初期化
+
+        Args:
+            writer: 書き込み関数 writer(session_id, meta, batches)
+                    batches は (連番, 操作ログのリスト) のリスト、meta は最初のバッチの session_start_time などの情報
+            flush_rows: セッションのバッファを書き込む行数（省略時はTELEMETRY_FLUSH_ROWS）
+            flush_interval: バッファの最大保持時間（秒、省略時はTELEMETRY_FLUSH_INTERVAL）
+            max_rows: 全セッション合計のバッファ行数の上限（省略時はTELEMETRY_MAX_BUFFERED_ROWS）
+        """
+        self.writer = writer
+        self.flush_rows = flush_rows or TELEMETRY_FLUSH_ROWS
+        self.flush_interval = flush_interval or TELEMETRY_FLUSH_INTERVAL
+        self.max_rows = max_rows or TELEMETRY_MAX_BUFFERED_ROWS
+        self._buffers = {}
+        self._dropped = {}  # セッションID → 破棄したバッチの連番の集合（再送されるまで応答で通知する）
+        self._buffered_rows = 0
+        self._backpressure = False
+        self._lock = threading.Lock()
+        self._written = threading.Condition(self._lock)  # セッションの書き込みの完了を通知
+        self._flush_requested = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _ack(self, status: str, accepted: int = 0, reason: str = None) -> dict:
+        """クライアントへの応答（呼び出し元でロックを取得していること）"""
+        ack = {
+            'status': status,
+            'accepted': accepted,
+            'buffered': self._buffered_rows,
+            'backpressure': self._backpressure,
+        }
+        if self._backpressure:
+            # 送信を再開するまでの目安（1回分の書き込み間隔）
+            ack['retry_after_ms'] = int(self.flush_interval * 1000)
+        if reason:
+            ack['reason'] = reason
+        return ack
+
+    def _update_backpressure(self):
+        """バッファの合計行数からバックプレッシャーの状態を更新（ヒステリシスあり）"""
+        if self._buffered_rows >= self.max_rows * TELEMETRY_HIGH_WATERMARK:
+            self._backpressure = True
+        elif self._buffered_rows <= self.max_rows * TELEMETRY_LOW_WATERMARK:
+            self._backpressure = False
+
+    def add(self, session_id: str, sequence: int, logs: list, meta: dict = None) -> dict:
+        """
+        バッチをバッファに追加
+
+        Args:
+            session_id: セッションID
+            sequence: バッチの連番（セッション内で一意、再送の判定に使用）
+            logs: Unity形式の操作ログのリスト
+            meta: セッションが存在しない場合の作成に使用する情報（session_start_time, worker_id など）
+
+        Returns:
+            {'status': 'accepted' または 'rejected', 'accepted': 受け付けた行数, 'buffered': バッファの合計行数,
+             'backpressure': 送信を抑制すべきかどうか, 'retry_after_ms': 再送までの目安（抑制中のみ）,
+             'dropped_sequences': 書き込みに失敗して破棄したバッチの連番（破棄した場合のみ）}
+        """
+        with self._lock:
+            if self._buffered_rows + len(logs) > self.max_rows:
+                self._backpressure = True
+                return self._ack(STATUS_REJECTED, reason='buffer_full')
+            buffer = self._buffers.get(session_id)
+            if buffer is None:
+                buffer = self._buffers[session_id] = _SessionBuffer()
+            if buffer.since is None:
+                buffer.since = time.monotonic()
+            if meta:
+                buffer.meta.update(meta)
+            buffer.batches.append((sequence, logs))
+            buffer.rows += len(logs)
+            self._buffered_rows += len(logs)
+            self._update_backpressure()
+            if buffer.rows >= self.flush_rows:
+                self._flush_requested.set()
+            ack = self._ack(STATUS_ACCEPTED, accepted=len(logs))
+            dropped = self._dropped.get(session_id)
+            if dropped is not None:
+                dropped.discard(sequence)
+                if dropped:
+                    # 破棄したバッチは同じ連番で再送すれば保存される
+                    ack['dropped_sequences'] = sorted(dropped)
+                else:
+                    del self._dropped[session_id]
+            return ack
+
+    def pop_dropped(self, session_id: str) -> list:
+        """
+        書き込みに失敗して破棄したバッチの連番を取得し、記録を削除
+
+        Returns:
+            破棄したバッチの連番のリスト（昇順、破棄していない場合は空のリスト）
+        """
+        with self._lock:
+            return sorted(self._dropped.pop(session_id, ()))
+
+    def status(self) -> dict:
+        """バッファの状態を取得（送信を抑制しているクライアントが再開を判断するために使用）"""
+        with self._lock:
+            return self._ack(STATUS_ACCEPTED)
+
+    def _take(self, session_id: str):
+        """セッションのバッファを取り出す（呼び出し元でロックを取得していること）"""
+        buffer = self._buffers.get(session_id)
+        if buffer is None or not buffer.batches:
+            return None
+        batches, meta = buffer.batches, dict(buffer.meta)
+        buffer.batches, buffer.since = [], None
+        return batches, meta, sum(len(logs) for _, logs in batches)
+
+    def flush(self, session_id: str) -> int:
+        """
+        セッションのバッファを書き込み
+        同じセッションの書き込み（バックグラウンドスレッドなど）が実行中の場合は、その完了を待ってから残りを書き込む
+        （戻った時点で、呼び出し前に受け付けたバッチはすべて書き込み済みまたは破棄済み）
+        書き込みに失敗した場合はバッファに戻して例外を送出する
+        （TELEMETRY_MAX_ATTEMPTS 回失敗した場合は破棄し、連番を pop_dropped() と add() の応答で通知する）
+
+        Returns:
+            書き込んだ行数
+        """
+        with self._lock:
+            buffer = self._buffers.get(session_id)
+            while buffer is not None and buffer.writing:
+                self._written.wait()
+                buffer = self._buffers.get(session_id)
+            taken = self._take(session_id)
+            if taken is None:
+                return 0
+            buffer.writing = True
+        batches, meta, rows = taken
+        try:
+            self.writer(session_id, meta, batches)
+        except Exception:
+            with self._lock:
+                buffer.writing = False
+                self._written.notify_all()
+                buffer.failures += 1
+                if buffer.failures < TELEMETRY_MAX_ATTEMPTS:
+                    # 次回の書き込みで再試行（受信順を保つため先頭に戻す）
+                    buffer.batches[:0] = batches
+                    buffer.since = buffer.since or time.monotonic()
+                else:
+                    logger.error(f'テレメトリを破棄しました (セッションID: {session_id}, {rows}行)')
+                    self._dropped.setdefault(session_id, set()).update(sequence for sequence, _ in batches)
+                    buffer.failures = 0
+                    self._release(session_id, rows)
+            raise
+        with self._lock:
+            buffer.writing = False
+            self._written.notify_all()
+            buffer.failures = 0
+            self._release(session_id, rows)
+        return rows
+
+    def _release(self, session_id: str, rows: int):
+        """書き込み済み（または破棄した）行をバッファの行数から除く（呼び出し元でロックを取得していること）"""
+        buffer = self._buffers[session_id]
+        buffer.rows -= rows
+        self._buffered_rows -= rows
+        if buffer.rows == 0 and not buffer.batches:
+            del self._buffers[session_id]
+        self._update_backpressure()
+
+    def flush_due(self) -> int:
+        """行数または保持時間の条件を満たしたセッションのバッファを書き込み"""
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                session_id for session_id, buffer in self._buffers.items()
+                if buffer.batches and (buffer.rows >= self.flush_rows or now - buffer.since >= self.flush_interval)
+            ]
+        written = 0
+        for session_id in due:
+            try:
+                written += self.flush(session_id)
+            except Exception as e:
+                logger.error(f'テレメトリの書き込みエラー (セッションID: {session_id}): {e}')
+        return written
+
+    def flush_all(self) -> int:
+        """すべてのセッションのバッファを書き込み"""
+        with self._lock:
+            session_ids = list(self._buffers)
+        written = 0
+        for session_id in session_ids:
+            try:
+                written += self.flush(session_id)
+            except Exception as e:
+                logger.error(f'テレメトリの書き込みエラー (セッションID: {session_id}): {e}')
+        return written
+
+    def _run(self):
+        """バックグラウンドで書き込み"""
+        while not self._stopped.is_set():
+            self._flush_requested.wait(self.flush_interval / 2)
+            self._flush_requested.clear()
+            self.flush_due()
+
+    def start(self):
+        """書き込みスレッドを開始"""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='telemetry-buffer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """書き込みスレッドを停止（残っているバッファは書き込む）"""
+        self._stopped.set()
+        self._flush_requested.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush_all()
@@ -0,0 +1,63 @@
+"""
+Pythonバックエンドのテスト用の設定
+src.api はインポート時に環境変数を読み込むため、インポート前に一時ディレクトリのSQLiteなどを設定する
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+
+import pytest
+
+_TEST_DIR = tempfile.mkdtemp(prefix='job_assistance_test_')
+
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_TEST_DIR, 'api.db')}"
+os.environ['LOG_FILE'] = ''
+os.environ['MATCHING_INCREMENTAL'] = 'false'
+os.environ['INGESTION_QUEUE_PATH'] = os.path.join(_TEST_DIR, 'ingestion_queue.db')
+os.environ['REPLAY_CACHE_DIR'] = ''
+
+# プロジェクトルートをパスに追加
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+
+def pytest_sessionfinish(session, exitstatus):
+    """一時ディレクトリを削除"""
+    shutil.rmtree(_TEST_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def api_module():
+    """APIモジュール（テスト用のSQLiteで初期化済み、終了時にバックグラウンド処理を停止）"""
+    from src import api
+    # 1つのクライアントから多数のリクエストを送信するため、レート制限は無効にする
+    api.limiter.enabled = False
+    yield api
+    if api.ingestion_workers is not None:
+        api.ingestion_workers.stop()
+    api.telemetry_buffer.stop()
+
+
+@pytest.fixture
+def client(api_module):
+    """Flaskのテストクライアント"""
+    return api_module.app.test_client()
+
+
+@pytest.fixture
+def db_session(api_module):
+    """APIと同じデータベースのセッション"""
+    session = api_module.db.get_session()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def database(tmp_path):
+    """テストごとに作成する空のデータベース"""
+    from src.database import Database
+    db = Database(f"sqlite:///{tmp_path / 'test.db'}")
+    db.init_database()
+    yield db
+    db.engine.dispose()
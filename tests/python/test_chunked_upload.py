@@ -0,0 +1,91 @@
+"""
+分割アップロード（チャンクの再送・順不同の受信）のテスト
+"""
+
+import uuid
+
+import pytest
+
+from src import ingestion
+
+
+def _chunk(sequence: int, rows: int = 5) -> dict:
+    return {'operation_logs': [{
+        'offset_ms': (sequence * rows + index) * 50,
+        'operation_type': 'lever',
+        'operation_value': sequence * rows + index,
+    } for index in range(rows)]}
+
+
+@pytest.fixture(params=['rows', 'columnar'])
+def storage(request, monkeypatch):
+    monkeypatch.setattr(ingestion, 'OPERATION_LOG_STORAGE', request.param)
+    return request.param
+
+
+@pytest.fixture
+def session_id(client, storage):
+    session_id = f'chunked-{storage}-{uuid.uuid4().hex}'
+    response = client.post('/api/unity/training-session/chunked', json={
+        'session_id': session_id,
+        'session_start_time': '2024-01-01T00:00:00Z',
+    })
+    assert response.status_code == 201
+    return session_id
+
+
+def _replay_values(client, session_id) -> list:
+    response = client.get(f'/api/replay/{session_id}')
+    assert response.status_code == 200
+    return [log_data['operation_value'] for log_data in response.json['data']['operation_logs']]
+
+
+def test_resent_chunk_is_stored_once(client, session_id):
+    url = f'/api/unity/training-session/{session_id}/chunks/0'
+    first = client.put(url, json=_chunk(0))
+    assert first.status_code == 201
+    assert first.json['data']['duplicate'] is False
+
+    resent = client.put(url, json=_chunk(0))
+    assert resent.status_code == 200
+    assert resent.json['data'] == {'sequence': 0, 'row_count': 5, 'duplicate': True}
+
+    finalized = client.post(f'/api/unity/training-session/{session_id}/finalize', json={'total_chunks': 1})
+    assert finalized.status_code == 200
+    assert finalized.json['data']['chunk_count'] == 1
+    assert finalized.json['data']['operation_log_count'] == 5
+    assert _replay_values(client, session_id) == [0, 1, 2, 3, 4]
+
+
+def test_out_of_order_chunks_replay_in_time_order(client, session_id):
+    for sequence in (2, 0, 1):
+        response = client.put(f'/api/unity/training-session/{session_id}/chunks/{sequence}', json=_chunk(sequence))
+        assert response.status_code == 201
+
+    status = client.get(f'/api/unity/training-session/{session_id}/chunks')
+    assert status.json['data']['received_chunks'] == [0, 1, 2]
+    assert _replay_values(client, session_id) == list(range(15))
+
+
+def test_finalize_reports_missing_chunks(client, session_id):
+    client.put(f'/api/unity/training-session/{session_id}/chunks/1', json=_chunk(1))
+    response = client.post(f'/api/unity/training-session/{session_id}/finalize', json={'total_chunks': 3})
+    assert response.status_code == 409
+    assert response.json['data']['missing_chunks'] == [0, 2]
+
+    # 不足分を送信すると完了できる
+    for sequence in (2, 0):
+        client.put(f'/api/unity/training-session/{session_id}/chunks/{sequence}', json=_chunk(sequence))
+    response = client.post(f'/api/unity/training-session/{session_id}/finalize', json={'total_chunks': 3})
+    assert response.status_code == 200
+    assert response.json['data']['operation_log_count'] == 15
+
+
+def test_reopening_resumes_the_session(client, session_id):
+    client.put(f'/api/unity/training-session/{session_id}/chunks/0', json=_chunk(0))
+    response = client.post('/api/unity/training-session/chunked', json={
+        'session_id': session_id,
+        'session_start_time': '2024-01-01T00:00:00Z',
+    })
+    assert response.status_code == 201
+    assert response.json['data']['received_chunks'] == [0]
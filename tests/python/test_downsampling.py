@@ -0,0 +1,69 @@
+"""
+操作ログの間引きのテスト
+"""
+
+import math
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.downsampling import downsample_records, minmax_indices, lttb_indices
+from src.operation_log_blocks import OPERATION_LOG_RECORD_FIELDS, OperationLogRecord
+
+
+START = datetime(2024, 1, 1)
+EMPTY = dict.fromkeys(OPERATION_LOG_RECORD_FIELDS)
+
+
+def _records(count: int = 1000, events: tuple = ()) -> list:
+    """値が変化する5系列（位置3軸・速度・操作値）を持つ操作ログ"""
+    return [OperationLogRecord(**{
+        **EMPTY,
+        'timestamp': START + timedelta(milliseconds=index * 50),
+        'position_x': math.sin(index / 17),
+        'position_y': math.cos(index / 29) * 3,
+        'position_z': (index % 37) / 5,
+        'velocity': abs(math.sin(index / 7)),
+        'operation_value': (index * 7919) % 101,
+        'error_event': index in events,
+        'sequence': index,
+    }) for index in range(count)]
+
+
+@pytest.mark.parametrize('algorithm', ['lttb', 'minmax'])
+@pytest.mark.parametrize('max_points', [3, 4, 7, 10, 11, 50, 137, 500])
+def test_result_does_not_exceed_max_points(algorithm, max_points):
+    records = _records()
+    result = downsample_records(records, max_points, algorithm)
+    assert len(result) <= max_points
+    assert result[0] is records[0] and result[-1] is records[-1]
+    # 系列間の重複による不足は選び直しで補う
+    if max_points >= 50:
+        assert len(result) >= max_points * 0.9
+
+
+@pytest.mark.parametrize('algorithm', ['lttb', 'minmax'])
+@pytest.mark.parametrize('max_points', [3, 10, 50])
+def test_event_rows_are_kept_in_addition(algorithm, max_points):
+    events = (13, 250, 251, 777)
+    records = _records(events=events)
+    result = downsample_records(records, max_points, algorithm)
+    assert len(result) <= max_points + len(events)
+    assert {record.sequence for record in result} >= set(events)
+    assert [record.sequence for record in result] == sorted(record.sequence for record in result)
+
+
+def test_constant_series_fall_back_to_even_spacing():
+    records = [OperationLogRecord(**{**EMPTY, 'timestamp': START + timedelta(milliseconds=index * 50),
+                                     'velocity': 1.0, 'sequence': index}) for index in range(100)]
+    result = downsample_records(records, 5)
+    assert [record.sequence for record in result] == [0, 25, 50, 74, 99]
+
+
+@pytest.mark.parametrize('select', [lttb_indices, minmax_indices])
+@pytest.mark.parametrize('threshold', [3, 4, 5, 10, 99])
+def test_indices_respect_threshold(select, threshold):
+    ys = [math.sin(index / 3) for index in range(100)]
+    indices = select(list(range(100)), ys, threshold)
+    assert len(indices) <= threshold
+    assert indices[0] == 0 and indices[-1] == 99
@@ -0,0 +1,52 @@
+"""
+訓練セッションの取り込み前の検証のテスト（同期・非同期の取り込みで同じ400を返す）
+"""
+
+import uuid
+
+import pytest
+
+
+ASYNC = {'Prefer': 'respond-async'}
+
+INVALID_TIMESTAMPS = ['2024-13-01T00:00:00Z', 'abc', '', float('inf'), 1e20, [1]]
+
+
+def _legacy(logs: list) -> dict:
+    return {'sessionId': f'legacy-{uuid.uuid4().hex}', 'operationLogs': logs}
+
+
+@pytest.mark.parametrize('headers', [{}, ASYNC], ids=['sync', 'async'])
+@pytest.mark.parametrize('timestamp', INVALID_TIMESTAMPS)
+def test_legacy_rejects_invalid_log_timestamp(client, headers, timestamp):
+    logs = [{'timestamp': '2024-01-01T00:00:00Z', 'operationType': 'lever'},
+            {'timestamp': timestamp, 'operationType': 'lever'}]
+    response = client.post('/api/training-sessions', json=_legacy(logs), headers=headers)
+    assert response.status_code == 400
+    assert 'timestamp' in response.json['error']
+
+
+@pytest.mark.parametrize('headers', [{}, ASYNC], ids=['sync', 'async'])
+def test_legacy_rejects_offset_ms(client, headers):
+    response = client.post('/api/training-sessions', json=_legacy([{'offset_ms': 50}]), headers=headers)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('headers', [{}, ASYNC], ids=['sync', 'async'])
+def test_legacy_accepts_valid_logs(client, headers):
+    logs = [{'timestamp': '2024-01-01T00:00:00Z', 'operationType': 'lever'},
+            {'timestamp': 1704067200050, 'operationType': 'lever'},
+            {'operationType': 'pedal'}]
+    response = client.post('/api/training-sessions', json=_legacy(logs), headers=headers)
+    assert response.status_code == (202 if headers else 201)
+
+
+@pytest.mark.parametrize('headers', [{}, ASYNC], ids=['sync', 'async'])
+@pytest.mark.parametrize('timestamp', INVALID_TIMESTAMPS)
+def test_unity_rejects_invalid_log_timestamp(client, headers, timestamp):
+    response = client.post('/api/unity/training-session', headers=headers, json={
+        'session_id': f'unity-{uuid.uuid4().hex}',
+        'session_start_time': '2024-01-01T00:00:00Z',
+        'operation_logs': [{'timestamp': timestamp, 'operation_type': 'lever'}],
+    })
+    assert response.status_code == 400
@@ -0,0 +1,159 @@
+"""
+マッチングスコアのテスト
+疎行列エンジン・スキル転置インデックスのスコアが、応募者 × 求人の全組み合わせを
+_calculate_match_score で計算した結果と一致することを確認する
+"""
+
+import random
+
+import pytest
+
+from src import matching
+from src.database import Applicant, JobPosting, Skill
+from src.matching import MatchingService
+from src.skill_index import SCORING_MODES
+
+
+SKILL_NAMES = ['Python', 'Java', 'Excel', '溶接', '玉掛け', 'フォークリフト', '日本語N3', '日本語N2', '介護', 'CAD']
+
+
+def _populate(database, seed: int = 7):
+    """別名を含むスキル、応募者、求人を投入"""
+    rng = random.Random(seed)
+    session = database.get_session()
+    try:
+        session.add(Skill(name='Python', aliases='Python3, パイソン'))
+        session.add(Skill(name='フォークリフト', aliases='フォークリフト運転'))
+        for name in SKILL_NAMES:
+            if name not in ('Python', 'フォークリフト'):
+                session.add(Skill(name=name))
+        # スキルマスタを先に保存（応募者・求人のスキルID配列は保存時のスキルマスタで生成される）
+        session.commit()
+        variants = SKILL_NAMES + ['python3', 'パイソン', 'フォークリフト運転', '未登録スキル']
+        for i in range(40):
+            skills = ', '.join(rng.sample(variants, rng.randint(0, 5)))
+            session.add(Applicant(name=f'応募者{i}', email=f'a{i}@example.com', skills=skills))
+        for i in range(12):
+            skills = ', '.join(rng.sample(variants, rng.randint(1, 4)))
+            session.add(JobPosting(title=f'求人{i}', company_name='テスト', required_skills=skills))
+        session.commit()
+    finally:
+        session.close()
+
+
+def _nested_loop_scores(service: MatchingService, session, scoring: str) -> dict:
+    """応募者 × 求人の全組み合わせのスコア（スコアが0の組み合わせは除く）"""
+    scores = {}
+    applicants = session.query(Applicant.id, Applicant.skills).all()
+    jobs = session.query(JobPosting.id, JobPosting.required_skills).all()
+    for applicant_id, applicant_skills in applicants:
+        for job_id, job_skills in jobs:
+            score = service._calculate_match_score(applicant_skills, job_skills, scoring)
+            if score > 0:
+                scores[(applicant_id, job_id)] = score
+    return scores
+
+
+@pytest.mark.parametrize('scoring', SCORING_MODES)
+@pytest.mark.parametrize('sparse', [True, False])
+def test_compute_matches_equals_nested_loop(database, monkeypatch, scoring, sparse):
+    _populate(database)
+    if not sparse:
+        monkeypatch.setattr(matching, 'SCIPY_AVAILABLE', False)
+    elif not matching.SCIPY_AVAILABLE:
+        pytest.skip('scipy is not installed')
+    service = MatchingService(database)
+    session = database.get_session()
+    try:
+        matches = service.compute_matches(session, workers=1, scoring=scoring)
+        expected = _nested_loop_scores(service, session, scoring)
+    finally:
+        session.close()
+
+    actual = {(match['applicant_id'], match['job_posting_id']): match['score'] for match in matches}
+    assert actual.keys() == expected.keys()
+    for key, score in expected.items():
+        assert actual[key] == pytest.approx(score)
+    # スコアの降順、同点は応募者ID・求人ID順
+    order = [(-match['score'], match['applicant_id'], match['job_posting_id']) for match in matches]
+    assert order == sorted(order)
+
+
+def test_aliases_match_the_same_skill(database):
+    session = database.get_session()
+    try:
+        session.add(Skill(name='Python', aliases='Python3, パイソン'))
+        session.commit()
+        session.add(Applicant(name='応募者', email='a@example.com', skills='パイソン, Excel'))
+        session.add(JobPosting(title='求人', company_name='テスト', required_skills='python3, 溶接'))
+        session.commit()
+        service = MatchingService(database)
+        matches = service.compute_matches(session, workers=1, scoring='overlap')
+    finally:
+        session.close()
+    assert [match['score'] for match in matches] == [pytest.approx(50.0)]
+
+
+def _baseline_score(applicant_skills: str, job_skills: str) -> float:
+    """正規化導入前のスコア計算（小文字化したスキル名の一致数 / 必要スキルの記載数）"""
+    if not applicant_skills or not job_skills:
+        return 0.0
+    applicant_skill_list = [s.strip().lower() for s in applicant_skills.split(',') if s.strip()]
+    job_skill_list = [s.strip().lower() for s in job_skills.split(',') if s.strip()]
+    if not applicant_skill_list or not job_skill_list:
+        return 0.0
+    matched_skills = set(applicant_skill_list) & set(job_skill_list)
+    return min(len(matched_skills) / len(job_skill_list) * 100, 100.0)
+
+
+@pytest.mark.parametrize('sparse', [True, False])
+def test_overlap_equals_baseline_formula_without_aliases(database, monkeypatch, sparse):
+    """別名・重複のないデータでは、正規化導入前の計算式と同じスコア"""
+    if not sparse:
+        monkeypatch.setattr(matching, 'SCIPY_AVAILABLE', False)
+    elif not matching.SCIPY_AVAILABLE:
+        pytest.skip('scipy is not installed')
+    rng = random.Random(11)
+    session = database.get_session()
+    try:
+        session.add_all(Skill(name=name) for name in SKILL_NAMES)
+        session.commit()
+        for i in range(40):
+            skills = rng.sample(SKILL_NAMES + ['未登録スキル'], rng.randint(0, 5))
+            # 大文字・小文字、前後の空白の違いのみ（同じスキルを重複して記載しない）
+            skills = [rng.choice([name, name.lower(), f' {name} ']) for name in skills]
+            session.add(Applicant(name=f'応募者{i}', email=f'a{i}@example.com', skills=', '.join(skills)))
+        for i in range(12):
+            skills = rng.sample(SKILL_NAMES + ['未登録スキル'], rng.randint(1, 4))
+            session.add(JobPosting(title=f'求人{i}', company_name='テスト', required_skills=', '.join(skills)))
+        session.commit()
+        matches = MatchingService(database).compute_matches(session, workers=1, scoring='overlap')
+        expected = {}
+        for applicant_id, applicant_skills in session.query(Applicant.id, Applicant.skills):
+            for job_id, job_skills in session.query(JobPosting.id, JobPosting.required_skills):
+                score = _baseline_score(applicant_skills, job_skills)
+                if score > 0:
+                    expected[(applicant_id, job_id)] = score
+    finally:
+        session.close()
+
+    actual = {(match['applicant_id'], match['job_posting_id']): match['score'] for match in matches}
+    assert actual.keys() == expected.keys()
+    for key, score in expected.items():
+        assert actual[key] == pytest.approx(score)
+
+
+def test_duplicate_job_skills_count_once(database):
+    """必要スキルの重複・別名は1件として数える（正規化導入前は記載数で割っていた）"""
+    session = database.get_session()
+    try:
+        session.add(Skill(name='Python', aliases='Python3'))
+        session.commit()
+        session.add(Applicant(name='応募者', email='a@example.com', skills='Python'))
+        session.add(JobPosting(title='求人', company_name='テスト', required_skills='Python, python3, Python'))
+        session.commit()
+        matches = MatchingService(database).compute_matches(session, workers=1, scoring='overlap')
+    finally:
+        session.close()
+    assert [match['score'] for match in matches] == [pytest.approx(100.0)]
+    assert _baseline_score('Python', 'Python, python3, Python') == pytest.approx(100 / 3)
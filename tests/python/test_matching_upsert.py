@@ -0,0 +1,74 @@
+"""
+マッチング結果の一括保存（_upsert_matches）のテスト
+"""
+
+import pytest
+
+from src.database import Applicant, JobPosting, Matching
+from src.matching import MatchingService
+
+
+@pytest.fixture
+def pairs(database):
+    """応募者2件 × 求人2件"""
+    session = database.get_session()
+    try:
+        applicants = [Applicant(name=f'応募者{i}', email=f'a{i}@example.com', skills='溶接') for i in range(2)]
+        jobs = [JobPosting(title=f'求人{i}', company_name='テスト', required_skills='溶接') for i in range(2)]
+        session.add_all(applicants + jobs)
+        session.commit()
+        return [(applicant.id, job.id) for applicant in applicants for job in jobs]
+    finally:
+        session.close()
+
+
+def _match(pair, score, skills='溶接'):
+    return {'applicant_id': pair[0], 'job_posting_id': pair[1], 'score': score, 'matched_skills': skills}
+
+
+def _stored(session) -> dict:
+    return {
+        (row.applicant_id, row.job_posting_id): (row.match_score, row.matched_skills)
+        for row in session.query(Matching)
+    }
+
+
+@pytest.mark.parametrize('batch_size', [1, 3, 1000])
+def test_upsert_inserts_then_updates_in_place(database, pairs, batch_size):
+    service = MatchingService(database)
+    session = database.get_session()
+    try:
+        service._upsert_matches(session, [_match(pair, 50.0) for pair in pairs[:3]], batch_size)
+        session.commit()
+        assert _stored(session) == {pair: (50.0, '溶接') for pair in pairs[:3]}
+        ids = {(row.applicant_id, row.job_posting_id): row.id for row in session.query(Matching)}
+
+        # 既存の組み合わせは更新、新しい組み合わせは追加（重複行を作らない）
+        progress = []
+        service._upsert_matches(session, [_match(pair, 75.0, '溶接, 玉掛け') for pair in pairs[1:]], batch_size,
+                                progress=lambda saved, total: progress.append((saved, total)))
+        session.commit()
+        session.expire_all()
+        stored = _stored(session)
+        assert stored[pairs[0]] == (50.0, '溶接')
+        assert all(stored[pair] == (75.0, '溶接, 玉掛け') for pair in pairs[1:])
+        assert session.query(Matching).count() == len(pairs)
+        assert all(row.id == ids[(row.applicant_id, row.job_posting_id)]
+                   for row in session.query(Matching) if (row.applicant_id, row.job_posting_id) in ids)
+        assert progress[-1] == (len(pairs) - 1, len(pairs) - 1)
+    finally:
+        session.close()
+
+
+def test_save_matches_commits(database, pairs):
+    service = MatchingService(database)
+    session = database.get_session()
+    try:
+        assert service._save_matches(session, [_match(pair, 40.0) for pair in pairs]) is True
+    finally:
+        session.close()
+    session = database.get_session()
+    try:
+        assert len(_stored(session)) == len(pairs)
+    finally:
+        session.close()
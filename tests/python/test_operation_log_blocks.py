@@ -0,0 +1,84 @@
+"""
+操作ログの列指向ブロック形式のテスト
+"""
+
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.database import TrainingSession
+from src.ingestion import build_operation_log_rows, insert_operation_log_blocks
+from src.operation_log_blocks import (
+    OPERATION_LOG_RECORD_FIELDS, OperationLogRecord, encode_block, decode_block, load_operation_logs,
+    count_operation_logs,
+)
+
+
+START = datetime(2024, 1, 1)
+
+
+def _records() -> list:
+    records = []
+    for index in range(50):
+        records.append(OperationLogRecord(
+            timestamp=START + timedelta(microseconds=index * 50001),
+            operation_type=('lever', 'pedal', None)[index % 3],
+            operation_value=None if index % 7 == 0 else index * 0.25,
+            equipment_state='{"arm": %d}' % index if index % 2 else None,
+            position_x=index * 1.5,
+            position_y=None,
+            position_z=-index / 3,
+            velocity=float(index % 5),
+            error_event=index % 11 == 0,
+            error_description='接触' if index % 11 == 0 else None,
+            achievement_event=index == 49,
+            achievement_description='完了' if index == 49 else None,
+            event_type='error' if index % 11 == 0 else 'operation',
+            sequence=None if index == 3 else index,
+        ))
+    return records
+
+
+def test_block_round_trip():
+    records = _records()
+    columns = dict(zip(OPERATION_LOG_RECORD_FIELDS, zip(*records)))
+    assert decode_block(encode_block(columns)) == records
+
+
+def test_empty_block_round_trip():
+    columns = {name: () for name in OPERATION_LOG_RECORD_FIELDS}
+    assert decode_block(encode_block(columns)) == []
+
+
+@pytest.fixture
+def training_session_id(db_session):
+    session_obj = TrainingSession(session_id=f'blocks-{uuid.uuid4().hex}', session_start_time=START,
+                                  session_end_time=START)
+    db_session.add(session_obj)
+    db_session.commit()
+    return session_obj.id
+
+
+def test_load_from_blocks(db_session, training_session_id):
+    # 偶数番目・奇数番目の行を別々に追加し、時間範囲が重なるブロックを作る
+    logs = [{'offset_ms': index * 25, 'operation_value': index, 'sequence': index} for index in range(100)]
+    rows = build_operation_log_rows(training_session_id, logs, session_start=START)
+    insert_operation_log_blocks(db_session, training_session_id, rows[0::2], block_rows=16)
+    insert_operation_log_blocks(db_session, training_session_id, rows[1::2], block_rows=16)
+    db_session.commit()
+
+    assert count_operation_logs(db_session, training_session_id) == 100
+    full = load_operation_logs(db_session, training_session_id)
+    assert [record.operation_value for record in full] == list(range(100))
+
+    # 件数を指定した場合も先頭から同じ順序
+    for limit in (1, 15, 16, 17, 32, 33, 50, 99, 100, 150):
+        limited = load_operation_logs(db_session, training_session_id, limit=limit)
+        assert limited == full[:limit]
+
+    # 時間範囲（開始を含み、終了を含まない）
+    windowed = load_operation_logs(db_session, training_session_id, START + timedelta(seconds=1),
+                                   START + timedelta(seconds=2))
+    assert [record.operation_value for record in windowed] == list(range(40, 80))
+    assert load_operation_logs(db_session, training_session_id, START + timedelta(seconds=1), limit=5) == windowed[:5]
@@ -0,0 +1,128 @@
+"""
+操作ログの差分更新（sync_operation_logs）のテスト
+"""
+
+import uuid
+from datetime import datetime
+
+import pytest
+
+from src.database import OperationLog, TrainingSession
+from src.ingestion import build_operation_log_rows, sync_operation_logs
+
+
+START = datetime(2024, 1, 1)
+
+
+def _logs(count: int, value_offset: float = 0.0) -> list:
+    return [{
+        'offset_ms': index * 50,
+        'operation_type': 'lever',
+        'operation_value': index + value_offset,
+        'sequence': index,
+    } for index in range(count)]
+
+
+@pytest.fixture
+def training_session_id(db_session):
+    session_obj = TrainingSession(session_id=f'sync-{uuid.uuid4().hex}', session_start_time=START,
+                                  session_end_time=START)
+    db_session.add(session_obj)
+    db_session.commit()
+    return session_obj.id
+
+
+def _sync(db_session, training_session_id, logs, prune=True):
+    rows = build_operation_log_rows(training_session_id, logs, session_start=START)
+    result = sync_operation_logs(db_session, training_session_id, rows, prune=prune)
+    db_session.commit()
+    return result
+
+
+def _values(db_session, training_session_id) -> dict:
+    return dict(db_session.query(OperationLog.sequence, OperationLog.operation_value).filter(
+        OperationLog.training_session_id == training_session_id
+    ))
+
+
+def test_sync_counts_inserts_updates_deletes(db_session, training_session_id):
+    logs = _logs(10)
+    assert _sync(db_session, training_session_id, logs) == {'inserted': 10, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+
+    # 同じ内容の再送は何も書き込まない
+    assert _sync(db_session, training_session_id, logs) == {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 10}
+
+    # 2行を変更、末尾の3行を削除、2行を追加
+    changed = [dict(log_data) for log_data in logs[:7]]
+    changed[1]['operation_value'] = 100.0
+    changed[4]['operation_value'] = 400.0
+    changed += [dict(logs[0], sequence=20, offset_ms=1000), dict(logs[0], sequence=21, offset_ms=1050)]
+    assert _sync(db_session, training_session_id, changed) == {'inserted': 2, 'updated': 2, 'deleted': 3, 'unchanged': 5}
+
+    values = _values(db_session, training_session_id)
+    assert sorted(values) == [0, 1, 2, 3, 4, 5, 6, 20, 21]
+    assert values[1] == 100.0 and values[4] == 400.0
+
+
+def test_sync_partial_does_not_delete(db_session, training_session_id):
+    _sync(db_session, training_session_id, _logs(5))
+    appended = [dict(log_data, sequence=log_data['sequence'] + 5) for log_data in _logs(3)]
+    assert _sync(db_session, training_session_id, appended, prune=False) == {
+        'inserted': 3, 'updated': 0, 'deleted': 0, 'unchanged': 0
+    }
+    assert sorted(_values(db_session, training_session_id)) == list(range(8))
+
+
+def test_sync_replaces_unsequenced_rows(db_session, training_session_id):
+    # 連番のない行（分割アップロードのチャンク）が存在する場合は置き換え
+    rows = build_operation_log_rows(training_session_id, _logs(4), implicit_sequence=False, session_start=START)
+    rows = [row[:-3] + (None,) + row[-2:] for row in rows]
+    sync_operation_logs(db_session, training_session_id, rows)
+    db_session.commit()
+    assert _sync(db_session, training_session_id, _logs(3)) == {'inserted': 3, 'updated': 0, 'deleted': 4, 'unchanged': 0}
+    assert sorted(_values(db_session, training_session_id)) == [0, 1, 2]
+
+
+def test_resend_through_api_reports_counts(client):
+    session_id = f'sync-api-{uuid.uuid4().hex}'
+    body = {
+        'session_id': session_id,
+        'session_start_time': '2024-01-01T00:00:00Z',
+        'session_end_time': '2024-01-01T00:01:00Z',
+        'operation_logs': _logs(6),
+    }
+    assert client.post('/api/unity/training-session', json=body).status_code == 201
+    body['operation_logs'] = _logs(6, value_offset=0.5)[:4]
+    response = client.post('/api/unity/training-session', json=body)
+    assert response.status_code == 201
+    assert response.json['data']['operation_logs'] == {'inserted': 0, 'updated': 4, 'deleted': 2, 'unchanged': 0}
+
+
+def test_duplicate_sequences_are_rejected(client):
+    logs = _logs(3)
+    logs[2]['sequence'] = 1
+    response = client.post('/api/unity/training-session', json={
+        'session_id': f'sync-dup-{uuid.uuid4().hex}',
+        'session_start_time': '2024-01-01T00:00:00Z',
+        'session_end_time': '2024-01-01T00:01:00Z',
+        'operation_logs': logs,
+    })
+    assert response.status_code == 400
+    assert 'duplicated' in response.json['error']
+
+
+@pytest.mark.parametrize('missing', [0, 2])
+def test_mixed_sequences_are_rejected(client, missing):
+    logs = _logs(3)
+    del logs[missing]['sequence']
+    if missing == 0:
+        # 連番のない行の位置（0）と指定した連番が衝突すると、差分更新でどちらかの行が失われる
+        logs[1]['sequence'] = 0
+    response = client.post('/api/unity/training-session', json={
+        'session_id': f'sync-mixed-{uuid.uuid4().hex}',
+        'session_start_time': '2024-01-01T00:00:00Z',
+        'session_end_time': '2024-01-01T00:01:00Z',
+        'operation_logs': logs,
+    })
+    assert response.status_code == 400
+    assert 'every log or on none' in response.json['error']
@@ -0,0 +1,99 @@
+"""
+リプレイのレスポンスキャッシュ（ETag・304）のテスト
+"""
+
+import uuid
+
+import pytest
+
+from src.replay_cache import ReplayCache
+
+
+def _body(session_id: str, logs: list, safety_score: float = 90) -> dict:
+    return {
+        'session_id': session_id,
+        'session_start_time': '2024-01-01T00:00:00Z',
+        'session_end_time': '2024-01-01T00:01:00Z',
+        'operation_logs': logs,
+        'kpi_scores': {'safety_score': safety_score},
+    }
+
+
+def _logs(count: int) -> list:
+    return [{'offset_ms': index * 50, 'operation_type': 'lever', 'operation_value': index, 'sequence': index}
+            for index in range(count)]
+
+
+@pytest.fixture
+def session_id(client):
+    session_id = f'cache-{uuid.uuid4().hex}'
+    assert client.post('/api/unity/training-session', json=_body(session_id, _logs(20))).status_code == 201
+    return session_id
+
+
+def test_etag_and_not_modified(client, session_id):
+    first = client.get(f'/api/replay/{session_id}')
+    assert first.status_code == 200
+    assert first.headers['X-Replay-Cache'] == 'miss'
+    etag = first.headers['ETag']
+
+    second = client.get(f'/api/replay/{session_id}')
+    assert second.headers['X-Replay-Cache'] == 'memory'
+    assert second.headers['ETag'] == etag
+    assert second.data == first.data
+
+    not_modified = client.get(f'/api/replay/{session_id}', headers={'If-None-Match': etag})
+    assert not_modified.status_code == 304
+    assert not_modified.data == b''
+
+    # 表現（クエリパラメータ）ごとに異なるETag
+    assert client.get(f'/api/replay/{session_id}?max_points=5').headers['ETag'] != etag
+
+
+def test_unchanged_resend_keeps_etag(client, session_id):
+    etag = client.get(f'/api/replay/{session_id}').headers['ETag']
+    assert client.post('/api/unity/training-session', json=_body(session_id, _logs(20))).status_code == 201
+    response = client.get(f'/api/replay/{session_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+@pytest.mark.parametrize('change', ['logs', 'kpi', 'chunk'])
+def test_content_change_invalidates_etag(client, session_id, change):
+    first = client.get(f'/api/replay/{session_id}')
+    etag = first.headers['ETag']
+
+    if change == 'logs':
+        logs = _logs(20)
+        logs[3]['operation_value'] = 300
+        client.post('/api/unity/training-session', json=_body(session_id, logs))
+    elif change == 'kpi':
+        client.post('/api/unity/training-session', json=_body(session_id, _logs(20), safety_score=50))
+    else:
+        client.put(f'/api/unity/training-session/{session_id}/chunks/0',
+                   json={'operation_logs': [{'offset_ms': 5000, 'operation_type': 'lever', 'operation_value': 99}]})
+
+    response = client.get(f'/api/replay/{session_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.headers['X-Replay-Cache'] == 'miss'
+    data = response.json['data']
+    if change == 'logs':
+        assert data['operation_logs'][3]['operation_value'] == 300
+    elif change == 'kpi':
+        assert data['kpi_scores']['safety_score'] == 50
+    else:
+        assert len(data['operation_logs']) == 21
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ReplayCache(max_bytes=10, directory=str(tmp_path), disk_max_bytes=10 ** 6)
+    cache.put(('a', 1, 0, 'json'), b'12345')
+    cache.put(('b', 2, 0, 'json'), b'12345')
+    assert cache.get(('a', 1, 0, 'json')) == (b'12345', 'memory')
+    cache.put(('c', 3, 0, 'json'), b'12345')
+    assert cache.stats()['entries'] == 2
+    # メモリから追い出されたエントリはディスクから読み込む
+    assert cache.get(('b', 2, 0, 'json')) == (b'12345', 'disk')
+
+    cache.invalidate('a')
+    assert cache.get(('a', 1, 0, 'json')) is None
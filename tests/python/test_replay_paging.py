@@ -0,0 +1,91 @@
+"""
+リプレイAPIのカーソルによるページングとキーフレームのテスト
+"""
+
+import uuid
+from datetime import datetime
+
+import pytest
+
+from src import ingestion
+from src.database import OperationLogKeyframe, TrainingSession
+from src.operation_log_blocks import _scan_keyframe_buckets, operation_log_keyframes
+
+
+@pytest.fixture(params=['rows', 'columnar'])
+def session_id(request, client, monkeypatch):
+    """タイムスタンプが2行ずつ重複する操作ログ（600行、30秒）の訓練セッション"""
+    monkeypatch.setattr(ingestion, 'OPERATION_LOG_STORAGE', request.param)
+    monkeypatch.setattr(ingestion, 'OPERATION_LOG_BLOCK_ROWS', 64)
+    session_id = f'paging-{request.param}-{uuid.uuid4().hex}'
+    logs = [{
+        'offset_ms': (index // 2) * 100,
+        'operation_type': 'lever',
+        'operation_value': index,
+        'sequence': index,
+        'error_event': index % 97 == 0,
+    } for index in range(600)]
+    response = client.post('/api/unity/training-session', json={
+        'session_id': session_id,
+        'session_start_time': '2024-01-01T00:00:00Z',
+        'session_end_time': '2024-01-01T00:00:30Z',
+        'operation_logs': logs,
+        'kpi_scores': {'safety_score': 90},
+    })
+    assert response.status_code == 201
+    return session_id
+
+
+def _values(data: dict) -> list:
+    return [log_data['operation_value'] for log_data in data['operation_logs']]
+
+
+@pytest.mark.parametrize('limit', [1, 7, 64, 101, 599, 600])
+def test_cursor_paging_has_no_gaps_or_duplicates(client, session_id, limit):
+    full = _values(client.get(f'/api/replay/{session_id}').json['data'])
+    assert full == list(range(600))
+
+    paged = []
+    cursor = None
+    for _ in range(700):
+        query = f'?limit={limit}' + (f'&cursor={cursor}' if cursor else '')
+        data = client.get(f'/api/replay/{session_id}{query}').json['data']
+        assert len(data['operation_logs']) <= limit
+        assert len(data['kpi_timeline']) == len(data['operation_logs'])
+        paged += _values(data)
+        if not data['window']['has_more']:
+            break
+        cursor = data['window']['next_cursor']
+    assert paged == full
+
+
+def test_time_window(client, session_id):
+    data = client.get(f'/api/replay/{session_id}?from=10&to=20').json['data']
+    assert _values(data) == list(range(200, 400))
+    data = client.get(f'/api/replay/{session_id}?from=2024-01-01T00:00:10Z&to=2024-01-01T00:00:20Z').json['data']
+    assert _values(data) == list(range(200, 400))
+
+
+@pytest.mark.parametrize('query', ['cursor=zzz', 'from=abc', 'limit=0', 'keyframe_interval=-1', 'from=inf'])
+def test_invalid_parameters(client, session_id, query):
+    assert client.get(f'/api/replay/{session_id}?{query}').status_code == 400
+
+
+def test_keyframe_cursor_seeks_to_bucket(client, session_id):
+    data = client.get(f'/api/replay/{session_id}?keyframes=true&keyframe_interval=10&limit=1').json['data']
+    keyframes = data['keyframes']
+    assert [keyframe['offset_seconds'] for keyframe in keyframes] == [0.0, 10.0, 20.0]
+    page = client.get(f"/api/replay/{session_id}?cursor={keyframes[1]['cursor']}&limit=3").json['data']
+    assert _values(page) == [200, 201, 202]
+
+
+@pytest.mark.parametrize('interval', [10, 20, 30, 7.5, 2.5])
+def test_stored_keyframes_match_a_scan(client, db_session, session_id, interval):
+    session_obj = db_session.query(TrainingSession).filter(TrainingSession.session_id == session_id).one()
+    assert db_session.query(OperationLogKeyframe).filter(
+        OperationLogKeyframe.training_session_id == session_obj.id
+    ).count() == 3
+    origin = datetime(2024, 1, 1)
+    firsts = _scan_keyframe_buckets(db_session, session_obj.id, origin, interval)
+    expected = [(bucket * interval, firsts[bucket]) for bucket in sorted(firsts)]
+    assert operation_log_keyframes(db_session, session_obj.id, origin, interval) == expected
@@ -0,0 +1,119 @@
+"""
+ライブテレメトリバッファのテスト
+"""
+
+import threading
+
+import pytest
+
+from src import telemetry_buffer as telemetry_module
+from src.telemetry_buffer import TelemetryBuffer
+
+
+def _logs(count: int) -> list:
+    return [{'offset_ms': index * 50, 'operation_value': index} for index in range(count)]
+
+
+def test_flush_waits_for_in_flight_write():
+    started = threading.Event()
+    release = threading.Event()
+    written = []
+
+    def writer(session_id, meta, batches):
+        started.set()
+        release.wait(5)
+        written.append([sequence for sequence, _ in batches])
+
+    buffer = TelemetryBuffer(writer, flush_rows=10 ** 6, flush_interval=60)
+    buffer.add('s1', 0, _logs(3))
+    # バックグラウンドの書き込みの代わりに別スレッドで書き込み、書き込み中で止める
+    background = threading.Thread(target=buffer.flush, args=('s1',))
+    background.start()
+    assert started.wait(5)
+
+    results = []
+    waiting = threading.Thread(target=lambda: results.append(buffer.flush('s1')))
+    waiting.start()
+    waiting.join(0.2)
+    # 書き込み中のバッチがあるため、バッファが空でも戻らない
+    assert waiting.is_alive()
+    assert results == []
+
+    release.set()
+    background.join(5)
+    waiting.join(5)
+    assert not waiting.is_alive()
+    assert results == [0]
+    assert written == [[0]]
+    assert buffer.status()['buffered'] == 0
+
+
+def test_flush_writes_batches_added_during_in_flight_write():
+    started = threading.Event()
+    release = threading.Event()
+    written = []
+
+    def writer(session_id, meta, batches):
+        if not written:
+            started.set()
+            release.wait(5)
+        written.append([sequence for sequence, _ in batches])
+
+    buffer = TelemetryBuffer(writer, flush_rows=10 ** 6, flush_interval=60)
+    buffer.add('s1', 0, _logs(3))
+    background = threading.Thread(target=buffer.flush, args=('s1',))
+    background.start()
+    assert started.wait(5)
+    buffer.add('s1', 1, _logs(2))
+
+    results = []
+    waiting = threading.Thread(target=lambda: results.append(buffer.flush('s1')))
+    waiting.start()
+    release.set()
+    background.join(5)
+    waiting.join(5)
+    # 実行中の書き込みの完了後に、残りのバッチを受信順に書き込む
+    assert written == [[0], [1]]
+    assert results == [2]
+
+
+def test_flush_raises_after_in_flight_write_fails(monkeypatch):
+    monkeypatch.setattr(telemetry_module, 'TELEMETRY_MAX_ATTEMPTS', 5)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def writer(session_id, meta, batches):
+        calls.append([sequence for sequence, _ in batches])
+        if len(calls) == 1:
+            started.set()
+            release.wait(5)
+        raise RuntimeError('database is locked')
+
+    buffer = TelemetryBuffer(writer, flush_rows=10 ** 6, flush_interval=60)
+    buffer.add('s1', 0, _logs(3))
+
+    def background_flush():
+        with pytest.raises(RuntimeError):
+            buffer.flush('s1')
+
+    background = threading.Thread(target=background_flush)
+    background.start()
+    assert started.wait(5)
+
+    errors = []
+
+    def waiting_flush():
+        try:
+            buffer.flush('s1')
+        except RuntimeError as e:
+            errors.append(e)
+
+    waiting = threading.Thread(target=waiting_flush)
+    waiting.start()
+    release.set()
+    background.join(5)
+    waiting.join(5)
+    # バッファに戻されたバッチを再試行し、失敗を呼び出し元に伝える
+    assert calls == [[0], [0]]
+    assert len(errors) == 1